@@ -0,0 +1,5 @@
+"""
+Бенчмарки сервиса. Запускаются как модули, например:
+
+    python -m benchmarks.strategies
+"""
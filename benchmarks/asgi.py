@@ -0,0 +1,265 @@
+"""
+Сравнение синхронного (WSGI, gunicorn gthread) и асинхронного (ASGI,
+gunicorn с обработчиками uvicorn) режимов сервиса при большом количестве
+одновременных соединений. Часть соединений - медленные клиенты, которые
+передают тело запроса по частям с паузами, как мобильные клиенты на
+плохой сети. Еще --waiting соединений - курьеры, которые ждут заказов
+долгим опросом GET /couriers/<id>/orders/wait (заказов в их районе нет,
+каждый запрос длится --wait-timeout секунд). Остальные соединения
+в цикле вызывают GET /couriers/<id> и POST /orders/assign; для них
+измеряются задержки и пропускная способность. Оба режима запускаются
+с одинаковыми --workers и --threads на отдельных базах данных.
+
+    python -m benchmarks.asgi [--connections 500] [--slow 0.2] [--waiting 50]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+from time import perf_counter, sleep
+
+from benchmarks.load import Generator, HttpClient, batches, summarize
+
+
+MODES = (("wsgi", "--production"), ("asgi", "--asgi"))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(flag, port, database, workers, threads):
+    """Запускает сервис в отдельном процессе и ждет, пока он начнет
+    принимать соединения."""
+    env = dict(os.environ, MANAGER_PORT=str(port), MANAGER_DATABASE_PATH=database,
+               MANAGER_WORKERS=str(workers), MANAGER_THREADS=str(threads))
+    process = subprocess.Popen([sys.executable, '-m', 'manager.api', flag], env=env)
+    for _ in range(300):
+        if process.poll() is not None:
+            raise RuntimeError("Server exited with code %d" % process.returncode)
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            return process
+        except OSError:
+            sleep(0.1)
+    process.terminate()
+    raise RuntimeError("Server did not start on port %d" % port)
+
+
+def prepare(url, generator, couriers, orders, waiting):
+    """Добавляет курьеров и свободные заказы, а также waiting курьеров
+    (ID после couriers) в районе без заказов."""
+    client = HttpClient(url)
+    for ids in batches(range(1, couriers + 1), 1000):
+        client.request('POST', '/couriers',
+                       data={"data": [generator.courier(i) for i in ids]})
+    for ids in batches(range(couriers + 1, couriers + waiting + 1), 1000):
+        client.request('POST', '/couriers', data={"data": [
+            dict(generator.courier(i), regions=[generator.regions + 1]) for i in ids]})
+    for ids in batches(range(1, orders + 1), 1000):
+        client.request('POST', '/orders',
+                       data={"data": [generator.order(i) for i in ids]})
+    client.close()
+
+
+def encode(method, path, body=b''):
+    head = '%s %s HTTP/1.1\r\nHost: localhost\r\n' % (method, path)
+    if body:
+        head += 'Content-Type: application/json\r\nContent-Length: %d\r\n' % len(body)
+    return (head + '\r\n').encode(), body
+
+
+async def read_response(reader):
+    """Читает ответ с Content-Length или Transfer-Encoding: chunked
+    и возвращает его код и то, оставил ли сервер соединение открытым."""
+    version, status = (await reader.readline()).split()[:2]
+    length, chunked, keep_alive = 0, False, version == b'HTTP/1.1'
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.partition(b':')
+        name, value = name.strip().lower(), value.strip().lower()
+        if name == b'content-length':
+            length = int(value)
+        elif name == b'transfer-encoding':
+            chunked = value == b'chunked'
+        elif name == b'connection':
+            keep_alive = value == b'keep-alive'
+    if not chunked:
+        await reader.readexactly(length)
+        return int(status), keep_alive
+    while True:
+        size = int((await reader.readline()).split(b';')[0], 16)
+        await reader.readexactly(size + 2)
+        if size == 0:
+            return int(status), keep_alive
+
+
+class Connection:
+    """Постоянное соединение, открываемое заново, если сервер его закрыл."""
+
+    def __init__(self, port):
+        self.port = port
+        self.reader = self.writer = None
+
+    async def request(self, data, body_parts=(), delay=0):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection('127.0.0.1', self.port)
+        self.writer.write(data)
+        for part in body_parts:
+            self.writer.write(part)
+            await self.writer.drain()
+            await asyncio.sleep(delay)
+        status, keep_alive = await read_response(self.reader)
+        if not keep_alive:
+            self.close()
+        return status
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+
+async def fast_client(port, couriers, deadline, rng, samples, counters):
+    """Вызывает обработчики в цикле через постоянное соединение."""
+    connection = Connection(port)
+    try:
+        while perf_counter() < deadline:
+            courier_id = rng.randint(1, couriers)
+            if rng.random() < 0.5:
+                head, body = encode('GET', '/couriers/%d' % courier_id)
+            else:
+                head, body = encode('POST', '/orders/assign',
+                                    json.dumps({"courier_id": courier_id}).encode())
+            start = perf_counter()
+            status = await connection.request(head + body)
+            samples.append(perf_counter() - start)
+            counters["errors"] += status >= 500
+    except ConnectionRefusedError:
+        counters["refused"] += 1
+    except (OSError, asyncio.IncompleteReadError, IndexError, ValueError):
+        counters["dropped"] += 1
+    finally:
+        connection.close()
+
+
+async def slow_client(port, couriers, deadline, rng, delay, counters):
+    """Передает тело запроса по одному байту с паузами delay секунд."""
+    connection = Connection(port)
+    try:
+        while perf_counter() < deadline:
+            head, body = encode('POST', '/orders/assign',
+                                json.dumps({"courier_id": rng.randint(1, couriers)}).encode())
+            await connection.request(head, [body[i:i + 1] for i in range(len(body))],
+                                     delay)
+            counters["slow"] += 1
+    except ConnectionRefusedError:
+        counters["refused"] += 1
+    except (OSError, asyncio.IncompleteReadError, IndexError, ValueError):
+        counters["dropped"] += 1
+    finally:
+        connection.close()
+
+
+async def waiting_client(port, courier_id, deadline, timeout, counters):
+    """Ждет заказов долгим опросом, пока не пройдет время нагрузки."""
+    connection = Connection(port)
+    head, body = encode('GET', '/couriers/%d/orders/wait?timeout=%d'
+                        % (courier_id, timeout))
+    try:
+        while perf_counter() < deadline:
+            status = await connection.request(head + body)
+            counters["waits"] += status == 200
+            counters["errors"] += status >= 500
+    except ConnectionRefusedError:
+        counters["refused"] += 1
+    except (OSError, asyncio.IncompleteReadError, IndexError, ValueError):
+        counters["dropped"] += 1
+    finally:
+        connection.close()
+
+
+async def load(port, args):
+    rng = random.Random(args.seed)
+    deadline = perf_counter() + args.duration
+    slow = int(args.connections * args.slow)
+    samples = []
+    counters = {"errors": 0, "refused": 0, "dropped": 0, "slow": 0, "waits": 0}
+    clients = [slow_client(port, args.couriers, deadline, random.Random(rng.random()),
+                           args.slow_delay, counters) for _ in range(slow)]
+    clients += [fast_client(port, args.couriers, deadline, random.Random(rng.random()),
+                            samples, counters)
+                for _ in range(args.connections - slow)]
+    clients += [waiting_client(port, args.couriers + i, deadline, args.wait_timeout,
+                               counters)
+                for i in range(1, args.waiting + 1)]
+    start = perf_counter()
+    await asyncio.gather(*clients)
+    elapsed = perf_counter() - start
+    result = summarize(samples, counters["errors"]) if samples else {"requests": 0}
+    # Пропускная способность сервиса, а не одного соединения
+    result["throughput"] = round(len(samples) / elapsed, 1)
+    result.update(refused=counters["refused"], dropped=counters["dropped"],
+                  slow_requests=counters["slow"], waits=counters["waits"])
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--connections', type=int, default=500)
+    parser.add_argument('--slow', type=float, default=0.2,
+                        help="доля медленных соединений")
+    parser.add_argument('--slow-delay', type=float, default=0.05,
+                        help="пауза между байтами тела медленного запроса, с")
+    parser.add_argument('--waiting', type=int, default=50,
+                        help="соединения с долгим опросом GET /couriers/<id>/orders/wait")
+    parser.add_argument('--wait-timeout', type=int, default=5,
+                        help="timeout долгого опроса, с")
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--couriers', type=int, default=1000)
+    parser.add_argument('--orders', type=int, default=20000)
+    parser.add_argument('--regions', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="файл JSON для результатов")
+    args = parser.parse_args()
+
+    results = {}
+    for mode, flag in MODES:
+        directory = tempfile.mkdtemp()
+        port = free_port()
+        server = start_server(flag, port, os.path.join(directory, 'db.sqlite'),
+                              args.workers, args.threads)
+        try:
+            prepare('http://127.0.0.1:%d' % port, Generator(args.seed, args.regions),
+                    args.couriers, args.orders, args.waiting)
+            results[mode] = asyncio.run(load(port, args))
+        finally:
+            server.terminate()
+            server.wait()
+
+    print('%-6s %9s %9s %9s %9s %9s %7s %8s %8s %8s' % (
+        'mode', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'slow req', 'waits',
+        'errors', 'refused', 'dropped'))
+    for mode, r in results.items():
+        print('%-6s %9s %9s %9s %9s %9s %7s %8s %8s %8s' % (
+            mode, r["throughput"], r.get("p50_ms"), r.get("p95_ms"), r.get("p99_ms"),
+            r["slow_requests"], r["waits"], r.get("errors", 0), r["refused"],
+            r["dropped"]))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
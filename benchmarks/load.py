@@ -0,0 +1,355 @@
+"""
+Нагрузочное тестирование сервиса на синтетических курьерах и заказах:
+пропускная способность и задержки (p50/p95/p99) каждого обработчика.
+Запросы выполняются в процессе через тестовый клиент Flask или по HTTP
+к запущенному сервису (--url, база данных сервиса должна быть пустой).
+
+    python -m benchmarks.load endpoints [--couriers 1000] [--orders 10000]
+    python -m benchmarks.load growth [--sizes 1000 10000 100000 1000000]
+    python -m benchmarks.load compare old.json new.json
+
+endpoints вызывает все обработчики, growth измеряет задержку
+POST /orders/assign при росте количества свободных заказов. Результаты
+сохраняются в JSON (--output) вместе с хэшем коммита; compare сравнивает
+два таких файла.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import tempfile
+from datetime import datetime, timedelta
+from statistics import quantiles
+from time import perf_counter
+from urllib.parse import urlsplit
+
+from manager.api.app import create_app
+from manager.api.schema import DATETIME_FORMAT
+
+
+COURIER_TYPES = ("foot", "bike", "car")
+
+# Распределения веса заказов
+WEIGHTS = {
+    "uniform": lambda rng: rng.uniform(0.01, 50),
+    "light": lambda rng: min(rng.expovariate(1 / 3), 50),
+    "heavy": lambda rng: max(50 - rng.expovariate(1 / 5), 0.01),
+}
+
+
+class Generator:
+    """Синтетические курьеры и заказы. interval_density - наибольшее
+    количество интервалов работы или доставки у одного курьера или заказа."""
+
+    def __init__(self, seed=0, regions=10, interval_density=2, weights="uniform"):
+        self.rng = random.Random(seed)
+        self.regions = regions
+        self.interval_density = interval_density
+        self.weight = WEIGHTS[weights]
+
+    def intervals(self, min_length, max_length):
+        result = []
+        for _ in range(self.rng.randint(1, self.interval_density)):
+            length = self.rng.randint(min_length, max_length)
+            start = self.rng.randint(0, 24 * 60 - 1 - length)
+            result.append('%02d:%02d-%02d:%02d' % (divmod(start, 60)
+                                                   + divmod(start + length, 60)))
+        return result
+
+    def courier(self, courier_id):
+        return {"courier_id": courier_id,
+                "courier_type": self.rng.choice(COURIER_TYPES),
+                "regions": self.rng.sample(range(1, self.regions + 1),
+                                           self.rng.randint(1, min(3, self.regions))),
+                "working_hours": self.intervals(4 * 60, 10 * 60)}
+
+    def order(self, order_id):
+        return {"order_id": order_id,
+                "weight": round(max(self.weight(self.rng), 0.01), 2),
+                "region": self.rng.randint(1, self.regions),
+                "delivery_hours": self.intervals(30, 4 * 60)}
+
+
+class InProcessClient:
+    """Запросы через тестовый клиент Flask к приложению
+    с новой базой данных во временном файле."""
+    name = "in-process"
+
+    def __init__(self, config=None):
+        fd, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        os.remove(self.path)
+        self.client = create_app(self.path, config=config).test_client()
+
+    def request(self, method, url, data=None, body=None):
+        response = self.client.open(url, method=method, json=data, data=body)
+        return response.status_code, response.get_data()
+
+    def close(self):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+
+class HttpClient:
+    """Запросы по HTTP через одно постоянное соединение."""
+
+    def __init__(self, url):
+        self.name = url
+        parts = urlsplit(url)
+        self.connection = http.client.HTTPConnection(parts.hostname, parts.port or 80)
+
+    def request(self, method, url, data=None, body=None):
+        if data is not None:
+            body = json.dumps(data).encode()
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        try:
+            self.connection.request(method, url, body=body, headers=headers)
+            response = self.connection.getresponse()
+        except (http.client.HTTPException, ConnectionError):
+            # Сервер закрыл соединение: повтор в новом
+            self.connection.close()
+            self.connection.request(method, url, body=body, headers=headers)
+            response = self.connection.getresponse()
+        return response.status, response.read()
+
+    def close(self):
+        self.connection.close()
+
+
+class Recorder:
+    """Время и коды ответов запросов по именам обработчиков."""
+
+    def __init__(self, client):
+        self.client = client
+        self.samples = {}  # имя -> [время, с]
+        self.errors = {}   # имя -> количество ответов с кодом >= 400
+
+    def __call__(self, name, method, url, data=None, body=None):
+        start = perf_counter()
+        status, response = self.client.request(method, url, data=data, body=body)
+        self.samples.setdefault(name, []).append(perf_counter() - start)
+        self.errors[name] = self.errors.get(name, 0) + (status >= 400)
+        return json.loads(response) if response.startswith(b'{') else None
+
+    def summary(self, name):
+        return summarize(self.samples[name], self.errors[name])
+
+
+def summarize(samples, errors=0):
+    """Пропускная способность и задержки в миллисекундах."""
+    if len(samples) > 1:
+        p = quantiles(samples, n=100, method='inclusive')
+        p50, p95, p99 = p[49], p[94], p[98]
+    else:
+        p50 = p95 = p99 = samples[0]
+    return {"requests": len(samples), "errors": errors,
+            "throughput": round(len(samples) / sum(samples), 1),
+            "p50_ms": round(p50 * 1000, 3), "p95_ms": round(p95 * 1000, 3),
+            "p99_ms": round(p99 * 1000, 3), "max_ms": round(max(samples) * 1000, 3)}
+
+
+def batches(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def complete_time(assign_time):
+    """Время выполнения заказа через минуту после назначения."""
+    time = datetime.strptime(assign_time, DATETIME_FORMAT) + timedelta(minutes=1)
+    return time.strftime(DATETIME_FORMAT)[:-3]
+
+
+def run_endpoints(client, generator, args):
+    """Вызывает все обработчики и возвращает сводку по каждому."""
+    call = Recorder(client)
+    courier_ids = list(range(1, args.couriers + 1))
+    order_ids = list(range(1, args.orders + 1))
+    sampled = courier_ids[:args.requests]
+
+    for chunk in batches(courier_ids, args.batch):
+        call("POST /couriers", 'POST', '/couriers',
+             {"data": [generator.courier(i) for i in chunk]})
+    for chunk in batches(order_ids, args.batch):
+        call("POST /orders", 'POST', '/orders',
+             {"data": [generator.order(i) for i in chunk]})
+    stream_ids = range(args.orders + 1, args.orders + args.stream_orders + 1)
+    for chunk in batches(stream_ids, args.batch * 10):
+        body = '\n'.join(json.dumps(generator.order(i)) for i in chunk).encode()
+        call("POST /orders/stream", 'POST', '/orders/stream', body=body)
+
+    for courier_id in sampled:
+        call("GET /couriers/<id>", 'GET', '/couriers/%d' % courier_id)
+    for courier_id in sampled:
+        result = call("POST /orders/assign", 'POST', '/orders/assign',
+                      {"courier_id": courier_id})
+        if result and result.get("orders"):
+            call("POST /orders/complete", 'POST', '/orders/complete', {
+                "courier_id": courier_id, "order_id": result["orders"][0]["id"],
+                "complete_time": complete_time(result["assign_time"])})
+    for courier_id in sampled:
+        changes = generator.courier(courier_id)
+        del changes["courier_id"]
+        call("PATCH /couriers/<id>", 'PATCH', '/couriers/%d' % courier_id, changes)
+    for _ in range(args.batch_assigns):
+        call("POST /orders/assign/batch", 'POST', '/orders/assign/batch',
+             {"all_idle": True})
+    for _ in range(args.batch_assigns):
+        call("GET /metrics", 'GET', '/metrics')
+    for courier_id in sampled:
+        region = generator.rng.randint(1, generator.regions)
+        call("GET /orders", 'GET', '/orders?region=%d&after=%d&limit=50'
+             % (region, courier_id * args.orders // len(courier_ids)))
+        call("GET /couriers", 'GET', '/couriers?region=%d&after=%d&limit=50'
+             % (region, courier_id))
+
+    return {name: call.summary(name) for name in call.samples}
+
+
+def run_growth(client, generator, args):
+    """Измеряет задержку назначения заказов при данных количествах
+    свободных заказов. Перед каждым измерением свободные заказы
+    дополняются до нужного количества, назначение выполняют новые курьеры."""
+    call = Recorder(client)
+    results = []
+    free, next_order, next_courier = 0, 1, 1
+    for size in sorted(args.sizes):
+        while free < size:
+            count = min(args.seed_batch, size - free)
+            call("seed", 'POST', '/orders', {"data": [
+                generator.order(i) for i in range(next_order, next_order + count)]})
+            next_order += count
+            free += count
+        courier_ids = range(next_courier, next_courier + args.requests)
+        next_courier += args.requests
+        call("seed", 'POST', '/couriers',
+             {"data": [generator.courier(i) for i in courier_ids]})
+
+        name = "POST /orders/assign @%d" % size
+        for courier_id in courier_ids:
+            result = call(name, 'POST', '/orders/assign', {"courier_id": courier_id})
+            free -= len(result["orders"]) if result else 0
+        results.append(dict(free_orders=size, **call.summary(name)))
+        print('%10d free orders  p50 %8.3f ms  p95 %8.3f ms  p99 %8.3f ms' % (
+            size, results[-1]["p50_ms"], results[-1]["p95_ms"], results[-1]["p99_ms"]))
+    return results
+
+
+def commit():
+    """Возвращает хэш текущего коммита или None вне репозитория git."""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_config(items):
+    """Разбирает настройки приложения вида KEY=VALUE (значение в JSON)."""
+    config = {}
+    for item in items:
+        key, value = item.split('=', 1)
+        try:
+            config[key] = json.loads(value)
+        except ValueError:
+            config[key] = value
+    return config
+
+
+def compare(old_path, new_path):
+    """Выводит задержки и пропускную способность из двух файлов результатов."""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print('old: %s  new: %s' % (old.get("commit"), new.get("commit")))
+
+    def rows(results):
+        if "endpoints" in results:
+            return results["endpoints"]
+        return {"assign @%d" % r["free_orders"]: r for r in results["growth"]}
+
+    old_rows, new_rows = rows(old), rows(new)
+    print('%-32s %21s %21s %21s' % ('', 'p50 ms', 'p95 ms', 'req/s'))
+    for name in new_rows:
+        if name not in old_rows:
+            continue
+        cells = []
+        for key in ("p50_ms", "p95_ms", "throughput"):
+            a, b = old_rows[name][key], new_rows[name][key]
+            change = (b - a) / a * 100 if a else 0
+            cells.append('%9.2f %+10.1f%%' % (b, change))
+        print('%-32s %s' % (name, ' '.join(cells)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = argparse.ArgumentParser(add_help=False)
+    run.add_argument('--url', help="адрес запущенного сервиса вместо тестового клиента")
+    run.add_argument('--config', nargs='*', default=[], metavar='KEY=VALUE',
+                     help="настройки приложения для тестового клиента")
+    run.add_argument('--regions', type=int, default=10)
+    run.add_argument('--interval-density', type=int, default=2)
+    run.add_argument('--weights', choices=sorted(WEIGHTS), default='uniform')
+    run.add_argument('--requests', type=int, default=200,
+                     help="количество измеряемых запросов к каждому обработчику")
+    run.add_argument('--seed', type=int, default=0)
+    run.add_argument('--output', help="файл JSON для результатов")
+
+    endpoints = commands.add_parser('endpoints', parents=[run])
+    endpoints.add_argument('--couriers', type=int, default=1000)
+    endpoints.add_argument('--orders', type=int, default=10000)
+    endpoints.add_argument('--stream-orders', type=int, default=10000)
+    endpoints.add_argument('--batch', type=int, default=100,
+                           help="курьеров или заказов в одном запросе")
+    endpoints.add_argument('--batch-assigns', type=int, default=5)
+
+    growth = commands.add_parser('growth', parents=[run])
+    growth.add_argument('--sizes', type=int, nargs='+',
+                        default=[1000, 10000, 100000, 1000000])
+    growth.add_argument('--seed-batch', type=int, default=10000,
+                        help="заказов в одном запросе при заполнении базы")
+
+    comparison = commands.add_parser('compare')
+    comparison.add_argument('old')
+    comparison.add_argument('new')
+
+    args = parser.parse_args()
+    if args.command == 'compare':
+        compare(args.old, args.new)
+        return
+
+    generator = Generator(args.seed, args.regions, args.interval_density, args.weights)
+    if args.url:
+        client = HttpClient(args.url)
+    else:
+        client = InProcessClient(parse_config(args.config))
+    try:
+        if args.command == 'endpoints':
+            results = {"endpoints": run_endpoints(client, generator, args)}
+            print('%-28s %8s %6s %10s %9s %9s %9s' % (
+                '', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms'))
+            for name, s in results["endpoints"].items():
+                print('%-28s %8d %6d %10.1f %9.3f %9.3f %9.3f' % (
+                    name, s["requests"], s["errors"], s["throughput"],
+                    s["p50_ms"], s["p95_ms"], s["p99_ms"]))
+        else:
+            results = {"growth": run_growth(client, generator, args)}
+    finally:
+        client.close()
+
+    if args.output:
+        params = {key: value for key, value in vars(args).items()
+                  if key not in ('command', 'output')}
+        with open(args.output, 'w') as f:
+            json.dump(dict(commit=commit(), created=datetime.now().isoformat(),
+                           command=args.command, client=client.name,
+                           params=params, **results), f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
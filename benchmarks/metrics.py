@@ -0,0 +1,61 @@
+"""
+Накладные расходы метрик (manager.api.metrics): время запросов с включенными
+и отключенными метриками. База данных SQLite в памяти, чтобы разница не
+терялась во времени записи на диск; приложения чередуются по раундам,
+для каждого выводится лучший раунд.
+
+    python -m benchmarks.metrics [--requests 1000] [--rounds 5]
+"""
+import argparse
+from time import perf_counter
+
+from manager.api.app import create_app
+
+
+COURIERS = [
+    {"courier_id": i, "courier_type": "car", "regions": [1, 2, 3],
+     "working_hours": ["09:00-12:00", "14:00-18:00"]}
+    for i in range(1, 11)
+]
+
+
+def make_client(metrics):
+    app = create_app(database_url='sqlite://', config={'METRICS': metrics})
+    client = app.test_client()
+    client.post('/couriers', json={"data": COURIERS})
+    return client
+
+
+def measure(client, requests):
+    """Возвращает среднее время GET /couriers/<id> и POST /orders/assign, мкс."""
+    results = []
+    for send in (lambda courier_id: client.get('/couriers/%d' % courier_id),
+                 lambda courier_id: client.post('/orders/assign',
+                                                json={"courier_id": courier_id})):
+        start = perf_counter()
+        for i in range(requests):
+            send(i % len(COURIERS) + 1)
+        results.append((perf_counter() - start) / requests * 10 ** 6)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    clients = {False: make_client(False), True: make_client(True)}
+    best = {False: [float('inf')] * 2, True: [float('inf')] * 2}
+    for _ in range(args.rounds):
+        for metrics, client in clients.items():
+            best[metrics] = [min(old, new) for old, new in
+                             zip(best[metrics], measure(client, args.requests))]
+
+    print('%-10s %18s %18s' % ('metrics', 'GET /couriers us', 'POST /assign us'))
+    for metrics in (False, True):
+        print('%-10s %18.1f %18.1f' % ('on' if metrics else 'off', *best[metrics]))
+
+
+if __name__ == '__main__':
+    main()
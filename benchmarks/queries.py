@@ -0,0 +1,83 @@
+"""
+Количество SQL-запросов на каждый обработчик. Ограничения на количество
+запросов проверяются тестом tests/test_query_counts.py.
+
+    python -m benchmarks.queries
+"""
+import os
+import tempfile
+
+from sqlalchemy import event
+
+from manager.api.app import create_app
+from manager.db.schema import db
+
+
+COURIERS = [
+    {"courier_id": 1, "courier_type": "car", "regions": [1, 2, 3],
+     "working_hours": ["09:00-12:00", "14:00-18:00"]},
+    {"courier_id": 2, "courier_type": "bike", "regions": [2],
+     "working_hours": ["08:00-20:00"]},
+]
+
+ORDERS = [
+    {"order_id": i, "weight": 1 + i % 5, "region": 1 + i % 3,
+     "delivery_hours": ["10:00-11:00", "15:00-16:00"]}
+    for i in range(1, 21)
+]
+
+# Запросы в порядке выполнения: (название, метод, URL, тело)
+REQUESTS = [
+    ("POST /couriers", 'post', '/couriers', {"data": COURIERS}),
+    ("POST /orders", 'post', '/orders', {"data": ORDERS}),
+    ("POST /orders/assign", 'post', '/orders/assign', {"courier_id": 1}),
+    ("POST /orders/assign (assigned)", 'post', '/orders/assign', {"courier_id": 1}),
+    ("POST /orders/assign/batch", 'post', '/orders/assign/batch', {"all_idle": True}),
+    ("POST /orders/complete", 'post', '/orders/complete',
+     {"courier_id": 1, "order_id": 3, "complete_time": "2031-01-10T10:33:01.420"}),
+    ("PATCH /couriers/1", 'patch', '/couriers/1',
+     {"courier_type": "foot", "regions": [1, 2], "working_hours": ["10:00-12:00"]}),
+    ("GET /couriers/1", 'get', '/couriers/1', None),
+    ("GET /orders", 'get', '/orders?region=2&after=5&limit=5', None),
+    ("GET /couriers", 'get', '/couriers?type=foot&region=1', None),
+]
+
+
+class StatementCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self)
+
+    def __call__(self, *args):
+        self.count += 1
+
+
+def count_statements(path, config=None):
+    """Выполняет REQUESTS на новой базе данных path и возвращает
+    тройки (название, код ответа, количество SQL-запросов)."""
+    app = create_app(path, config=config)
+    client = app.test_client()
+    with app.app_context():
+        counter = StatementCounter(db.engine)
+
+    results = []
+    for name, method, url, data in REQUESTS:
+        before = counter.count
+        response = getattr(client, method)(url, json=data)
+        results.append((name, response.status_code, counter.count - before))
+    return results
+
+
+def main():
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    os.remove(path)
+    try:
+        for name, status, statements in count_statements(path):
+            print('%-32s %3d %4d' % (name, status, statements))
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
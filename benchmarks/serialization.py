@@ -0,0 +1,155 @@
+"""
+Сравнение провайдеров JSON (manager.api.serialization): побайтное совпадение
+ответов с flask.jsonify и разобранных запросов со стандартным модулем json
+на случайных данных, время сериализации типичных ответов и разбора запросов.
+
+    python -m benchmarks.serialization [--cases 20000] [--items 10000] [--runs 5]
+
+Завершается с кодом 1, если результаты хоть раз различаются.
+"""
+import argparse
+import json
+import random
+import sys
+from time import perf_counter
+
+from flask import Flask, jsonify
+
+from manager.api.serialization import JSONProvider, OrjsonProvider, orjson
+
+
+STRINGS = ("", "id", "courier_id", "Not a valid time format.", "09:00-18:00",
+           "Курьер", "café", "\x7f", "\x00\n\"\\/", "1e5", "null", "\ud800")
+FLOATS = (0.0, -0.0, 4.17, 0.1 + 0.2, 1e-5, 3.5e-5, 1e-4, 1e16, 1.5e300,
+          float("nan"), float("inf"))
+INTS = (0, 1, -7, 2 ** 53, 2 ** 63 - 1, -2 ** 63, -2 ** 63 - 1, -10 ** 19 + 1,
+        2 ** 64, 10 ** 30)
+
+
+def random_value(rng, depth=0):
+    roll = rng.random()
+    if depth > 3 or roll < 0.5:
+        return rng.choice((
+            lambda: rng.choice(STRINGS),
+            lambda: rng.choice(INTS),
+            lambda: rng.randint(-10 ** 6, 10 ** 6),
+            lambda: rng.choice(FLOATS),
+            lambda: rng.uniform(-100, 100) * 10 ** rng.randint(-8, 20),
+            lambda: rng.choice((None, True, False)),
+        ))()
+    if roll < 0.75:
+        return [random_value(rng, depth + 1) for _ in range(rng.randint(0, 4))]
+    keys = [rng.choice(STRINGS) if rng.random() < 0.9 else rng.randint(0, 20)
+            for _ in range(rng.randint(0, 4))]
+    if rng.random() < 0.5:
+        # Ключи одного типа: смешанные ключи json не умеет сортировать
+        keys = [str(key) for key in keys]
+    return {key: random_value(rng, depth + 1) for key in keys}
+
+
+def outcome(function, *args):
+    try:
+        return "ok", function(*args)
+    except Exception as error:
+        return "exception", type(error).__name__
+
+
+def differential(app, provider, cases, seed):
+    rng = random.Random(seed)
+    mismatches = 0
+    for _ in range(cases):
+        value = random_value(rng)
+        expected = outcome(lambda: jsonify(value).get_data())
+        actual = outcome(provider.dumps, value)
+        if expected != actual:
+            mismatches += 1
+            print('MISMATCH dumps %r\n  jsonify:  %r\n  provider: %r'
+                  % (value, expected, actual))
+
+        text = json.dumps(value)
+        for data in (text, text.encode()):
+            expected = outcome(json.loads, data)
+            actual = outcome(provider.loads, data)
+            # NaN не равен сам себе, поэтому сравниваются записи значений
+            if repr(expected) != repr(actual):
+                mismatches += 1
+                print('MISMATCH loads %r\n  json:     %r\n  provider: %r'
+                      % (data, expected, actual))
+    print('%-8s %6d cases' % (provider.name, cases))
+    return mismatches
+
+
+def measure(function, value, runs):
+    """Лучшее время за runs запусков, в миллисекундах."""
+    best = None
+    for _ in range(runs):
+        start = perf_counter()
+        function(value)
+        elapsed = (perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def benchmark(providers, items, runs, seed):
+    rng = random.Random(seed)
+    couriers = {"couriers": [{"id": i} for i in range(1, items + 1)]}
+    info = {"courier_id": 1, "courier_type": "car", "regions": list(range(1, 20)),
+            "working_hours": ["09:00-12:00", "14:00-18:00"],
+            "earnings": 126000, "rating": 4.17}
+    errors = {"validation_error": {"orders": [
+        {"id": i, "weight": ["Must be greater than or equal to 0.01 "
+                             "and less than or equal to 50."]}
+        for i in range(1, items // 10 + 1)]}}
+    orders = json.dumps({"data": [
+        {"order_id": i, "weight": round(rng.uniform(0.01, 50), 2),
+         "region": rng.randint(1, 50), "delivery_hours": ["10:00-13:00"]}
+        for i in range(1, items + 1)]}).encode()
+
+    cases = (
+        ("dumps couriers response", "dumps", couriers),
+        ("dumps courier info x1000", "dumps_many", info),
+        ("dumps validation errors", "dumps", errors),
+        ("loads orders request", "loads", orders),
+    )
+    print('%-28s %s' % ('case', ''.join('%12s' % p.name for p in providers)))
+    for name, kind, value in cases:
+        times = []
+        for provider in providers:
+            if kind == "dumps":
+                function = provider.dumps
+            elif kind == "loads":
+                function = provider.loads
+            else:
+                function = lambda v, p=provider: [p.dumps(v) for _ in range(1000)]
+            times.append(measure(function, value, runs))
+        print('%-28s %s' % (name, ''.join('%10.2f ms' % t for t in times)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cases', type=int, default=20000)
+    parser.add_argument('--items', type=int, default=10000)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    providers = [JSONProvider()]
+    if orjson is not None:
+        providers.append(OrjsonProvider())
+    else:
+        print('orjson is not installed, only json is checked')
+
+    app = Flask(__name__)
+    mismatches = 0
+    with app.app_context():
+        for provider in providers:
+            mismatches += differential(app, provider, args.cases, args.seed)
+        benchmark(providers, args.items, args.runs, args.seed)
+
+    if mismatches:
+        print('%d mismatches' % mismatches)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+Масштабирование по шардам заказов: несколько процессов одновременно
+назначают и выполняют заказы, каждый - в своем районе. Один и тот же
+сценарий выполняется с заказами в одном шарде и в --shards шардах
+(файлы SQLite); районы процессов попадают в разные шарды. Выводится
+суммарная пропускная способность POST /orders/assign и POST /orders/complete
+и задержки этих запросов.
+
+    python -m benchmarks.shards [--shards 4] [--workers 4] [--duration 10]
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+from multiprocessing import Pool
+from time import perf_counter
+
+from benchmarks.load import batches, complete_time, summarize
+from manager.api.app import create_app
+
+
+def create(directory, shards):
+    """Создает приложение с основной базой и шардами заказов в directory."""
+    return create_app(os.path.join(directory, 'main.db'), config={
+        'ORDER_SHARDS': [os.path.join(directory, 'orders-%d.db' % number)
+                         for number in range(shards)]})
+
+
+def prepare(directory, shards, args):
+    """Добавляет курьеров и свободные заказы: у курьеров процесса
+    один район с номером процесса."""
+    rng = random.Random(args.seed)
+    client = create(directory, shards).test_client()
+    couriers = [{"courier_id": region * args.couriers + i, "courier_type": "car",
+                 "regions": [region], "working_hours": ["00:00-23:59"]}
+                for region in range(1, args.workers + 1) for i in range(args.couriers)]
+    for chunk in batches(couriers, 1000):
+        client.post('/couriers', json={"data": chunk})
+    orders = []
+    for order_id in range(1, args.orders + 1):
+        start = rng.randrange(0, 20 * 60)
+        orders.append({"order_id": order_id,
+                       "weight": round(rng.uniform(0.01, 10), 2),
+                       "region": rng.randint(1, args.workers),
+                       "delivery_hours": ['%02d:%02d-%02d:%02d' % (
+                           divmod(start, 60) + divmod(start + 180, 60))]})
+    for chunk in batches(orders, 1000):
+        client.post('/orders', json={"data": chunk})
+
+
+def worker(task):
+    """Назначает курьерам района заказы и выполняет их, пока не пройдет
+    duration секунд. Возвращает задержки запросов и количество ошибок."""
+    directory, shards, courier_ids, duration = task
+    client = create(directory, shards).test_client()
+    samples, errors = [], 0
+
+    def call(url, data):
+        nonlocal errors
+        start = perf_counter()
+        response = client.post(url, json=data)
+        samples.append(perf_counter() - start)
+        errors += response.status_code != 200
+        return response.get_json() if response.status_code == 200 else None
+
+    deadline = perf_counter() + duration
+    while perf_counter() < deadline:
+        for courier_id in courier_ids:
+            result = call('/orders/assign', {"courier_id": courier_id})
+            for order in (result or {}).get("orders", ()):
+                call('/orders/complete', {
+                    "courier_id": courier_id, "order_id": order["id"],
+                    "complete_time": complete_time(result["assign_time"])})
+            if perf_counter() >= deadline:
+                break
+    return samples, errors
+
+
+def run(shards, args):
+    directory = tempfile.mkdtemp()
+    try:
+        prepare(directory, shards, args)
+        tasks = [(directory, shards,
+                  [region * args.couriers + i for i in range(args.couriers)],
+                  args.duration)
+                 for region in range(1, args.workers + 1)]
+        start = perf_counter()
+        with Pool(args.workers) as pool:
+            results = pool.map(worker, tasks)
+        elapsed = perf_counter() - start
+    finally:
+        shutil.rmtree(directory)
+
+    samples = [sample for worker_samples, _ in results for sample in worker_samples]
+    result = summarize(samples, sum(errors for _, errors in results))
+    # Пропускная способность всех процессов, а не одного
+    result["throughput"] = round(len(samples) / elapsed, 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--shards', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=4,
+                        help="количество процессов (и районов)")
+    parser.add_argument('--couriers', type=int, default=50,
+                        help="курьеров в районе каждого процесса")
+    parser.add_argument('--orders', type=int, default=20000)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="файл JSON для результатов")
+    args = parser.parse_args()
+
+    results = {}
+    for shards in sorted({1, args.shards}):
+        results[shards] = run(shards, args)
+
+    print('%-7s %9s %9s %9s %9s %8s' % ('shards', 'req/s', 'p50 ms', 'p95 ms',
+                                         'p99 ms', 'errors'))
+    for shards, r in results.items():
+        print('%-7s %9s %9s %9s %9s %8s' % (shards, r["throughput"], r["p50_ms"],
+                                             r["p95_ms"], r["p99_ms"], r["errors"]))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
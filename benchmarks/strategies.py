@@ -0,0 +1,71 @@
+"""
+Сравнение стратегий назначения заказов по загрузке курьера и времени работы.
+
+    python -m benchmarks.strategies [--runs 200] [--candidates 50 200 1000]
+"""
+import argparse
+import random
+from collections import namedtuple
+from statistics import mean
+from time import perf_counter
+
+from manager.api.strategies import GreedyStrategy, BranchAndBoundStrategy
+
+
+CAPACITIES = (10, 15, 50)
+
+FakeOrder = namedtuple('FakeOrder', ('id', 'weight'))
+
+
+def make_orders(count, rng):
+    """Возвращает заказы со случайным весом по возрастанию веса."""
+    orders = [FakeOrder(i, round(rng.uniform(0.01, 50) ** 0.8, 2))
+              for i in range(count)]
+    orders.sort(key=lambda order: (order.weight, order.id))
+    return orders
+
+
+def label(strategy):
+    if isinstance(strategy, BranchAndBoundStrategy):
+        return '%s/%d' % (strategy.name, strategy.max_candidates)
+    return strategy.name
+
+
+def run(strategies, candidates, runs, seed):
+    rng = random.Random(seed)
+    samples = [(make_orders(candidates, rng), rng.choice(CAPACITIES))
+               for _ in range(runs)]
+    print('%-14s %10s %12s %10s %10s %10s' % (
+        'strategy', 'candidates', 'utilization', 'orders', 'avg ms', 'max ms'))
+    for strategy in strategies:
+        utilization, counts, times = [], [], []
+        for orders, capacity in samples:
+            start = perf_counter()
+            selected = strategy.select(iter(orders), capacity)
+            times.append((perf_counter() - start) * 1000)
+            utilization.append(sum(o.weight for o in selected) / capacity)
+            counts.append(len(selected))
+        print('%-14s %10d %11.1f%% %10.2f %10.3f %10.3f' % (
+            label(strategy), candidates, mean(utilization) * 100,
+            mean(counts), mean(times), max(times)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=200)
+    parser.add_argument('--candidates', type=int, nargs='+', default=[50, 200, 1000])
+    parser.add_argument('--time-budget', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    strategies = (
+        GreedyStrategy(),
+        BranchAndBoundStrategy(args.time_budget, max_candidates=200),
+        BranchAndBoundStrategy(args.time_budget, max_candidates=1000),
+    )
+    for candidates in args.candidates:
+        run(strategies, candidates, args.runs, args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+"""
+Сравнение скомпилированных валидаторов (manager.api.validation) с эталонными
+схемами marshmallow: дифференциальная проверка на случайных запросах
+и время проверки запросов из 10 000 курьеров и заказов.
+
+    python -m benchmarks.validation [--cases 3000] [--items 10000] [--runs 5]
+
+Завершается с кодом 1, если результаты валидаторов хоть раз различаются.
+Та же дифференциальная проверка выполняется тестом tests/test_validation.py.
+"""
+import argparse
+import copy
+import os
+import random
+import sys
+import tempfile
+from time import perf_counter
+
+from marshmallow import ValidationError
+
+from manager.api.app import create_app
+from manager.api.schema import CouriersSchema, OrdersSchema, OrderSchema
+from manager.api.validation import order_errors, validate_couriers, validate_orders
+from manager.db.schema import db, Courier, Order
+
+
+# ID курьеров и заказов, которые уже есть в базе данных
+EXISTING_IDS = range(1, 6)
+
+INTS = (1, 7, 0, -3, 2.0, "3", True, False, None, [1], {}, 10 ** 30)
+WEIGHTS = (0.01, 50, 50.01, 0, 12, 3.5, "1.5", "abc", "nan", "1e400",
+           10 ** 400, True, None, [1])
+TYPES = ("foot", "car", "bike", "plane", "", 3, None, ["foot"])
+INTERVALS = ("09:00-18:00", "18:00-09:00", "09:00-09:00", "00:00-23:59",
+             "25:00-26:00", "9:00-18:00", "00:60-01:00", "19:59-20:00",
+             "1٢:00-13:00", "2٥:00-23:00", "09:00-18:00 ",
+             "09:00--18:00", "", 900, None, ["09:00-18:00"])
+
+
+def random_list(rng, values):
+    """Случайный список значений или значение, которое не является списком."""
+    if rng.random() < 0.1:
+        return rng.choice(("09:00-18:00", {}, None, 5))
+    return [rng.choice(values) if rng.random() < 0.3 else values[0]
+            for _ in range(rng.randint(0, 4))]
+
+
+def random_courier(rng, courier_id):
+    courier = {"courier_id": courier_id,
+               "courier_type": rng.choice(TYPES) if rng.random() < 0.2 else "car",
+               "regions": random_list(rng, (1, 2, 3) + INTS),
+               "working_hours": random_list(rng, INTERVALS)}
+    return mutate(rng, courier, INTS)
+
+
+def random_order(rng, order_id):
+    order = {"order_id": order_id,
+             "weight": rng.choice(WEIGHTS) if rng.random() < 0.2 else 2.5,
+             "region": rng.choice(INTS) if rng.random() < 0.1 else 1,
+             "delivery_hours": random_list(rng, INTERVALS)}
+    return mutate(rng, order, INTS)
+
+
+def mutate(rng, item, ids):
+    """Удаляет поля, добавляет неизвестные и портит ID элемента."""
+    id_field = next(iter(item))
+    for name in list(item):
+        if name != id_field and rng.random() < 0.05:
+            del item[name]
+    if rng.random() < 0.05:
+        item["extra"] = 1
+    if rng.random() < 0.1:
+        item[id_field] = rng.choice(list(EXISTING_IDS))
+    elif rng.random() < 0.05:
+        item[id_field] = rng.choice(ids)
+    return item
+
+
+def random_payload(rng, make_item, id_field):
+    """Случайный запрос, в том числе с нарушенными гарантиями на входные данные."""
+    roll = rng.random()
+    if roll < 0.02:
+        return rng.choice(({}, [], {"data": 5}, {"data": [1]}, {"data": [{}]}))
+    items = [make_item(rng, 100 + i) for i in range(rng.randint(0, 6))]
+    if roll < 0.05 and items:
+        items.append({id_field: items[0][id_field]})
+    payload = {"data": items}
+    if rng.random() < 0.02:
+        payload["foo"] = 1
+    return payload
+
+
+def outcome(validate, payload):
+    """Результат проверки: успех, описание ошибок или тип исключения."""
+    try:
+        validate(copy.deepcopy(payload))
+    except ValidationError as error:
+        return "error", error.messages
+    except Exception as error:
+        return "exception", type(error).__name__
+    return "ok", None
+
+
+def create_existing():
+    """Добавляет в базу данных приложения курьеров и заказы EXISTING_IDS."""
+    Courier.bulk_create([{"courier_id": i, "courier_type": "foot",
+                          "regions": [1], "working_hours": ["09:00-18:00"]}
+                         for i in EXISTING_IDS])
+    Order.bulk_create([{"order_id": i, "weight": 1, "region": 1,
+                        "delivery_hours": ["09:00-18:00"]}
+                       for i in EXISTING_IDS])
+    db.session.commit()
+
+
+def differential(cases, seed):
+    """Проверяет cases случайных запросов обоими валидаторами.
+    Возвращает описания расхождений и количество результатов
+    каждого вида по проверяемым запросам."""
+    rng = random.Random(seed)
+    pairs = (
+        ("couriers", lambda data: CouriersSchema().load(data), validate_couriers,
+         random_courier, "courier_id"),
+        ("orders", lambda data: OrdersSchema().load(data), validate_orders,
+         random_order, "order_id"),
+    )
+    mismatches, summary = [], {}
+    for name, reference, compiled, make_item, id_field in pairs:
+        kinds = summary[name] = {}
+        for _ in range(cases):
+            payload = random_payload(rng, make_item, id_field)
+            expected = outcome(reference, payload)
+            actual = outcome(compiled, payload)
+            kinds[expected[0]] = kinds.get(expected[0], 0) + 1
+            if expected != actual:
+                mismatches.append('%s\n  payload:  %r\n  schema:   %r\n  compiled: %r'
+                                  % (name, payload, expected, actual))
+
+    # Проверка отдельных заказов потока POST /orders/stream
+    schema = OrderSchema()
+    existing = set(EXISTING_IDS)
+    schema.context["existing_ids"] = existing
+    for _ in range(cases):
+        order = random_order(rng, rng.randint(1, 10))
+        expected, actual = schema.validate(order), order_errors(order, existing)
+        if expected != actual:
+            mismatches.append('stream order\n  order:    %r\n  schema:   %r\n'
+                              '  compiled: %r' % (order, expected, actual))
+    return mismatches, summary
+
+
+def measure(validate, payload, runs):
+    """Лучшее время проверки запроса за runs запусков, в миллисекундах."""
+    best = None
+    for _ in range(runs):
+        data = copy.deepcopy(payload)
+        start = perf_counter()
+        try:
+            validate(data)
+        except ValidationError:
+            pass
+        elapsed = (perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def benchmark(items, runs, seed):
+    rng = random.Random(seed)
+    valid_couriers = {"data": [
+        {"courier_id": 100 + i, "courier_type": rng.choice(("foot", "bike", "car")),
+         "regions": rng.sample(range(1, 50), 3),
+         "working_hours": ["09:00-12:00", "14:00-18:00"]} for i in range(items)]}
+    valid_orders = {"data": [
+        {"order_id": 100 + i, "weight": round(rng.uniform(0.01, 50), 2),
+         "region": rng.randint(1, 50), "delivery_hours": ["10:00-13:00"]}
+        for i in range(items)]}
+    invalid_couriers = copy.deepcopy(valid_couriers)
+    for courier in invalid_couriers["data"][::10]:
+        courier["working_hours"] = ["18:00-09:00"]
+    invalid_orders = copy.deepcopy(valid_orders)
+    for order in invalid_orders["data"][::10]:
+        order["weight"] = 51
+
+    cases = (
+        ("couriers", valid_couriers, CouriersSchema, validate_couriers),
+        ("couriers (10% invalid)", invalid_couriers, CouriersSchema, validate_couriers),
+        ("orders", valid_orders, OrdersSchema, validate_orders),
+        ("orders (10% invalid)", invalid_orders, OrdersSchema, validate_orders),
+    )
+    print('%-24s %8s %12s %12s %8s' % ('payload', 'items', 'schema ms',
+                                        'compiled ms', 'speedup'))
+    for name, payload, schema, compiled in cases:
+        reference = measure(lambda data: schema().load(data), payload, runs)
+        fast = measure(compiled, payload, runs)
+        print('%-24s %8d %12.1f %12.1f %7.1fx' % (name, items, reference, fast,
+                                                 reference / fast))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cases', type=int, default=3000)
+    parser.add_argument('--items', type=int, default=10000)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = create_app(os.path.join(directory, 'db.sqlite3'))
+        with app.app_context():
+            create_existing()
+            mismatches, summary = differential(args.cases, args.seed)
+            for mismatch in mismatches:
+                print('MISMATCH ' + mismatch)
+            for name, kinds in summary.items():
+                print('%-10s %6d cases  %s' % (name, args.cases, ', '.join(
+                    '%s %d' % item for item in sorted(kinds.items()))))
+            print('%-10s %6d cases' % ('stream', args.cases))
+            benchmark(args.items, args.runs, args.seed)
+
+    if mismatches:
+        print('%d mismatches' % len(mismatches))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
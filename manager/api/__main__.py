@@ -1,8 +1,76 @@
+"""
+Запуск сервиса:
+
+    python -m manager.api                 # сервер разработки Flask
+    python -m manager.api --production    # gunicorn, несколько процессов
+    python -m manager.api --asgi          # gunicorn с обработчиками uvicorn
+
+Параметры запуска задаются аргументами командной строки или переменными
+окружения MANAGER_HOST, MANAGER_PORT, MANAGER_WORKERS, MANAGER_THREADS,
+MANAGER_BACKLOG, MANAGER_GRACEFUL_TIMEOUT, MANAGER_DATABASE_PATH,
+MANAGER_DATABASE_URL, MANAGER_ORDER_SHARDS, MANAGER_POOL_SIZE,
+MANAGER_MAX_OVERFLOW, MANAGER_PRODUCTION, MANAGER_ASGI.
+"""
+import argparse
+import os
+
 from manager.api.app import create_app
+from definitions import DATABASE_PATH
+
+
+def env(name, default, type=str):
+    value = os.environ.get('MANAGER_' + name)
+    return default if value is None else type(value)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Запуск сервиса.")
+    parser.add_argument('--production', action='store_true',
+                        default=env('PRODUCTION', '') not in ('', '0'),
+                        help="запустить на gunicorn вместо сервера разработки")
+    parser.add_argument('--asgi', action='store_true',
+                        default=env('ASGI', '') not in ('', '0'),
+                        help="запустить на gunicorn в асинхронном режиме (uvicorn)")
+    parser.add_argument('--host', default=env('HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=env('PORT', 8080, int))
+    parser.add_argument('--workers', type=int,
+                        default=env('WORKERS', 2 * (os.cpu_count() or 1) + 1, int),
+                        help="количество процессов-обработчиков")
+    parser.add_argument('--threads', type=int, default=env('THREADS', 4, int),
+                        help="количество потоков в каждом процессе")
+    parser.add_argument('--backlog', type=int, default=env('BACKLOG', 2048, int),
+                        help="длина очереди ожидающих соединений")
+    parser.add_argument('--graceful-timeout', type=int,
+                        default=env('GRACEFUL_TIMEOUT', 30, int),
+                        help="время на завершение запросов при остановке, с")
+    parser.add_argument('--database', default=env('DATABASE_PATH', DATABASE_PATH))
+    parser.add_argument('--database-url', default=env('DATABASE_URL', None),
+                        help="полный URL базы данных вместо файла SQLite")
+    parser.add_argument('--order-shards', default=env('ORDER_SHARDS', None),
+                        help="файлы SQLite или URL шардов заказов через запятую")
+    parser.add_argument('--pool-size', type=int, default=env('POOL_SIZE', None, int),
+                        help="размер пула соединений с базой данных")
+    parser.add_argument('--max-overflow', type=int,
+                        default=env('MAX_OVERFLOW', None, int),
+                        help="соединения сверх размера пула")
+    return parser.parse_args()
+
 
 def main():
-    app = create_app()
-    app.run(host='127.0.0.1', port=8080)
+    args = parse_args()
+    app = create_app(args.database, database_url=args.database_url, config={
+        'DATABASE_POOL_SIZE': args.pool_size,
+        'DATABASE_MAX_OVERFLOW': args.max_overflow,
+        'DATABASE_POOL_PRE_PING': args.database_url is not None,
+        'ORDER_SHARDS': args.order_shards and args.order_shards.split(','),
+    })
+    if not args.production and not args.asgi:
+        app.run(host=args.host, port=args.port)
+        return
+
+    from manager.api.server import serve
+    serve(app, args.host, args.port, args.workers, args.threads,
+          args.backlog, args.graceful_timeout, asgi=args.asgi)
 
 
 if __name__ == "__main__":
@@ -4,21 +4,140 @@ from flask import Flask
 
 
 from manager.db.schema import db
+from manager.db.migrations import upgrade
+from manager.db.sqlite import DEFAULT_PRAGMAS, apply_pragmas
+from manager.db.engine import engine_options
+from manager.db.shards import OrderShards, shard_binds
+from manager.api.pool import FreeOrdersPool
+from manager.api.precompute import CandidateIndex
+from manager.api.strategies import create_strategy
+from manager.api.cache import create_cache
+from manager.api.metrics import Metrics
+from manager.api.idempotency import IdempotencyStore
+from manager.api.notify import OrdersNotifier
+from manager.api.serialization import ProviderRequest, create_json_provider
 from manager.api.handlers import HANDLERS
-from definitions import DATABASE_PATH
+from definitions import DATABASE_PATH, CACHE_PATH
 
 
-def create_app(database_path=DATABASE_PATH):
-    """Создает экземпляр приложения, готового к запуску. """
+def create_app(database_path=DATABASE_PATH, config=None, database_url=None):
+    """Создает экземпляр приложения, готового к запуску.
+    database_url - полный URL базы данных, по умолчанию файл SQLite
+    database_path. Параметр config дополняет и переопределяет настройки
+    по умолчанию."""
     app = Flask(__name__)
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///%s' % database_path
+    app.config['SQLALCHEMY_DATABASE_URI'] = \
+        database_url or 'sqlite:///%s' % database_path
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Параметры движка базы данных (см. manager.db.engine)
+    app.config['DATABASE_POOL_SIZE'] = None
+    app.config['DATABASE_MAX_OVERFLOW'] = None
+    app.config['DATABASE_POOL_PRE_PING'] = False
+    app.config['DATABASE_QUERY_CACHE_SIZE'] = None
+    # Разбиение заказов по районам между базами данных: пути к файлам
+    # SQLite или URL баз данных шардов (см. manager.db.shards)
+    app.config['ORDER_SHARDS'] = None
+    # PRAGMA для каждого соединения SQLite (см. manager.db.sqlite)
+    app.config['SQLITE_PRAGMAS'] = dict(DEFAULT_PRAGMAS)
+    # Провайдер JSON для запросов и ответов (см. manager.api.serialization)
+    app.config['JSON_PROVIDER'] = 'auto'
+    # Валидация запросов на добавление курьеров и заказов:
+    # 'compiled' (см. manager.api.validation) или эталонные схемы 'schema'
+    app.config['REQUEST_VALIDATOR'] = 'compiled'
+    # Размер части потока при загрузке заказов через POST /orders/stream
+    app.config['ORDERS_STREAM_CHUNK_SIZE'] = 1000
+    # Пул свободных заказов в памяти процесса (см. manager.api.pool);
+    # пул перечитывается из базы данных раз в DISPATCH_POOL_TTL секунд
+    app.config['DISPATCH_POOL'] = False
+    app.config['DISPATCH_POOL_TTL'] = 5
+    # Заранее вычисленные списки кандидатов курьеров (см. manager.api.precompute)
+    app.config['DISPATCH_PRECOMPUTE'] = False
+    app.config['DISPATCH_PRECOMPUTE_WORKERS'] = 2
+    app.config['DISPATCH_PRECOMPUTE_QUEUE'] = 1000
+    app.config['DISPATCH_PRECOMPUTE_LIMIT'] = 1000
+    app.config['DISPATCH_PRECOMPUTE_TTL'] = None
+    # Стратегия назначения заказов (см. manager.api.strategies)
+    app.config['ASSIGN_STRATEGY'] = 'greedy'
+    app.config['ASSIGN_TIME_BUDGET'] = 0.05
+    app.config['ASSIGN_MAX_CANDIDATES'] = 200
+    # Количество повторов назначения при конфликте с параллельным запросом
+    app.config['ASSIGN_MAX_RETRIES'] = 3
+    # Сразу назначать другим курьерам заказы, снятые при PATCH /couriers/<id>
+    app.config['PATCH_REOFFER'] = False
+    # Кэш ответов GET /couriers/<id> (см. manager.api.cache)
+    app.config['COURIER_CACHE'] = None
+    app.config['COURIER_CACHE_TTL'] = 60
+    app.config['COURIER_CACHE_SIZE'] = 10000
+    app.config['COURIER_CACHE_PATH'] = CACHE_PATH
+    # Ответы на запросы с заголовком Idempotency-Key (см. manager.api.idempotency)
+    app.config['IDEMPOTENCY_KEYS'] = True
+    app.config['IDEMPOTENCY_TTL'] = 24 * 60 * 60
+    # Метрики запросов в формате Prometheus (см. manager.api.metrics)
+    app.config['METRICS'] = True
+    # Ожидание заказов курьером (см. manager.api.notify)
+    app.config['ORDERS_WAIT'] = True
+    app.config['ORDERS_WAIT_RECHECK'] = 5
+    app.config.update(config or {})
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(
+        app.config['SQLALCHEMY_DATABASE_URI'],
+        pool_size=app.config['DATABASE_POOL_SIZE'],
+        max_overflow=app.config['DATABASE_MAX_OVERFLOW'],
+        pool_pre_ping=app.config['DATABASE_POOL_PRE_PING'],
+        query_cache_size=app.config['DATABASE_QUERY_CACHE_SIZE'])
+    if app.config['ORDER_SHARDS']:
+        app.config['SQLALCHEMY_BINDS'] = shard_binds(app.config['ORDER_SHARDS'])
+        # Эти режимы загружают и изменяют заказы без учета шардов
+        for option in ('DISPATCH_POOL', 'DISPATCH_PRECOMPUTE', 'PATCH_REOFFER'):
+            if app.config[option]:
+                raise RuntimeError("%s is not supported with ORDER_SHARDS" % option)
 
     # Подключение на старте к базе данных
     db.init_app(app)
 
-    #with app.app_context():
-    #    db.create_all()
+    # Приведение схемы базы данных к актуальной версии
+    with app.app_context():
+        apply_pragmas(db.engine, app.config['SQLITE_PRAGMAS'])
+        upgrade()
+        if app.config['ORDER_SHARDS']:
+            shards = app.extensions['order_shards'] = OrderShards(app)
+            shards.setup(app.config['SQLITE_PRAGMAS'])
+
+    if app.config['DISPATCH_POOL']:
+        # Без перезагрузки пул процесса не увидит заказы, добавленные
+        # или снятые с курьеров в других процессах
+        ttl = app.config['DISPATCH_POOL_TTL']
+        if ttl is None or ttl <= 0:
+            raise RuntimeError("DISPATCH_POOL requires a positive DISPATCH_POOL_TTL")
+        app.extensions['dispatch_pool'] = FreeOrdersPool(ttl=ttl)
+    if app.config['DISPATCH_PRECOMPUTE']:
+        app.extensions['candidate_index'] = CandidateIndex(
+            app, workers=app.config['DISPATCH_PRECOMPUTE_WORKERS'],
+            queue_size=app.config['DISPATCH_PRECOMPUTE_QUEUE'],
+            limit=app.config['DISPATCH_PRECOMPUTE_LIMIT'],
+            ttl=app.config['DISPATCH_PRECOMPUTE_TTL'])
+
+    app.extensions['json_provider'] = create_json_provider(app.config)
+    app.request_class = ProviderRequest
+
+    app.extensions['assign_strategy'] = create_strategy(app.config)
+    cache = create_cache(app.config)
+    if cache is not None:
+        app.extensions['courier_cache'] = cache
+
+    if app.config['IDEMPOTENCY_KEYS']:
+        app.extensions['idempotency'] = IdempotencyStore(app.config['IDEMPOTENCY_TTL'])
+
+    if app.config['ORDERS_WAIT']:
+        app.extensions['orders_notifier'] = \
+            OrdersNotifier(recheck=app.config['ORDERS_WAIT_RECHECK'])
+
+    if app.config['METRICS']:
+        metrics = app.extensions['metrics'] = Metrics()
+        with app.app_context():
+            metrics.init_app(app, db.engine)
+        if 'order_shards' in app.extensions:
+            for engine in app.extensions['order_shards'].engines:
+                metrics.watch_engine(engine)
 
     # Регистрация обработчиков
     for handler in HANDLERS:
@@ -0,0 +1,264 @@
+"""
+Модуль содержит асинхронный режим работы сервиса (ASGI).
+
+Соединения обслуживает цикл событий asyncio: тело запроса читается
+и ответ отправляется асинхронно, поэтому медленный клиент не занимает
+поток, пока передает запрос или принимает ответ. Полностью прочитанный
+запрос выполняется приложением Flask - теми же обработчиками, схемами
+валидации и функциями ответов из manager.api.schema - в пуле из threads
+потоков. Пул ограничивает количество одновременных обращений к базе
+данных и должен соответствовать размеру пула соединений.
+
+Обработчик может не занимать поток пула, пока ждет события: он получает
+AsyncRequest из окружения WSGI (ключ ASYNC_REQUEST), возвращает ответ
+без тела и передает тело асинхронным генератором. Генератор выполняется
+в цикле событий, а обращения к базе данных передает в пул через
+AsyncRequest.run. Так ожидание заказов (GET /couriers/<id>/orders/wait)
+ждет в цикле событий и не блокирует остальные запросы процесса.
+
+Части ответов, которые формируются в потоке пула, передаются в цикл
+событий не более чем по SEND_WINDOW неотправленных частей: поток ждет,
+пока медленный клиент примет отправленные.
+
+    python -m manager.api --asgi    # gunicorn с обработчиками uvicorn
+"""
+import asyncio
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from threading import Event, Semaphore
+
+
+# Ключ окружения WSGI, в котором обработчик получает AsyncRequest
+ASYNC_REQUEST = 'manager.asgi.request'
+
+# Количество частей ответа из потока пула, еще не отправленных клиенту
+SEND_WINDOW = 16
+
+
+class AsyncRequest:
+    """Запрос ASGI, доступный обработчику Flask."""
+
+    def __init__(self, asgi_app, loop):
+        self.asgi_app = asgi_app
+        self.loop = loop
+        self.body = None
+
+    def stream(self, body):
+        """Передает тело ответа асинхронным генератором частей в байтах.
+        Заголовки ответа - заголовки, возвращенные обработчиком."""
+        self.body = body
+
+    def run(self, func, *args):
+        """Выполняет func(*args) в потоке пула с контекстом приложения.
+        Возвращает asyncio.Future результата; вызывается в цикле событий."""
+        return self.loop.run_in_executor(self.asgi_app.executor,
+                                         self.asgi_app.call, func, args)
+
+
+class AsgiApp:
+    """Приложение ASGI 3 поверх приложения Flask."""
+
+    def __init__(self, app, threads=4):
+        self.app = app
+        self.threads = threads
+        # Потоки пула создаются при первом запросе, то есть уже
+        # в процессе-обработчике
+        self.executor = ThreadPoolExecutor(max_workers=threads,
+                                           thread_name_prefix='asgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+        else:
+            raise ValueError("Unsupported ASGI scope type: %s" % scope['type'])
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def call(self, func, args):
+        """Выполняет func(*args) с контекстом приложения (в потоке пула)."""
+        with self.app.app_context():
+            return func(*args)
+
+    async def http(self, scope, receive, send):
+        body = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body.append(message.get('body', b''))
+            if not message.get('more_body', False):
+                break
+
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        window = Semaphore(SEND_WINDOW)
+        disconnected, gone = Event(), asyncio.Event()
+
+        def emit(message):
+            # Поток ждет, пока клиент примет отправленные части; после
+            # отключения клиента части передаются без ожидания
+            while not window.acquire(timeout=0.1):
+                if disconnected.is_set():
+                    break
+            loop.call_soon_threadsafe(queue.put_nowait, message)
+
+        request = AsyncRequest(self, loop)
+        environ = self.environ(scope, b''.join(body))
+        environ[ASYNC_REQUEST] = request
+        future = loop.run_in_executor(self.executor, self.run,
+                                      environ, request, emit, disconnected)
+        watcher = loop.create_task(self.watch_disconnect(receive, disconnected, gone))
+        try:
+            while True:
+                status, headers, chunk, more = await queue.get()
+                try:
+                    if status is not None:
+                        await send({'type': 'http.response.start', 'status': status,
+                                    'headers': [(name.lower().encode('latin-1'),
+                                                 value.encode('latin-1'))
+                                                for name, value in headers]})
+                    if chunk is not None:
+                        await send({'type': 'http.response.body', 'body': chunk,
+                                    'more_body': more})
+                finally:
+                    window.release()
+                if chunk is None:
+                    await self.send_async_body(request.body, send, gone)
+                    break
+                if not more:
+                    break
+        finally:
+            disconnected.set()
+            watcher.cancel()
+            await future
+
+    @staticmethod
+    async def watch_disconnect(receive, disconnected, gone):
+        """Отмечает отключение клиента: потоковый ответ прекращается."""
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                disconnected.set()
+                gone.set()
+                return
+
+    async def send_async_body(self, body, send, gone):
+        """Отправляет части асинхронного тела ответа по мере готовности.
+        Если клиент отключился, генератор тела прерывается."""
+        disconnect = asyncio.ensure_future(gone.wait())
+        try:
+            while True:
+                step = asyncio.ensure_future(body.__anext__())
+                await asyncio.wait((step, disconnect),
+                                   return_when=asyncio.FIRST_COMPLETED)
+                if not step.done():
+                    step.cancel()
+                    await asyncio.wait((step,))
+                    return
+                try:
+                    chunk = step.result()
+                except StopAsyncIteration:
+                    break
+                except Exception:
+                    self.app.logger.exception("ASGI response body failed")
+                    break
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk,
+                                'more_body': True})
+            await send({'type': 'http.response.body', 'body': b'',
+                        'more_body': False})
+        finally:
+            disconnect.cancel()
+            await body.aclose()
+
+    def run(self, environ, request, emit, disconnected):
+        """Выполняет запрос приложением Flask в потоке пула и передает
+        в цикл событий кортежи (код, заголовки, часть тела, будут ли
+        еще части). Ответ с Content-Length передается одной частью,
+        асинхронное тело (AsyncRequest.stream) - частью None, остальные
+        ответы - по мере готовности частей."""
+        response = []
+
+        def start_response(status, headers, exc_info=None):
+            response[:] = [int(status.split(' ', 1)[0]), headers]
+
+        started = False
+        try:
+            result = self.app(environ, start_response)
+            try:
+                status, headers = response
+                if request.body is not None:
+                    started = True
+                    emit((status, headers, None, True))
+                    return
+                if any(name.lower() == 'content-length' for name, _ in headers):
+                    body = b''.join(result)
+                    started = True
+                    emit((status, headers, body, False))
+                    return
+                started = True
+                emit((status, headers, b'', True))
+                for chunk in result:
+                    if disconnected.is_set():
+                        break
+                    if chunk:
+                        emit((None, None, chunk, True))
+                emit((None, None, b'', False))
+            finally:
+                # Контекст потокового ответа закрывается в том же потоке
+                if hasattr(result, 'close'):
+                    result.close()
+        except Exception:
+            self.app.logger.exception("ASGI request failed")
+            if started:
+                emit((None, None, b'', False))
+            else:
+                emit((500, [('Content-Type', 'text/plain')],
+                      b'Internal Server Error', False))
+
+    @staticmethod
+    def environ(scope, body):
+        """Возвращает окружение WSGI для запроса ASGI."""
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode().decode('latin-1'),
+            'PATH_INFO': scope['path'].encode().decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+            'REMOTE_ADDR': client[0],
+            'REMOTE_PORT': str(client[1]),
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope.get('headers', ()):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name == 'CONTENT_TYPE':
+                environ['CONTENT_TYPE'] = value
+                continue
+            if name == 'CONTENT_LENGTH':
+                continue
+            key = 'HTTP_' + name
+            environ[key] = environ[key] + ',' + value if key in environ else value
+        return environ
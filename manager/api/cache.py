@@ -0,0 +1,219 @@
+"""
+Модуль содержит кэш ответов GET /couriers/<id>.
+
+Кэш включается настройкой COURIER_CACHE:
+    'memory' - LRU-кэш в памяти процесса;
+    'sqlite' - кэш в отдельном файле SQLite (COURIER_CACHE_PATH), общий для
+               всех процессов на машине; локальная замена внешнего кэша.
+В кэше хранятся готовые тела ответов в байтах: при попадании ответ
+отдается без сериализации. Записи живут не дольше COURIER_CACHE_TTL секунд.
+
+Обработчики, меняющие данные курьера, после фиксации транзакции удаляют
+его запись из кэша и увеличивают номер поколения курьера. Обработчик
+GET /couriers/<id> запоминает номер поколения до чтения из базы данных
+и сохраняет ответ, только если номер не изменился: иначе ответ мог быть
+прочитан до изменения и попал бы в кэш после его удаления.
+
+Счетчики попаданий и промахов ведутся в каждом процессе отдельно, в том
+числе для общего кэша 'sqlite'.
+"""
+import sqlite3
+from collections import OrderedDict
+from functools import wraps
+from threading import Lock
+from time import time
+
+from flask import current_app
+
+from manager.api.schema import body_response
+
+
+def current_cache():
+    """Возвращает кэш данных курьеров приложения или None, если он отключен."""
+    return current_app.extensions.get('courier_cache')
+
+
+def invalidate_couriers(courier_ids):
+    """Удаляет из кэша данные курьеров с данными ID."""
+    cache = current_cache()
+    if cache is not None:
+        for courier_id in courier_ids:
+            cache.invalidate(courier_id)
+
+
+class CourierCache:
+    """Базовый класс кэша: хранилище значений, номера поколений ключей
+    и счетчики попаданий процесса."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+
+    def get(self, key):
+        value = self._get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def stats(self):
+        """Счетчики попаданий и промахов этого процесса и размер кэша."""
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        return {"hits": hits, "misses": misses, "size": self.size()}
+
+    def _get(self, key):
+        raise NotImplementedError
+
+    def generation(self, key):
+        """Возвращает номер поколения ключа."""
+        raise NotImplementedError
+
+    def set(self, key, value, generation):
+        """Сохраняет значение, если номер поколения ключа все еще равен
+        generation."""
+        raise NotImplementedError
+
+    def invalidate(self, key):
+        """Удаляет значение и увеличивает номер поколения ключа."""
+        raise NotImplementedError
+
+    def size(self):
+        raise NotImplementedError
+
+
+class MemoryCache(CourierCache):
+    """LRU-кэш ограниченного размера в памяти процесса."""
+
+    def __init__(self, ttl, maxsize):
+        super().__init__(ttl)
+        self.maxsize = maxsize
+        self._data = OrderedDict()  # ключ -> (время истечения, значение)
+        self._generations = {}      # ключ -> номер поколения
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def generation(self, key):
+        with self._lock:
+            return self._generations.get(key, 0)
+
+    def set(self, key, value, generation):
+        with self._lock:
+            if self._generations.get(key, 0) != generation:
+                return
+            self._data[key] = (time() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+            self._generations[key] = self._generations.get(key, 0) + 1
+
+    def size(self):
+        return len(self._data)
+
+
+class SqliteCache(CourierCache):
+    """Кэш в файле SQLite, общий для процессов. Размер ограничивается
+    удалением самых старых записей."""
+
+    def __init__(self, ttl, maxsize, path):
+        super().__init__(ttl)
+        self.maxsize = maxsize
+        self.path = path
+        with self._connect() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS responses ('
+                               'key INTEGER PRIMARY KEY, '
+                               'expires REAL NOT NULL, '
+                               'value BLOB NOT NULL)')
+            connection.execute('CREATE TABLE IF NOT EXISTS generations ('
+                               'key INTEGER PRIMARY KEY, '
+                               'generation INTEGER NOT NULL)')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def _get(self, key):
+        with self._connect() as connection:
+            row = connection.execute('SELECT value FROM responses '
+                                     'WHERE key = ? AND expires >= ?',
+                                     (key, time())).fetchone()
+        return row[0] if row else None
+
+    def generation(self, key):
+        with self._connect() as connection:
+            row = connection.execute('SELECT generation FROM generations '
+                                     'WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else 0
+
+    def set(self, key, value, generation):
+        with self._connect() as connection:
+            # Проверка поколения и запись выполняются одним запросом
+            connection.execute('INSERT OR REPLACE INTO responses '
+                               'SELECT ?, ?, ? WHERE coalesce(('
+                               'SELECT generation FROM generations '
+                               'WHERE key = ?), 0) = ?',
+                               (key, time() + self.ttl, value, key, generation))
+            connection.execute('DELETE FROM responses WHERE key NOT IN ('
+                               'SELECT key FROM responses '
+                               'ORDER BY expires DESC LIMIT ?)', (self.maxsize,))
+
+    def invalidate(self, key):
+        with self._connect() as connection:
+            connection.execute('INSERT INTO generations VALUES (?, 1) '
+                               'ON CONFLICT (key) DO UPDATE '
+                               'SET generation = generation + 1', (key,))
+            connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+
+    def size(self):
+        with self._connect() as connection:
+            return connection.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+
+def create_cache(config):
+    """Создает кэш по настройкам приложения или возвращает None."""
+    backend = config['COURIER_CACHE']
+    if backend == 'memory':
+        return MemoryCache(config['COURIER_CACHE_TTL'], config['COURIER_CACHE_SIZE'])
+    if backend == 'sqlite':
+        return SqliteCache(config['COURIER_CACHE_TTL'], config['COURIER_CACHE_SIZE'],
+                           config['COURIER_CACHE_PATH'])
+    return None
+
+
+def cached_courier(original):
+    """Декоратор обработчика GET /couriers/<id>: отдает ответ из кэша,
+    не обращаясь к базе данных, и сохраняет в кэш успешные ответы."""
+    @wraps(original)
+    def wrapper(self, courier_id):
+        cache = current_cache()
+        if cache is None:
+            return original(self, courier_id=courier_id)
+
+        body = cache.get(courier_id)
+        if body is not None:
+            return body_response(body), 200
+
+        # Номер поколения читается до обращения к базе данных
+        generation = cache.generation(courier_id)
+        response, status = original(self, courier_id=courier_id)
+        if status == 200:
+            cache.set(courier_id, response.get_data(), generation)
+        return response, status
+
+    return wrapper
@@ -1,11 +1,19 @@
 from .couriers import Couriers
+from .couriers_list import CouriersList
 from .courier import PatchCourier
 from .orders import Orders
+from .orders_list import OrdersList
+from .orders_stream import OrdersStream
+from .orders_wait import OrdersWait
 from .assign import Assign
+from .assign_batch import AssignBatch
 from .complete import Complete
 from .courier_info import CourierInfo
+from .cache_stats import CacheStats
+from .metrics import Metrics
 
 
 HANDLERS = (
-    Couriers, PatchCourier, Orders, Assign, Complete, CourierInfo,
+    Couriers, CouriersList, PatchCourier, Orders, OrdersList, OrdersStream,
+    OrdersWait, Assign, AssignBatch, Complete, CourierInfo, CacheStats, Metrics,
 )
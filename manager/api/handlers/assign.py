@@ -1,12 +1,50 @@
-from flask import request, jsonify
-from sqlalchemy import and_
+from flask import current_app, request
 from sqlalchemy import exc
+from heapq import merge
 from time import time
 
 from .base import BaseView
-from manager.db.schema import db, Courier, DeliveryHours, Order, WorkingHours
+from manager.api.idempotency import idempotent
+from manager.api.pool import current_pool
+from manager.api.precompute import current_candidates
+from manager.api.notify import current_notifier
+from manager.api.cache import invalidate_couriers
+from manager.api.strategies import current_strategy
+from manager.db.schema import db, Courier, Order
+from manager.db.shards import current_shards, claim_orders
 from manager.api.schema import (assign_response_schema,
-                                CourierIdSchema, validate_request)
+                                CourierIdSchema, validate_request, json_response)
+
+
+# Ошибки SQLite при блокировке базы данных параллельной транзакцией
+LOCKED_MESSAGES = ("database is locked", "database table is locked")
+LOCKED_CODES = ("SQLITE_BUSY", "SQLITE_LOCKED")
+
+
+def is_locked(error):
+    """Возвращает, вызвана ли OperationalError блокировкой базы данных.
+    Остальные ошибки (нет таблицы, закрыто соединение, ошибка диска)
+    повтором не исправляются."""
+    code = getattr(error.orig, 'sqlite_errorname', '')
+    return code.startswith(LOCKED_CODES) or \
+        any(message in str(error.orig) for message in LOCKED_MESSAGES)
+
+
+def run_with_retries(transaction):
+    """Выполняет transaction() и фиксирует транзакцию. Если база данных
+    заблокирована параллельным запросом, повторяет транзакцию с начала
+    до ASSIGN_MAX_RETRIES раз. Возвращает результат transaction()
+    или None, если все попытки не удались."""
+    for _ in range(current_app.config['ASSIGN_MAX_RETRIES'] + 1):
+        try:
+            result = transaction()
+            db.session.commit()
+            return result
+        except exc.OperationalError as error:
+            db.session.rollback()
+            if not is_locked(error):
+                raise
+    return None
 
 
 class Assign(BaseView):
@@ -16,49 +54,126 @@ class Assign(BaseView):
 
     @staticmethod
     def get_available_orders(courier):
-        """Возвращает список заказов, доступных для выдачи данному курьеру."""
-        working_hours = WorkingHours.get(courier.id)
+        """Возвращает заказы, доступные для выдачи данному курьеру,
+        в порядке возрастания веса."""
+        candidates = current_candidates()
+        if candidates is not None:
+            available_orders = candidates.available_orders(courier)
+            if available_orders is not None:
+                return available_orders
+
+        pool = current_pool()
+        if pool is not None:
+            available_orders = pool.available_orders(courier)
+            if available_orders is not None:
+                return available_orders
+
+        shards = current_shards()
+        if shards is not None:
+            # Запрос выполняется только в шардах районов курьера,
+            # упорядоченные списки шардов объединяются слиянием
+            intervals = [(wh.start_time, wh.end_time) for wh in courier.working_hours]
+            return list(merge(*[
+                db.session.query(Order)
+                .filter(Order.available(regions), Order.deliverable_within(intervals))
+                .order_by(Order.weight, Order.id).all()
+                for regions in shards.each(courier.get_regions)],
+                key=lambda order: (order.weight, order.id)))
+
         available_orders = db.session.query(Order) \
-            .join(DeliveryHours,
-                  and_(DeliveryHours.order_id == Order.id,
-                       DeliveryHours.intersects(working_hours)))\
-            .filter(Order.available(courier.get_regions))\
-            .order_by(Order.weight).all()
+            .filter(Order.available(courier.get_regions),
+                    Order.deliverable_by(courier.id))\
+            .order_by(Order.weight, Order.id).all()
         return available_orders
 
     @staticmethod
     def assign_orders(courier, available_orders):
-        """Назначает курьеру максимальное количество заказов
-        и возвращает список этих заказов."""
+        """Назначает курьеру заказы, выбранные стратегией назначения,
+        и возвращает список этих заказов в порядке возрастания ID, как
+        get_assigned_orders. Заказы, которые параллельный
+        запрос успел выдать другому курьеру, заменяются повторным выбором
+        из заново загруженных доступных заказов."""
         orders = []
-        for order in available_orders:
-            if courier.current_weight + order.weight > courier.capacity:
+        for _ in range(current_app.config['ASSIGN_MAX_RETRIES'] + 1):
+            capacity = courier.capacity - courier.current_weight
+            selected = current_strategy().select(available_orders, capacity)
+            claimed = claim_orders(selected, courier.id)
+            for order in claimed:
+                courier.current_weight += order.weight
+            orders += claimed
+            if len(claimed) == len(selected):
                 break
-            order.assign_to(courier.id)
-            courier.current_weight += order.weight
-            orders.append(order)
+            available_orders = Assign.get_available_orders(courier)
+        orders.sort(key=lambda order: order.id)
         return orders
 
+    @staticmethod
+    def get_assigned_orders(courier):
+        """Возвращает заказы, назначенные курьеру, в порядке возрастания ID."""
+        shards = current_shards()
+        if shards is None:
+            return Order.query.filter(Order.assigned_to(courier.id))\
+                .order_by(Order.id).all()
+
+        # Назначенные заказы находятся в районах курьера: заказы
+        # из других районов снимаются при изменении районов
+        orders = []
+        for _ in shards.each(courier.get_regions):
+            orders += Order.query.filter(Order.assigned_to(courier.id))\
+                .order_by(Order.id).all()
+        orders.sort(key=lambda order: order.id)
+        return orders
+
+    @staticmethod
+    def assign(courier_id):
+        """Возвращает курьера и его заказы, при необходимости
+        назначив ему новые заказы."""
+        courier = Courier.get(courier_id)
+        orders = Assign.get_assigned_orders(courier)
+        if orders:
+            return courier, orders
+
+        available_orders = Assign.get_available_orders(courier)
+        orders = Assign.assign_orders(courier, available_orders)
+        if orders:
+            courier.update_assignment_data(time())
+        return courier, orders
+
+    @staticmethod
+    def transaction(courier_id):
+        """Назначает заказы курьеру и возвращает тело ответа,
+        ID выданных заказов и пары (ID заказа, район)."""
+        courier, assigned_orders = Assign.assign(courier_id)
+        assigned_ids = [order.id for order in assigned_orders]
+        claimed = [(order.id, order.region) for order in assigned_orders]
+        result = assign_response_schema(courier.assign_time, assigned_orders)
+        return result, assigned_ids, claimed
+
+    @idempotent
     @validate_request(CourierIdSchema)
     def post(self):
-        # Назначение заказов
-        courier = Courier.get(request.json["courier_id"])
-        orders = Order.query.filter(Order.assigned_to(courier.id)).all()
-        if orders:
-            assigned_orders = orders
-        else:
-            available_orders = self.get_available_orders(courier)
-            assigned_orders = self.assign_orders(courier, available_orders)
-            if assigned_orders:
-                courier.update_assignment_data(time())
-
-        # Транзакция
+        # Назначение заказов и транзакция
         try:
-            db.session.commit()
+            outcome = run_with_retries(
+                lambda: self.transaction(request.json["courier_id"]))
         except exc.IntegrityError:
             msg = "Something went wrong..."
             return msg, 400
+        if outcome is None:
+            msg = "Something went wrong..."
+            return msg, 503
+        result, assigned_ids, claimed = outcome
+
+        pool = current_pool()
+        if pool is not None:
+            pool.discard(assigned_ids)
+        candidates = current_candidates()
+        if candidates is not None:
+            candidates.orders_claimed(claimed)
+        notifier = current_notifier()
+        if notifier is not None and assigned_ids:
+            notifier.couriers_changed([request.json["courier_id"]])
+        invalidate_couriers([request.json["courier_id"]])
 
         # Успешный ответ
-        result = assign_response_schema(courier.assign_time, assigned_orders)
-        return jsonify(result), 200
+        return json_response(result), 200
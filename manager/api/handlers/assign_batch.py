@@ -0,0 +1,154 @@
+from flask import request
+from sqlalchemy import exc
+from heapq import merge
+from time import time
+
+from .base import BaseView
+from .assign import Assign, run_with_retries
+from manager.db.schema import db, Courier, DeliveryHours, Order, Region, WorkingHours
+from manager.db.shards import current_shards, each_shard
+from manager.api.pool import current_pool, intersects
+from manager.api.precompute import current_candidates
+from manager.api.notify import current_notifier
+from manager.api.cache import invalidate_couriers
+from manager.api.schema import (assign_batch_response_schema,
+                                AssignBatchSchema, validate_request, json_response)
+
+
+class AssignBatch(BaseView):
+    URL_PATH = "/orders/assign/batch"
+    endpoint = "assign_orders_batch"
+    methods = ['POST']
+
+    @staticmethod
+    def get_couriers(data):
+        """Возвращает курьеров из запроса в порядке обработки:
+        в порядке перечисления или, для всех свободных курьеров, по ID."""
+        if data.get("all_idle"):
+            busy = db.session.query(Order.courier_id).filter(Order.status == "assigned")
+            if current_shards() is None:
+                return Courier.query.filter(Courier.id.notin_(busy))\
+                    .order_by(Courier.id).all()
+            # Заказы в шардах: занятые курьеры собираются из всех шардов
+            busy_ids = set()
+            for _ in each_shard():
+                busy_ids.update(row[0] for row in busy.distinct())
+            return [courier for courier in Courier.query.order_by(Courier.id)
+                    if courier.id not in busy_ids]
+
+        couriers = {courier.id: courier for courier in
+                    Courier.query.filter(Courier.id.in_(data["courier_ids"])).all()}
+        return [couriers[courier_id] for courier_id in data["courier_ids"]]
+
+    @staticmethod
+    def get_schedules(courier_ids):
+        """Возвращает районы и интервалы работы данных курьеров
+        в виде словарей ID курьера -> список."""
+        regions = {courier_id: [] for courier_id in courier_ids}
+        working_hours = {courier_id: [] for courier_id in courier_ids}
+        rows = db.session.query(Region.courier_id, Region.region)\
+            .filter(Region.courier_id.in_(courier_ids)).all()
+        for courier_id, region in rows:
+            regions[courier_id].append(region)
+        rows = db.session.query(WorkingHours.courier_id, WorkingHours.start_time,
+                                WorkingHours.end_time)\
+            .filter(WorkingHours.courier_id.in_(courier_ids)).all()
+        for courier_id, start, end in rows:
+            working_hours[courier_id].append((start, end))
+        return regions, working_hours
+
+    @staticmethod
+    def get_free_orders(regions):
+        """Загружает свободные заказы из данных районов одним запросом
+        (по одному в каждом шарде районов). Возвращает заказы по районам
+        в порядке возрастания веса и интервалы доставки каждого заказа."""
+        buckets, windows = {}, {}
+        for shard_regions in each_shard(regions):
+            orders = Order.query.filter(Order.available(shard_regions))\
+                .order_by(Order.weight, Order.id).all()
+            for order in orders:
+                buckets.setdefault(order.region, []).append(order)
+
+            rows = db.session.query(DeliveryHours.order_id, DeliveryHours.start_time,
+                                    DeliveryHours.end_time)\
+                .join(Order, Order.id == DeliveryHours.order_id)\
+                .filter(Order.available(shard_regions)).all()
+            for order_id, start, end in rows:
+                windows.setdefault(order_id, []).append((start, end))
+        return buckets, windows
+
+    @staticmethod
+    def candidates(buckets, windows, taken, regions, intervals):
+        """Возвращает еще не выданные заказы из районов курьера, подходящие
+        по времени доставки, в порядке возрастания веса."""
+        orders = merge(*[buckets.get(r, ()) for r in regions],
+                       key=lambda order: (order.weight, order.id))
+        return (order for order in orders
+                if order.id not in taken
+                and intersects(windows.get(order.id, ()), intervals))
+
+    @classmethod
+    def transaction(cls, data):
+        """Назначает заказы курьерам из запроса и возвращает тело ответа,
+        ID курьеров, ID курьеров с новыми заказами и пары (ID заказа, район)."""
+        # Загрузка курьеров, их районов, графиков и назначенных заказов
+        couriers = cls.get_couriers(data)
+        courier_ids = [courier.id for courier in couriers]
+        regions, working_hours = cls.get_schedules(courier_ids)
+        assigned = {courier_id: [] for courier_id in courier_ids}
+        orders = []
+        for _ in each_shard():
+            orders += Order.query.filter(Order.status == "assigned",
+                                         Order.courier_id.in_(courier_ids))\
+                .order_by(Order.id).all()
+        for order in sorted(orders, key=lambda order: order.id):
+            assigned[order.courier_id].append(order)
+
+        # Назначение заказов за один проход по свободным заказам
+        all_regions = {r for courier_id in courier_ids for r in regions[courier_id]}
+        buckets, windows = cls.get_free_orders(all_regions)
+        taken, claimed = set(), []
+        assign_time = time()
+        results = []  # пары (курьер, заказы) в порядке обработки
+        for courier in couriers:
+            orders = assigned[courier.id]
+            if not orders:
+                available_orders = cls.candidates(buckets, windows, taken,
+                                                  regions[courier.id],
+                                                  working_hours[courier.id])
+                orders = Assign.assign_orders(courier, available_orders)
+                taken.update(order.id for order in orders)
+                claimed += [(order.id, order.region) for order in orders]
+                if orders:
+                    courier.update_assignment_data(assign_time)
+            results.append((courier, orders))
+        result = assign_batch_response_schema(results)
+        assigned_ids = [courier.id for courier, orders in results if orders]
+        return result, courier_ids, assigned_ids, claimed
+
+    @validate_request(AssignBatchSchema)
+    def post(self):
+        # Назначение заказов и транзакция, как в POST /orders/assign
+        try:
+            outcome = run_with_retries(lambda: self.transaction(request.json))
+        except exc.IntegrityError:
+            msg = "Something went wrong..."
+            return msg, 400
+        if outcome is None:
+            msg = "Something went wrong..."
+            return msg, 503
+        result, courier_ids, assigned_ids, claimed = outcome
+
+        pool = current_pool()
+        if pool is not None:
+            pool.discard([order_id for order_id, _ in claimed])
+        candidates = current_candidates()
+        if candidates is not None:
+            candidates.orders_claimed(claimed)
+        notifier = current_notifier()
+        if notifier is not None:
+            notifier.couriers_changed(assigned_ids)
+        invalidate_couriers(courier_ids)
+
+        # Успешный ответ
+        return json_response(result), 200
@@ -0,0 +1,18 @@
+from .base import BaseView
+from manager.api.cache import current_cache
+from manager.api.schema import json_response
+
+
+class CacheStats(BaseView):
+    URL_PATH = "/stats/cache"
+    endpoint = "get_cache_stats"
+    methods = ['GET']
+
+    def get(self):
+        cache = current_cache()
+        if cache is None:
+            msg = "Cache is disabled"
+            return msg, 404
+
+        # Успешный ответ
+        return json_response(cache.stats()), 200
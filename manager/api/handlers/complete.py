@@ -1,12 +1,19 @@
-from flask import request, jsonify
+from flask import request
 from sqlalchemy import exc
 from datetime import datetime
 
 
-from manager.db.schema import db, Courier, Order
-from manager.api.schema import (DATETIME_FORMAT, complete_response_schema,
-                                CompleteSchema, validate_request)
+from manager.db.schema import db, Courier, Order, LeadTimeStats
+from manager.db.shards import find_order, region_shard
+from manager.api.schema import (DATETIME_FORMAT, NOT_ASSIGNED_ORDER,
+                                complete_response_schema, CompleteSchema,
+                                validate_request, json_response)
+from manager.api.metrics import count_validation_failure
+from manager.api.cache import invalidate_couriers
+from manager.api.precompute import current_candidates
+from manager.api.idempotency import idempotent
 from .base import BaseView
+from .assign import Assign
 
 
 class Complete(BaseView):
@@ -14,18 +21,26 @@ class Complete(BaseView):
     endpoint = "complete_orders"
     methods = ['POST']
 
+    @idempotent
     @validate_request(CompleteSchema)
     def post(self):
         # Завершение заказа
         courier = Courier.get(request.json["courier_id"])
         complete_time = datetime.strptime(request.json["complete_time"],
                                           DATETIME_FORMAT).timestamp()
-        order = Order.query.filter(Order.assigned_to(request.json["courier_id"]),
-                                   Order.id == request.json["order_id"]).first()
-
-        order.complete(courier.start_time, complete_time)
+        order = find_order(Order, request.json["order_id"])
+
+        with region_shard(order.region):
+            completed = order.complete(courier.id, courier.start_time, complete_time)
+        if not completed:
+            # Заказ уже выполнил параллельный запрос: ответ как
+            # на повторное выполнение
+            db.session.rollback()
+            count_validation_failure()
+            return json_response({"_schema": [NOT_ASSIGNED_ORDER]}), 400
+        LeadTimeStats.add(courier.id, order.region, order.lead_time)
         courier.start_time = complete_time
-        orders = Order.query.filter(Order.assigned_to(courier.id)).all()
+        orders = Assign.get_assigned_orders(courier)
         if not orders:
             courier.earnings += courier.salary
             courier.current_weight = 0
@@ -37,6 +52,11 @@ class Complete(BaseView):
             msg = "Something went wrong..."
             return msg, 400
 
+        invalidate_couriers([request.json["courier_id"]])
+        candidates = current_candidates()
+        if candidates is not None:
+            candidates.couriers_changed([request.json["courier_id"]])
+
         # Успешный ответ
         result = complete_response_schema(request.json)
-        return jsonify(result), 200
+        return json_response(result), 200
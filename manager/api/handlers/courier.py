@@ -1,12 +1,19 @@
-from flask import request, jsonify
-from sqlalchemy import and_
-from sqlalchemy import exc
+from flask import current_app, request
+from sqlalchemy import exc, func
+from time import time
 
 from .base import BaseView
+from .assign import Assign, is_locked
+from .assign_batch import AssignBatch
+from manager.api.pool import current_pool
+from manager.api.precompute import current_candidates
+from manager.api.notify import current_notifier
+from manager.api.cache import invalidate_couriers
 from manager.api.schema import (patch_response_schema,
-                                PatchCourierSchema, validate_request)
-from manager.db.schema import (db, Order, Region, WorkingHours,
-                               DeliveryHours, Courier)
+                                PatchCourierSchema, validate_request, json_response)
+from manager.db.schema import (db, Order, Region, WorkingHours, DeliveryHours,
+                               Courier, chunks, parse_interval)
+from manager.db.shards import current_shards, each_shard, release_orders
 
 
 class PatchCourier(BaseView):
@@ -19,25 +26,54 @@ class PatchCourier(BaseView):
         """Обновляет тип курьера, снимает с курьера заказы,
         которые он уже не сможет развести после обновления типа,
         и делает их доступными для выдачи другим курьерам.
+        Возвращает список пар (ID, вес) снятых заказов.
         """
         courier.type = courier_type
+        excess = courier.current_weight - courier.capacity
+        if excess <= 0:
+            return []
+        if current_shards() is not None:
+            return PatchCourier.release_excess(courier, excess)
 
-        # Снимаем с курьера заказы, пока он не перстанет быть перегруженным
-        assigned_orders_sorted = db.session.query(Order) \
-            .filter(Order.assigned_to(courier.id))\
-            .order_by(Order.weight.desc())
-        for order in assigned_orders_sorted:
-            if not courier.overloaded:
-                break
-            courier.current_weight -= order.weight
-            order.courier_id = None
-            order.status = "free"
+        # Заказы снимаются по убыванию веса, пока курьер перегружен:
+        # снимается заказ, если вес более тяжелых заказов меньше перегрузки
+        heavier = func.sum(Order.weight)\
+            .over(order_by=(Order.weight.desc(), Order.id)) - Order.weight
+        ranked = db.session.query(Order.id.label("id"), heavier.label("heavier"))\
+            .filter(Order.assigned_to(courier.id)).subquery()
+        released = Order.release(Order.id.in_(
+            db.session.query(ranked.c.id).filter(ranked.c.heavier < excess)))
+        courier.current_weight -= sum(weight for _, weight in released)
+        return released
+
+    @staticmethod
+    def release_excess(courier, excess):
+        """patch_courier_type для заказов, разбитых по шардам: заказы
+        курьера из всех шардов ранжируются так же, но в Python."""
+        orders = []
+        for _ in each_shard():
+            orders += db.session.query(Order.id, Order.weight)\
+                .filter(Order.assigned_to(courier.id)).all()
+        orders.sort(key=lambda order: (-order.weight, order.id))
+        heavier, excess_ids = 0, []
+        for order_id, weight in orders:
+            if heavier < excess:
+                excess_ids.append(order_id)
+            heavier += weight
+
+        released = []
+        for chunk in chunks(excess_ids):
+            released += release_orders(Order.id.in_(chunk),
+                                       Order.assigned_to(courier.id))
+        courier.current_weight -= sum(weight for _, weight in released)
+        return released
 
     @staticmethod
     def patch_regions(courier, regions):
         """Обновляет районы курьера, снимает с курьера заказы,
         которые он уже не сможет развести после обновления районов,
         и делает их доступными для выдачи другим курьерам.
+        Возвращает список пар (ID, вес) снятых заказов.
         """
         # Удаление старых районов, добавление новых
         db.session.query(Region).filter_by(courier_id=courier.id).delete()
@@ -45,52 +81,120 @@ class PatchCourier(BaseView):
             db.session.add(Region(courier.id, region))
 
         # Снятие с курьера неактуальных заказов
-        invalid_orders = db.session.query(Order) \
-            .filter(Order.outside_courier_regions(courier.id, regions),
-                    Order.assigned_to(courier.id)).all()
-        for order in invalid_orders:
-            order.courier_id = None
-            order.status = "free"
+        return release_orders(Order.outside_courier_regions(courier.id, regions),
+                              Order.assigned_to(courier.id))
 
     @staticmethod
     def patch_working_hours(courier, working_hours):
         """Обновляет график работы курьера, снимает с курьера заказы,
         которые он уже не сможет развести после обновления графика,
         и делает их доступными для выдачи другим курьерам.
+        Возвращает список пар (ID, вес) снятых заказов.
         """
         # Удаление старого графика, добавление нового
         db.session.query(WorkingHours).filter_by(courier_id=courier.id).delete()
-        for wh in working_hours:
-            start, end = wh.split('-')
+        intervals = [parse_interval(wh) for wh in working_hours]
+        for start, end in intervals:
             interval = WorkingHours(courier.id, start, end)
             db.session.add(interval)
 
-        # Снятие с курьера неактуальных заказов
-        working_hours = WorkingHours.get(courier.id)
+        # Снятие с курьера неактуальных заказов. В шардах нет графиков
+        # работы, поэтому новый график передается в запрос
+        if current_shards() is None:
+            deliverable = Order.deliverable_by(courier.id)
+        else:
+            deliverable = Order.deliverable_within(intervals)
+        return release_orders(Order.assigned_to(courier.id), ~deliverable)
 
-        valid_orders = db.session.query(Order) \
-            .join(DeliveryHours,
-                  and_(DeliveryHours.order_id == Order.id,
-                       DeliveryHours.intersects(working_hours)))\
-            .filter(Order.assigned_to(courier.id)).all()
+    @staticmethod
+    def get_released_orders(order_ids):
+        """Загружает снятые заказы, которые все еще свободны. Возвращает
+        заказы по районам в порядке возрастания веса и интервалы доставки
+        каждого заказа."""
+        buckets, windows = {}, {}
+        for chunk in chunks(list(order_ids)):
+            orders = Order.query.filter(Order.id.in_(chunk), Order.status == "free")
+            for order in orders:
+                buckets.setdefault(order.region, []).append(order)
+            rows = db.session.query(DeliveryHours.order_id, DeliveryHours.start_time,
+                                    DeliveryHours.end_time)\
+                .filter(DeliveryHours.order_id.in_(chunk)).all()
+            for order_id, start, end in rows:
+                windows.setdefault(order_id, []).append((start, end))
+        for bucket in buckets.values():
+            bucket.sort(key=lambda order: (order.weight, order.id))
+        return buckets, windows
 
-        orders = Order.query.filter(Order.assigned_to(courier.id))
+    @staticmethod
+    def reoffer(courier_id, order_ids):
+        """Сразу назначает снятые заказы курьерам без заказов из тех же
+        районов, кроме данного курьера, в порядке возрастания ID курьеров.
+        Заказы, которые не удалось назначить, остаются свободными."""
+        buckets, windows = PatchCourier.get_released_orders(order_ids)
+        total = sum(len(bucket) for bucket in buckets.values())
+        busy = db.session.query(Order.courier_id).filter(Order.status == "assigned")
+        idle_ids = [row[0] for row in db.session.query(Courier.id).distinct()
+                    .join(Region, Region.courier_id == Courier.id)
+                    .filter(Region.region.in_(list(buckets)), Courier.id != courier_id,
+                            Courier.id.notin_(busy))
+                    .order_by(Courier.id)]
 
-        invalid_orders = [order for order in orders if order not in valid_orders]
-        for order in invalid_orders:
-            order.courier_id = None
-            order.status = "free"
+        taken, claimed, assigned_ids = set(), [], []
+        assign_time = time()
+        for chunk in chunks(idle_ids):
+            if len(taken) == total:
+                break
+            couriers = Courier.query.filter(Courier.id.in_(chunk))\
+                .order_by(Courier.id).all()
+            regions, working_hours = AssignBatch.get_schedules(chunk)
+            for courier in couriers:
+                if len(taken) == total:
+                    break
+                available_orders = AssignBatch.candidates(
+                    buckets, windows, taken, regions[courier.id],
+                    working_hours[courier.id])
+                orders = Assign.assign_orders(courier, available_orders)
+                if orders:
+                    taken.update(order.id for order in orders)
+                    claimed += [(order.id, order.region) for order in orders]
+                    courier.update_assignment_data(assign_time)
+                    assigned_ids.append(courier.id)
+
+        # Транзакция
+        try:
+            db.session.commit()
+        except (exc.IntegrityError, exc.OperationalError) as error:
+            # Заказы остаются свободными до следующего назначения. Изменение
+            # курьера уже зафиксировано, поэтому ошибку, не вызванную
+            # блокировкой базы данных, достаточно записать в журнал
+            db.session.rollback()
+            if isinstance(error, exc.OperationalError) and not is_locked(error):
+                current_app.logger.exception("Re-offering released orders failed")
+            return
+
+        pool = current_pool()
+        if pool is not None:
+            pool.discard(taken)
+        candidates = current_candidates()
+        if candidates is not None:
+            candidates.orders_claimed(claimed)
+        notifier = current_notifier()
+        if notifier is not None:
+            notifier.couriers_changed(assigned_ids)
+        invalidate_couriers(assigned_ids)
 
     @validate_request(PatchCourierSchema)
     def patch(self, courier_id):
         # Изменение данных курьера
         courier = Courier.get(courier_id)
+        released = []
         if "courier_type" in request.json:
-            self.patch_courier_type(courier, request.json["courier_type"])
+            released += self.patch_courier_type(courier, request.json["courier_type"])
         if "regions" in request.json:
-            self.patch_regions(courier, request.json["regions"])
+            released += self.patch_regions(courier, request.json["regions"])
         if "working_hours" in request.json:
-            self.patch_working_hours(courier, request.json["working_hours"])
+            released += self.patch_working_hours(courier, request.json["working_hours"])
+        released_ids = [order_id for order_id, _ in released]
 
         # Транзакция
         try:
@@ -99,6 +203,26 @@ class PatchCourier(BaseView):
             msg = "Something went wrong..."
             return msg, 400
 
+        pool = current_pool()
+        if pool is not None:
+            pool.reload(released_ids)
+        candidates = current_candidates()
+        if candidates is not None:
+            candidates.couriers_changed([courier_id])
+            if released_ids:
+                candidates.orders_released(released_ids)
+        notifier = current_notifier()
+        if notifier is not None:
+            notifier.couriers_changed([courier_id])
+            if released_ids:
+                notifier.orders_released(released_ids)
+        invalidate_couriers([courier_id])
+
+        # Снятые заказы сразу предлагаются другим курьерам
+        if released_ids and current_app.config['PATCH_REOFFER']:
+            self.reoffer(courier_id, released_ids)
+
         # Успешный ответ
+        courier = Courier.get_profile(courier_id)
         result = patch_response_schema(courier)
-        return jsonify(result), 200
+        return json_response(result), 200
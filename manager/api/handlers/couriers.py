@@ -1,10 +1,12 @@
-from flask import request, jsonify
+from flask import request
 from sqlalchemy import exc
 
 from .base import BaseView
-from manager.db.schema import db, Courier, Region, WorkingHours
+from manager.api.idempotency import idempotent
+from manager.api.precompute import current_candidates
+from manager.db.schema import db, Courier
 from manager.api.schema import (couriers_response_schema,
-                                validate_request, CouriersSchema)
+                                validate_request, CouriersSchema, json_response)
 
 
 class Couriers(BaseView):
@@ -12,31 +14,23 @@ class Couriers(BaseView):
     endpoint = "post_couriers"
     methods = ['POST']
 
+    @idempotent
     @validate_request(CouriersSchema)
     def post(self):
         # Добавление курьеров в базу данных
-        for data in request.json["data"]:
-            courier = Courier(data["courier_id"], data["courier_type"])
-            db.session.add(courier)
-
-            for r in data["regions"]:
-                region = Region(data["courier_id"], r)
-                db.session.add(region)
-
-            for interval in data["working_hours"]:
-                start, end = interval.split('-')
-                working_hours = WorkingHours(data["courier_id"], start, end)
-                db.session.add(working_hours)
+        Courier.bulk_create(request.json["data"])
 
         # Транзакция
         try:
-            #courier = Courier(id=1, type="foot")
-            #db.session.add(courier)
             db.session.commit()
         except exc.IntegrityError:
             msg = "Something went wrong..."
             return msg, 400
 
+        candidates = current_candidates()
+        if candidates is not None:
+            candidates.couriers_changed([c["courier_id"] for c in request.json["data"]])
+
         # Успешный ответ
         result = couriers_response_schema(request.json["data"])
-        return jsonify(result), 201
+        return json_response(result), 201
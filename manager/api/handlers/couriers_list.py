@@ -0,0 +1,38 @@
+from sqlalchemy.orm import joinedload
+
+from .base import BaseView
+from manager.api.schema import (page_response_schema, courier_list_item,
+                                CouriersQuerySchema, validate_query, json_response)
+from manager.db.schema import Courier, Region
+
+
+class CouriersList(BaseView):
+    """Постраничный вывод курьеров по возрастанию ID с фильтрами по типу
+    и району. Каждому фильтру соответствует индекс (поле, id), поэтому
+    страница с любым after стоит столько же, сколько первая."""
+    URL_PATH = "/couriers"
+    endpoint = "get_couriers"
+    methods = ['GET']
+
+    @validate_query(CouriersQuerySchema)
+    def get(self, query):
+        couriers = Courier.query
+        after = Courier.id
+        if "region" in query:
+            # Страница читается по индексу районов (район, ID курьера)
+            couriers = couriers.join(Region, Region.courier_id == Courier.id)\
+                .filter(Region.region == query["region"])
+            after = Region.courier_id
+        if "type" in query:
+            couriers = couriers.filter(Courier.type == query["type"])
+        if "after" in query:
+            couriers = couriers.filter(after > query["after"])
+        couriers = couriers\
+            .options(joinedload(Courier.regions), joinedload(Courier.working_hours))\
+            .order_by(Courier.id).limit(query["limit"]).all()
+
+        # Успешный ответ
+        result = page_response_schema("couriers",
+                                      [courier_list_item(c) for c in couriers],
+                                      query["limit"])
+        return json_response(result), 200
@@ -0,0 +1,17 @@
+from .base import BaseView
+from manager.api.metrics import CONTENT_TYPE, current_metrics
+
+
+class Metrics(BaseView):
+    URL_PATH = "/metrics"
+    endpoint = "get_metrics"
+    methods = ['GET']
+
+    def get(self):
+        metrics = current_metrics()
+        if metrics is None:
+            msg = "Metrics are disabled"
+            return msg, 404
+
+        # Успешный ответ
+        return metrics.render(), 200, {'Content-Type': CONTENT_TYPE}
@@ -1,10 +1,15 @@
-from flask import request, jsonify
+from flask import request
 from sqlalchemy import exc
 
 from .base import BaseView
+from manager.api.idempotency import idempotent
+from manager.api.pool import current_pool
+from manager.api.precompute import current_candidates
+from manager.api.notify import current_notifier
 from manager.api.schema import (orders_response_schema,
-                                OrdersSchema, validate_request)
-from manager.db.schema import db, Order, DeliveryHours
+                                OrdersSchema, validate_request, json_response)
+from manager.db.schema import db
+from manager.db.shards import create_orders
 
 
 class Orders(BaseView):
@@ -12,25 +17,29 @@ class Orders(BaseView):
     endpoint = "post_orders"
     methods = ['POST']
 
+    @idempotent
     @validate_request(OrdersSchema)
     def post(self):
-        # Добавление заказов в базу данных
-        for data in request.json["data"]:
-            order = Order(data["order_id"], data["weight"], data["region"])
-            db.session.add(order)
-
-            for interval in data["delivery_hours"]:
-                start, end = interval.split('-')
-                dh = DeliveryHours(data["order_id"], start, end)
-                db.session.add(dh)
-
-        # Транзакция
+        # Добавление заказов в базу данных и транзакция. При разбиении
+        # по шардам ID, занятый в другом запросе, вызывает
+        # IntegrityError уже при добавлении
         try:
+            create_orders(request.json["data"])
             db.session.commit()
         except exc.IntegrityError:
             msg = "Something went wrong..."
             return msg, 400
 
+        pool = current_pool()
+        if pool is not None:
+            pool.add_orders(request.json["data"])
+        candidates = current_candidates()
+        if candidates is not None:
+            candidates.orders_added(request.json["data"])
+        notifier = current_notifier()
+        if notifier is not None:
+            notifier.orders_added(request.json["data"])
+
         # Успешный ответ
         result = orders_response_schema(request.json["data"])
-        return jsonify(result), 201
+        return json_response(result), 201
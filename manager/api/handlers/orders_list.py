@@ -0,0 +1,70 @@
+from sqlalchemy import literal
+
+from .base import BaseView
+from manager.api.schema import (page_response_schema, order_list_item,
+                                OrdersQuerySchema, validate_query, json_response)
+from manager.db.schema import (db, Order, DeliveryHours, ArchivedOrder,
+                               ArchivedDeliveryHours, format_interval)
+from manager.db.shards import each_shard
+
+
+class OrdersList(BaseView):
+    """Постраничный вывод заказов по возрастанию ID с фильтрами по статусу,
+    району и курьеру. Выполненные заказы выводятся вместе с перенесенными
+    в архив. Каждому фильтру соответствует индекс (поле, id), поэтому
+    страница с любым after стоит столько же, сколько первая."""
+    URL_PATH = "/orders"
+    endpoint = "get_orders"
+    methods = ['GET']
+
+    @staticmethod
+    def get_rows(model, status, query):
+        """Возвращает не больше limit строк (ID, вес, район, статус, ID курьера)
+        заказов данной модели после ID after."""
+        criteria = []
+        if "after" in query:
+            criteria.append(model.id > query["after"])
+        for name in ("region", "courier_id"):
+            if name in query:
+                criteria.append(getattr(model, name) == query[name])
+        if "status" in query and model is Order:
+            criteria.append(Order.status == query["status"])
+        return db.session.query(model.id, model.weight, model.region,
+                                status, model.courier_id)\
+            .filter(*criteria).order_by(model.id).limit(query["limit"]).all()
+
+    @staticmethod
+    def get_delivery_hours(model, order_ids):
+        """Возвращает словарь ID заказа -> список интервалов доставки."""
+        delivery_hours = {}
+        if order_ids:
+            rows = db.session.query(model.order_id, model.start_time, model.end_time)\
+                .filter(model.order_id.in_(order_ids)).order_by(model.id).all()
+            for order_id, start, end in rows:
+                delivery_hours.setdefault(order_id, []).append(
+                    format_interval(start, end))
+        return delivery_hours
+
+    @validate_query(OrdersQuerySchema)
+    def get(self, query):
+        # Текущие заказы и, если нужны выполненные, заказы из архива
+        # в каждом шарде (с фильтром по району - в шарде района)
+        regions = [query["region"]] if "region" in query else None
+        rows, delivery_hours = [], {}
+        for _ in each_shard(regions):
+            current = self.get_rows(Order, Order.status, query)
+            delivery_hours.update(self.get_delivery_hours(
+                DeliveryHours, [row[0] for row in current]))
+            rows += current
+            if query.get("status", "completed") == "completed":
+                archived = self.get_rows(ArchivedOrder, literal("completed"), query)
+                delivery_hours.update(self.get_delivery_hours(
+                    ArchivedDeliveryHours, [row[0] for row in archived]))
+                rows += archived
+        rows = sorted(rows)[:query["limit"]]
+
+        # Успешный ответ
+        orders = [order_list_item(*row, delivery_hours.get(row[0], []))
+                  for row in rows]
+        result = page_response_schema("orders", orders, query["limit"])
+        return json_response(result), 200
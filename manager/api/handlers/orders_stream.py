@@ -0,0 +1,93 @@
+from flask import current_app, request
+from sqlalchemy import exc
+
+from .base import BaseView
+from manager.api.pool import current_pool
+from manager.api.precompute import current_candidates
+from manager.api.notify import current_notifier
+from manager.api.serialization import current_json
+from manager.api.schema import (orders_stream_response_schema,
+                                validate_orders_chunk, json_response)
+from manager.db.schema import db
+from manager.db.shards import create_orders
+
+
+class OrdersStream(BaseView):
+    """Загрузка заказов потоком NDJSON: по одному заказу в формате
+    POST /orders на строку. Заказы проверяются и добавляются частями
+    по ORDERS_STREAM_CHUNK_SIZE, каждая часть - в своей транзакции,
+    поэтому в памяти находится не больше одной части. Корректные заказы
+    добавляются, даже если в потоке есть некорректные."""
+    URL_PATH = "/orders/stream"
+    endpoint = "post_orders_stream"
+    methods = ['POST']
+
+    @staticmethod
+    def read_chunks(stream, chunk_size):
+        """Разбирает строки потока и возвращает их частями: пары из списка
+        заказов и списка ошибок для строк, не содержащих заказ. Часть
+        завершается после chunk_size заказов, строки без заказа относятся
+        к части, в которой они встретились."""
+        loads = current_json().loads
+        chunk, invalid = [], []
+        for line_number, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                order = loads(line)
+            except ValueError:
+                order = None
+            if not isinstance(order, dict) or "order_id" not in order:
+                invalid.append({"id": None, "line": line_number,
+                                "_schema": ["Order input data is invalid."]})
+                continue
+            chunk.append(order)
+            if len(chunk) == chunk_size:
+                yield chunk, invalid
+                chunk, invalid = [], []
+        if chunk or invalid:
+            yield chunk, invalid
+
+    @staticmethod
+    def insert_chunk(orders):
+        """Добавляет проверенные заказы в отдельной транзакции."""
+        try:
+            create_orders(orders)
+            db.session.commit()
+        except exc.IntegrityError:
+            db.session.rollback()
+            return False
+
+        pool = current_pool()
+        if pool is not None:
+            pool.add_orders(orders)
+        candidates = current_candidates()
+        if candidates is not None:
+            candidates.orders_added(orders)
+        notifier = current_notifier()
+        if notifier is not None:
+            notifier.orders_added(orders)
+        return True
+
+    def post(self):
+        chunk_size = current_app.config['ORDERS_STREAM_CHUNK_SIZE']
+        errors, chunks = [], []
+        for number, (orders, invalid) in enumerate(
+                self.read_chunks(request.stream, chunk_size)):
+            valid, rejected = validate_orders_chunk(orders) if orders else ([], [])
+            if valid and not self.insert_chunk(valid):
+                rejected += [{"id": order["order_id"],
+                              "_schema": ["Something went wrong..."]}
+                             for order in valid]
+                valid = []
+            errors += invalid + rejected
+            # received = inserted + rejected + invalid: строки без заказа
+            # учитываются в части, в которой они встретились
+            chunks.append({"chunk": number, "received": len(orders) + len(invalid),
+                           "inserted": len(valid), "rejected": len(rejected),
+                           "invalid": len(invalid)})
+
+        # Ответ: 201, если добавлены все заказы, иначе 400 со списком ошибок
+        result = orders_stream_response_schema(chunks, errors)
+        return json_response(result), 400 if errors else 201
@@ -0,0 +1,101 @@
+from flask import current_app, request, stream_with_context
+
+from .base import BaseView
+from manager.api.asgi import ASYNC_REQUEST
+from manager.api.notify import current_notifier
+from manager.api.serialization import current_json
+from manager.api.schema import (wait_response_schema, validate_request,
+                                CourierIdSchema, WaitQuerySchema,
+                                validate_query, json_response)
+
+
+EVENT_STREAM = 'text/event-stream'
+KEEP_ALIVE = ': keep-alive\n\n'
+
+
+def sse_event(name, data):
+    """Событие server-sent events. Тело сериализуется провайдером JSON
+    приложения, как ответ json_response: каждая строка тела передается
+    в своем поле data, и клиент собирает из них то же тело."""
+    body = current_json().dumps(data).decode().rstrip('\n')
+    return 'event: %s\n%s\n' % (name, ''.join('data: %s\n' % line
+                                              for line in body.split('\n')))
+
+
+class OrdersWait(BaseView):
+    """Ожидание заказов вместо периодических POST /orders/assign.
+    Запрос отвечает, как только у курьера появятся назначенные заказы
+    или свободные заказы, которые ему можно выдать, либо по истечении
+    timeout секунд. С заголовком Accept: text/event-stream ответ -
+    поток server-sent events: событие orders отправляется при каждом
+    появлении подходящих заказов, поток закрывается через timeout секунд."""
+    URL_PATH = "/couriers/<int:courier_id>/orders/wait"
+    endpoint = "wait_orders"
+    methods = ['GET']
+
+    @staticmethod
+    def next_event(orders_event, available, woken, ready):
+        """Событие после проверки: orders, если у курьера появились заказы,
+        иначе комментарий, который поддерживает соединение открытым."""
+        if available and (woken or not ready):
+            return orders_event
+        return KEEP_ALIVE
+
+    @classmethod
+    def events(cls, notifier, courier_id, timeout):
+        orders_event = sse_event('orders', wait_response_schema(True))
+        ready = False
+        for available, woken in notifier.checks(courier_id, timeout):
+            yield cls.next_event(orders_event, available, woken, ready)
+            ready = available
+
+    @classmethod
+    async def events_async(cls, notifier, asgi, courier_id, timeout, orders_event):
+        """events для цикла событий ASGI."""
+        ready = False
+        async for available, woken in notifier.checks_async(courier_id, timeout,
+                                                            asgi.run):
+            yield cls.next_event(orders_event, available, woken, ready).encode()
+            ready = available
+
+    @staticmethod
+    async def wait_async(notifier, asgi, courier_id, timeout, bodies):
+        """Долгий опрос для цикла событий ASGI: тело ответа."""
+        yield bodies[await notifier.wait_async(courier_id, timeout, asgi.run)]
+
+    @validate_request(CourierIdSchema)
+    @validate_query(WaitQuerySchema)
+    def get(self, courier_id, query):
+        notifier = current_notifier()
+        if notifier is None:
+            msg = "Waiting for orders is disabled"
+            return msg, 404
+
+        # В режиме ASGI ожидание выполняется в цикле событий, не занимая
+        # поток пула (см. manager.api.asgi), тело ответа передается отдельно
+        asgi = request.environ.get(ASYNC_REQUEST)
+        timeout = query["timeout"]
+
+        if request.accept_mimetypes.best_match(
+                ['application/json', EVENT_STREAM]) == EVENT_STREAM:
+            if asgi is None:
+                events = stream_with_context(self.events(notifier, courier_id, timeout))
+            else:
+                asgi.stream(self.events_async(
+                    notifier, asgi, courier_id, timeout,
+                    sse_event('orders', wait_response_schema(True))))
+                events = iter(())
+            response = current_app.response_class(events, mimetype=EVENT_STREAM)
+            return response, 200, {'Cache-Control': 'no-cache'}
+
+        if asgi is not None:
+            bodies = {ready: current_json().dumps(wait_response_schema(ready))
+                      for ready in (False, True)}
+            asgi.stream(self.wait_async(notifier, asgi, courier_id, timeout, bodies))
+            response = current_app.response_class(
+                iter(()), mimetype=current_app.config['JSONIFY_MIMETYPE'])
+            return response, 200
+
+        # Успешный ответ
+        result = wait_response_schema(notifier.wait(courier_id, timeout))
+        return json_response(result), 200
@@ -0,0 +1,164 @@
+"""
+Модуль содержит поддержку заголовка Idempotency-Key.
+
+Клиент, повторяющий запрос после таймаута, передает в заголовке тот же
+ключ. Ответ на первый запрос с ключом сохраняется в таблице
+idempotencykeys той же базы данных вместе с хэшем тела запроса, и повтор
+получает сохраненный ответ без валидации и без обращения к таблицам
+заказов и курьеров. Повтор ключа с другим телом или на другой обработчик
+отклоняется.
+
+Ключ занимается отдельной транзакцией до выполнения обработчика, ответ
+записывается после. Повтор, пока запрос с ключом выполняется, получает
+409; если процесс завершился или запись ответа не удалась после
+фиксации транзакции обработчика, ключ остается занятым до истечения
+срока, и запрос не выполняется повторно. Ответы с кодом 5xx
+не сохраняются, ключ освобождается: такой запрос можно повторить.
+
+Поддержка включается настройкой IDEMPOTENCY_KEYS, записи хранятся
+IDEMPOTENCY_TTL секунд. Устаревшие записи удаляются при каждом
+SWEEP_EVERY-м сохранении.
+"""
+import zlib
+from functools import wraps
+from hashlib import blake2b
+from itertools import count
+from time import time
+
+from flask import current_app, request
+from sqlalchemy import exc
+
+from manager.db.schema import db, IdempotencyKey
+
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+SWEEP_EVERY = 100
+
+# Код ответа в записи ключа, запрос с которым еще выполняется
+IN_PROGRESS = 0
+
+
+def current_store():
+    """Возвращает хранилище ответов приложения или None, если оно отключено."""
+    return current_app.extensions.get('idempotency')
+
+
+class IdempotencyStore:
+    """Сохраненные ответы на запросы с ключом идемпотентности."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._stored = count(1)
+
+    @staticmethod
+    def fingerprint(data):
+        return blake2b(data, digest_size=16).digest()
+
+    def get(self, key):
+        """Возвращает действующую запись для ключа или None."""
+        return IdempotencyKey.query\
+            .filter(IdempotencyKey.key == key, IdempotencyKey.expires >= time())\
+            .first()
+
+    def reserve(self, key, endpoint, fingerprint):
+        """Занимает ключ для выполняемого запроса. Если ключ уже занят
+        (в том числе параллельным запросом), возвращает его запись,
+        иначе None."""
+        now = time()
+        record = IdempotencyKey(key=key, endpoint=endpoint, fingerprint=fingerprint,
+                                status=IN_PROGRESS, mimetype='', body=b'',
+                                expires=now + self.ttl)
+        db.session.query(IdempotencyKey)\
+            .filter(IdempotencyKey.key == key, IdempotencyKey.expires < now)\
+            .delete(synchronize_session=False)
+        db.session.add(record)
+        try:
+            db.session.commit()
+        except exc.IntegrityError:
+            db.session.rollback()
+            return self.get(key)
+        return None
+
+    def set(self, key, response):
+        """Сохраняет ответ в записи занятого ключа."""
+        # Незафиксированные изменения обработчика к этому моменту не нужны
+        db.session.rollback()
+        db.session.query(IdempotencyKey)\
+            .filter(IdempotencyKey.key == key, IdempotencyKey.status == IN_PROGRESS)\
+            .update({"status": response.status_code, "mimetype": response.mimetype,
+                     "body": zlib.compress(response.get_data())},
+                    synchronize_session=False)
+        db.session.commit()
+
+        if next(self._stored) % SWEEP_EVERY == 0:
+            self.sweep()
+
+    def release(self, key):
+        """Освобождает ключ запроса, ответ на который не сохраняется."""
+        db.session.rollback()
+        db.session.query(IdempotencyKey)\
+            .filter(IdempotencyKey.key == key, IdempotencyKey.status == IN_PROGRESS)\
+            .delete(synchronize_session=False)
+        db.session.commit()
+
+    def sweep(self):
+        """Удаляет устаревшие записи."""
+        db.session.query(IdempotencyKey)\
+            .filter(IdempotencyKey.expires < time())\
+            .delete(synchronize_session=False)
+        db.session.commit()
+
+
+def stored_response(record, endpoint, fingerprint):
+    """Возвращает сохраненный ответ или ошибку, если ключ использован
+    для другого запроса или запрос с ключом еще выполняется."""
+    if record.endpoint != endpoint or record.fingerprint != fingerprint:
+        msg = "Idempotency key was used with a different request"
+        return msg, 422
+    if record.status == IN_PROGRESS:
+        msg = "A request with this idempotency key is in progress"
+        return msg, 409
+    response = current_app.response_class(zlib.decompress(record.body),
+                                          mimetype=record.mimetype)
+    return response, record.status
+
+
+def idempotent(original):
+    """Декоратор обработчика: при наличии заголовка Idempotency-Key
+    отдает сохраненный ответ на запрос с тем же ключом или занимает ключ,
+    выполняет запрос и сохраняет ответ."""
+    @wraps(original)
+    def wrapper(*args, **kwargs):
+        store = current_store()
+        key = request.headers.get(HEADER)
+        if store is None or key is None:
+            return original(*args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            msg = "Idempotency key is invalid"
+            return msg, 400
+
+        endpoint = request.endpoint
+        fingerprint = store.fingerprint(request.get_data())
+        record = store.get(key) or store.reserve(key, endpoint, fingerprint)
+        if record is not None:
+            return stored_response(record, endpoint, fingerprint)
+
+        try:
+            response = current_app.make_response(original(*args, **kwargs))
+        except Exception:
+            store.release(key)
+            raise
+        if response.status_code >= 500:
+            store.release(key)
+            return response
+        try:
+            store.set(key, response)
+        except exc.OperationalError:
+            # Транзакция обработчика уже зафиксирована: ключ остается
+            # занятым, и повтор не выполнит запрос еще раз
+            db.session.rollback()
+            current_app.logger.exception("Saving idempotent response failed")
+        return response
+
+    return wrapper
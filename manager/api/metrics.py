@@ -0,0 +1,183 @@
+"""
+Модуль содержит метрики сервиса в текстовом формате Prometheus.
+
+Метрики включаются настройкой METRICS и собираются для каждого запроса:
+    - гистограмма времени обработки по обработчикам;
+    - гистограммы количества SQL-запросов и времени работы базы данных
+      на один запрос (по событиям движка SQLAlchemy);
+    - счетчики ответов по кодам, ошибок валидации и откатов транзакций
+      из-за IntegrityError.
+Метрики хранятся в памяти процесса: при запуске на gunicorn каждый
+процесс-обработчик отдает по GET /metrics свои значения.
+"""
+from bisect import bisect_left
+from threading import Lock, local
+from time import perf_counter
+
+from flask import current_app, request
+from sqlalchemy import event, exc
+
+
+# Границы корзин гистограмм
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENTS_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def current_metrics():
+    """Возвращает метрики приложения или None, если они отключены."""
+    return current_app.extensions.get('metrics')
+
+
+def count_validation_failure():
+    """Учитывает запрос, отклоненный при валидации."""
+    metrics = current_metrics()
+    if metrics is not None:
+        metrics.inc('validation_failures', request.endpoint)
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами корзин. Счетчики корзин
+    не накопительные: суммы считаются только при выводе."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            yield '%s_bucket{%sle="%s"} %d' % (name, labels, bound, total)
+        yield '%s_sum{%s} %s' % (name, labels.rstrip(','), self.sum)
+        yield '%s_count{%s} %d' % (name, labels.rstrip(','), self.count)
+
+
+class Metrics:
+    """Метрики процесса. Данные о SQL-запросах текущего запроса хранятся
+    в локальных данных потока: запрос обрабатывается одним потоком."""
+
+    HISTOGRAMS = (
+        ('request_duration_seconds', "Request processing time.", LATENCY_BUCKETS),
+        ('request_sql_statements', "SQL statements per request.", STATEMENTS_BUCKETS),
+        ('request_db_seconds', "Database time per request.", LATENCY_BUCKETS),
+    )
+    COUNTERS = (
+        ('validation_failures', "Requests rejected by validation."),
+        ('integrity_errors', "Transactions rolled back on IntegrityError."),
+    )
+
+    def __init__(self, prefix='manager'):
+        self.prefix = prefix
+        self._lock = Lock()
+        self._local = local()
+        # имя -> {обработчик -> гистограмма или значение счетчика}
+        self._histograms = {name: {} for name, _, _ in self.HISTOGRAMS}
+        self._buckets = {name: buckets for name, _, buckets in self.HISTOGRAMS}
+        self._counters = {name: {} for name, _ in self.COUNTERS}
+        self._responses = {}  # (обработчик, код ответа) -> количество
+
+    def observe(self, name, endpoint, value):
+        with self._lock:
+            histogram = self._histograms[name].get(endpoint)
+            if histogram is None:
+                histogram = self._histograms[name][endpoint] = \
+                    Histogram(self._buckets[name])
+            histogram.observe(value)
+
+    def inc(self, name, endpoint):
+        with self._lock:
+            counters = self._counters[name]
+            counters[endpoint] = counters.get(endpoint, 0) + 1
+
+    def init_app(self, app, engine):
+        """Подключает сбор метрик к запросам приложения и к движку
+        базы данных."""
+        app.before_request(self.start_request)
+        app.teardown_request(self.finish_request)
+        app.after_request(self.count_response)
+        self.watch_engine(engine)
+
+    def watch_engine(self, engine):
+        """Подключает сбор метрик к движку базы данных."""
+        event.listen(engine, 'before_cursor_execute', self.before_execute)
+        event.listen(engine, 'after_cursor_execute', self.after_execute)
+        event.listen(engine, 'handle_error', self.handle_error)
+
+    def start_request(self):
+        # [время начала, количество SQL-запросов, время в базе данных]
+        self._local.request = [perf_counter(), 0, 0.0]
+
+    def count_response(self, response):
+        key = (request.endpoint, response.status_code)
+        with self._lock:
+            self._responses[key] = self._responses.get(key, 0) + 1
+        return response
+
+    def finish_request(self, exception=None):
+        state = getattr(self._local, 'request', None)
+        if state is None:
+            return
+        self._local.request = None
+        started, statements, db_time = state
+        endpoint = request.endpoint
+        self.observe('request_duration_seconds', endpoint, perf_counter() - started)
+        self.observe('request_sql_statements', endpoint, statements)
+        self.observe('request_db_seconds', endpoint, db_time)
+
+    def before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if getattr(self._local, 'request', None) is not None:
+            conn.info.setdefault('metrics_start', []).append(perf_counter())
+
+    def after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        state = getattr(self._local, 'request', None)
+        if state is not None and conn.info.get('metrics_start'):
+            state[1] += 1
+            state[2] += perf_counter() - conn.info['metrics_start'].pop()
+
+    def handle_error(self, context):
+        state = getattr(self._local, 'request', None)
+        if state is not None and context.connection is not None \
+                and context.connection.info.get('metrics_start'):
+            # Время запроса с ошибкой тоже учитывается
+            state[1] += 1
+            state[2] += perf_counter() - context.connection.info['metrics_start'].pop()
+        if isinstance(context.sqlalchemy_exception, exc.IntegrityError):
+            endpoint = request.endpoint if state is not None else None
+            self.inc('integrity_errors', endpoint)
+
+    def render(self):
+        """Возвращает метрики в текстовом формате Prometheus."""
+        lines = []
+        with self._lock:
+            for name, help_text, _ in self.HISTOGRAMS:
+                full_name = '%s_%s' % (self.prefix, name)
+                lines.append('# HELP %s %s' % (full_name, help_text))
+                lines.append('# TYPE %s histogram' % full_name)
+                for endpoint, histogram in sorted(self._histograms[name].items(),
+                                                  key=lambda item: str(item[0])):
+                    lines.extend(histogram.lines(full_name,
+                                                 'endpoint="%s",' % endpoint))
+            for name, help_text in self.COUNTERS:
+                full_name = '%s_%s_total' % (self.prefix, name)
+                lines.append('# HELP %s %s' % (full_name, help_text))
+                lines.append('# TYPE %s counter' % full_name)
+                for endpoint, value in sorted(self._counters[name].items(),
+                                              key=lambda item: str(item[0])):
+                    lines.append('%s{endpoint="%s"} %d' % (full_name, endpoint, value))
+            full_name = '%s_responses_total' % self.prefix
+            lines.append('# HELP %s Responses by status code.' % full_name)
+            lines.append('# TYPE %s counter' % full_name)
+            for (endpoint, status), value in sorted(self._responses.items(),
+                                                    key=lambda item: str(item[0])):
+                lines.append('%s{endpoint="%s",status="%d"} %d'
+                             % (full_name, endpoint, status, value))
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,253 @@
+"""
+Модуль содержит ожидание курьером заказов для GET /couriers/<id>/orders/wait.
+
+Запрос на ожидание не опрашивает базу данных в цикле: он регистрирует
+ожидающего (районы, график работы, свободную грузоподъемность курьера)
+и блокируется на threading.Event, отдав соединение с базой данных в пул.
+Обработчики после фиксации транзакции сообщают о добавленных
+и освобожденных заказах и о курьерах, которым назначены заказы или
+изменены данные. Пробуждаются только ожидающие, которым заказ подходит
+по району, времени доставки и весу; пробужденный запрос проверяет
+наличие заказов одним запросом к базе данных.
+
+Ожидающие хранятся в памяти процесса: о заказах, добавленных в другом
+процессе, ожидающий узнает при проверке раз в ORDERS_WAIT_RECHECK секунд.
+В режиме WSGI ожидающий запрос занимает поток сервера на все время
+ожидания. В режиме ASGI (checks_async) ожидающий ждет asyncio.Event
+в цикле событий, а поток пула занимают только проверки.
+"""
+import asyncio
+from threading import Event, Lock
+from time import monotonic
+
+from flask import current_app
+from sqlalchemy import and_, exists, or_
+
+from manager.api.pool import intersects
+from manager.db.schema import (db, Courier, Order, DeliveryHours,
+                               chunks, parse_interval)
+from manager.db.shards import current_shards, each_shard
+
+
+def current_notifier():
+    """Возвращает ожидающих заказы приложения или None, если ожидание отключено."""
+    return current_app.extensions.get('orders_notifier')
+
+
+class Waiter:
+    """Запрос, ожидающий заказы для курьера. Если задан цикл событий
+    loop, ожидающий ждет в нем asyncio.Event, иначе threading.Event."""
+
+    def __init__(self, courier, loop=None):
+        self.courier_id = courier.id
+        self.regions = set(courier.get_regions)
+        self.intervals = [(wh.start_time, wh.end_time) for wh in courier.working_hours]
+        self.capacity = courier.capacity - (courier.current_weight or 0)
+        self.loop = loop
+        self.event = Event() if loop is None else asyncio.Event()
+
+    def wake(self):
+        """Пробуждает ожидающего; вызывается из любого потока."""
+        if self.loop is None:
+            self.event.set()
+        elif not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.event.set)
+
+    def wait(self, timeout):
+        """Ждет пробуждения не дольше timeout секунд."""
+        return self.event.wait(timeout)
+
+    async def wait_async(self, timeout):
+        """Ждет пробуждения в цикле событий не дольше timeout секунд."""
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def matches(self, weight, region, windows):
+        return (region in self.regions and weight <= self.capacity
+                and intersects(windows, self.intervals))
+
+    def orders_ready(self):
+        """Возвращает, есть ли у курьера назначенные заказы или свободные
+        заказы, которые ему можно выдать."""
+        shards = current_shards()
+        if shards is None:
+            return db.session.query(or_(
+                exists().where(Order.assigned_to(self.courier_id)),
+                exists().where(and_(Order.available(list(self.regions)),
+                                    Order.deliverable_by(self.courier_id),
+                                    Order.weight <= self.capacity)))).scalar()
+        # В шардах нет графиков работы: проверяется сохраненный график
+        return any(db.session.query(or_(
+            exists().where(Order.assigned_to(self.courier_id)),
+            exists().where(and_(Order.available(regions),
+                                Order.deliverable_within(self.intervals),
+                                Order.weight <= self.capacity)))).scalar()
+            for regions in shards.each(self.regions))
+
+
+class OrdersNotifier:
+    def __init__(self, recheck=None):
+        self.recheck = recheck
+        self._lock = Lock()
+        self._regions = {}   # район -> множество ожидающих
+        self._couriers = {}  # ID курьера -> множество ожидающих
+
+    def subscribe(self, courier, loop=None):
+        waiter = Waiter(courier, loop)
+        with self._lock:
+            for region in waiter.regions:
+                self._regions.setdefault(region, set()).add(waiter)
+            self._couriers.setdefault(waiter.courier_id, set()).add(waiter)
+        return waiter
+
+    def unsubscribe(self, waiter):
+        with self._lock:
+            for region in waiter.regions:
+                self._regions[region].discard(waiter)
+                if not self._regions[region]:
+                    del self._regions[region]
+            self._couriers[waiter.courier_id].discard(waiter)
+            if not self._couriers[waiter.courier_id]:
+                del self._couriers[waiter.courier_id]
+
+    def waiting(self):
+        """Количество ожидающих запросов."""
+        with self._lock:
+            return sum(len(waiters) for waiters in self._couriers.values())
+
+    # События обработчиков
+
+    def orders_added(self, orders_data):
+        """Новые заказы из запроса на добавление заказов."""
+        self._notify((data["weight"], data["region"],
+                      [parse_interval(i) for i in data["delivery_hours"]])
+                     for data in orders_data)
+
+    def orders_released(self, order_ids):
+        """Заказы, снова ставшие свободными. Заказы загружаются из базы
+        данных, только если есть ожидающие."""
+        if not self._couriers:
+            return
+        orders = []
+        for _ in each_shard():
+            for chunk in chunks(list(order_ids)):
+                windows = {}
+                rows = db.session.query(DeliveryHours.order_id, DeliveryHours.start_time,
+                                        DeliveryHours.end_time)\
+                    .filter(DeliveryHours.order_id.in_(chunk)).all()
+                for order_id, start, end in rows:
+                    windows.setdefault(order_id, []).append((start, end))
+                rows = db.session.query(Order.id, Order.weight, Order.region)\
+                    .filter(Order.id.in_(chunk), Order.status == "free").all()
+                orders += [(weight, region, windows.get(order_id, ()))
+                           for order_id, weight, region in rows]
+        self._notify(orders)
+
+    def couriers_changed(self, courier_ids):
+        """Курьерам назначены заказы или изменены их данные."""
+        with self._lock:
+            for courier_id in courier_ids:
+                for waiter in self._couriers.get(courier_id, ()):
+                    waiter.wake()
+
+    def _notify(self, orders):
+        with self._lock:
+            if not self._couriers:
+                return
+            for weight, region, windows in orders:
+                for waiter in self._regions.get(region, ()):
+                    if not waiter.event.is_set() and waiter.matches(weight, region, windows):
+                        waiter.wake()
+
+    # Ожидание
+
+    def check(self, courier_id, loop=None):
+        """Регистрирует ожидающего и проверяет наличие заказов у курьера.
+        Возвращает ожидающего и результат проверки. Соединение с базой
+        данных не удерживается во время ожидания."""
+        waiter = self.subscribe(Courier.get_profile(courier_id), loop)
+        try:
+            ready = waiter.orders_ready()
+            db.session.close()
+        except BaseException:
+            self.unsubscribe(waiter)
+            raise
+        return waiter, ready
+
+    def _discard_checked(self, future):
+        if not future.cancelled() and future.exception() is None:
+            self.unsubscribe(future.result()[0])
+
+    def _remaining(self, deadline):
+        """Время до следующей проверки или None, если время вышло."""
+        remaining = deadline - monotonic()
+        if remaining <= 0:
+            return None
+        if self.recheck is not None:
+            remaining = min(remaining, self.recheck)
+        return remaining
+
+    def checks(self, courier_id, timeout):
+        """Проверяет наличие заказов у курьера сразу, после каждого
+        пробуждения и раз в recheck секунд, пока не пройдет timeout секунд.
+        Возвращает пары (заказы есть, проверка после пробуждения)."""
+        deadline = monotonic() + timeout
+        woken = False
+        while True:
+            waiter, ready = self.check(courier_id)
+            try:
+                yield ready, woken
+                remaining = self._remaining(deadline)
+                if remaining is None:
+                    return
+                woken = waiter.wait(remaining)
+            finally:
+                self.unsubscribe(waiter)
+
+    async def checks_async(self, courier_id, timeout, run):
+        """checks для цикла событий ASGI: проверки выполняются
+        в потоке пула (run(функция, *аргументы) возвращает asyncio.Future
+        результата), ожидание - в цикле событий."""
+        loop = asyncio.get_running_loop()
+        deadline = monotonic() + timeout
+        woken = False
+        while True:
+            future = run(self.check, courier_id, loop)
+            try:
+                waiter, ready = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # Проверка в потоке завершится и после отмены запроса:
+                # зарегистрированный ею ожидающий удаляется
+                future.add_done_callback(self._discard_checked)
+                raise
+            try:
+                yield ready, woken
+                remaining = self._remaining(deadline)
+                if remaining is None:
+                    return
+                woken = await waiter.wait_async(remaining)
+            finally:
+                self.unsubscribe(waiter)
+
+    def wait(self, courier_id, timeout):
+        """Ждет не дольше timeout секунд, пока у курьера не появятся
+        заказы. Возвращает, есть ли заказы."""
+        checks = self.checks(courier_id, timeout)
+        try:
+            return any(ready for ready, _ in checks)
+        finally:
+            checks.close()
+
+    async def wait_async(self, courier_id, timeout, run):
+        """wait для цикла событий ASGI (см. checks_async)."""
+        checks = self.checks_async(courier_id, timeout, run)
+        try:
+            async for ready, _ in checks:
+                if ready:
+                    return True
+            return False
+        finally:
+            await checks.aclose()
@@ -0,0 +1,202 @@
+"""
+Модуль содержит необязательный пул свободных заказов для быстрой выдачи.
+
+Пул хранит свободные заказы в памяти процесса: по районам, в порядке
+возрастания веса, вместе с интервалами доставки. Источником истины
+остается база данных: пул заполняется из нее при первом обращении
+и повторно раз в DISPATCH_POOL_TTL секунд, а заказы, выбранные из пула,
+перечитываются из базы перед выдачей курьеру.
+
+Пул есть в каждом процессе-обработчике, и заказы, добавленные или снятые
+с курьеров в другом процессе, попадают в него только при следующей
+загрузке. Поэтому, если пул еще не загружен, устарел или не содержит
+заказов для курьера, заказы выбираются запросом к базе данных.
+"""
+from bisect import bisect_right, insort
+from itertools import chain
+from threading import RLock
+from time import time
+
+from flask import current_app
+
+from manager.db.schema import (db, Order, DeliveryHours,
+                               chunks, parse_interval)
+
+
+def current_pool():
+    """Возвращает пул свободных заказов приложения или None, если он отключен."""
+    return current_app.extensions.get('dispatch_pool')
+
+
+def intersects(windows, intervals):
+    """Возвращает, пересекается ли хотя бы один интервал доставки
+    хотя бы с одним интервалом работы."""
+    return any(ds < we and ws < de
+               for ds, de in windows for ws, we in intervals)
+
+
+class FreeOrdersPool:
+    # Количество заказов, выбираемых из пула за одно взятие блокировки
+    BATCH_SIZE = 64
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = RLock()
+        self._buckets = {}  # район -> отсортированный список (вес, id)
+        self._orders = {}   # id -> (вес, район, интервалы доставки)
+        self._loaded_at = None
+        self._loading = False
+
+    def _add(self, order_id, weight, region, windows):
+        self._discard(order_id)
+        self._orders[order_id] = (weight, region, tuple(windows))
+        insort(self._buckets.setdefault(region, []), (weight, order_id))
+
+    def _discard(self, order_id):
+        entry = self._orders.pop(order_id, None)
+        if entry is None:
+            return
+        weight, region, _ = entry
+        bucket = self._buckets[region]
+        i = bisect_right(bucket, (weight, order_id)) - 1
+        del bucket[i]
+
+    def _ensure_fresh(self):
+        """Возвращает, можно ли использовать пул. Не загруженный или
+        устаревший пул загружается заново, если его уже не загружает
+        другой поток: в этом случае пул использовать нельзя."""
+        with self._lock:
+            fresh = (self._loaded_at is not None
+                     and time() - self._loaded_at <= self.ttl)
+            if fresh or self._loading:
+                return fresh
+            self._loading = True
+        try:
+            self.load()
+        finally:
+            with self._lock:
+                self._loading = False
+        return True
+
+    def load(self):
+        """Заполняет пул всеми свободными заказами из базы данных.
+        Пул собирается без блокировки и заменяет прежний под ней."""
+        orders = db.session.query(Order.id, Order.weight, Order.region)\
+            .filter(Order.status == "free").all()
+        windows = {}
+        rows = db.session.query(DeliveryHours.order_id, DeliveryHours.start_time,
+                                DeliveryHours.end_time)\
+            .join(Order, Order.id == DeliveryHours.order_id)\
+            .filter(Order.status == "free").all()
+        for order_id, start, end in rows:
+            windows.setdefault(order_id, []).append((start, end))
+
+        buckets, entries = {}, {}
+        for order_id, weight, region in orders:
+            entries[order_id] = (weight, region, tuple(windows.get(order_id, ())))
+            buckets.setdefault(region, []).append((weight, order_id))
+        for bucket in buckets.values():
+            bucket.sort()
+
+        with self._lock:
+            self._buckets, self._orders = buckets, entries
+            self._loaded_at = time()
+
+    def add_orders(self, orders_data):
+        """Добавляет в пул новые заказы из запроса на добавление заказов."""
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            for data in orders_data:
+                windows = [parse_interval(i) for i in data["delivery_hours"]]
+                self._add(data["order_id"], data["weight"], data["region"], windows)
+
+    def discard(self, order_ids):
+        """Удаляет из пула заказы, которые больше не свободны."""
+        with self._lock:
+            for order_id in order_ids:
+                self._discard(order_id)
+
+    def reload(self, order_ids):
+        """Перечитывает из базы данных состояние заказов с данными ID."""
+        with self._lock:
+            if self._loaded_at is None:
+                return
+        for chunk in chunks(list(order_ids)):
+            orders = Order.query.filter(Order.id.in_(chunk)).all()
+            rows = DeliveryHours.query\
+                .filter(DeliveryHours.order_id.in_(chunk)).all()
+            windows = {}
+            for dh in rows:
+                windows.setdefault(dh.order_id, []).append((dh.start_time, dh.end_time))
+            with self._lock:
+                for order in orders:
+                    if order.status == "free":
+                        self._add(order.id, order.weight, order.region,
+                                  windows.get(order.id, ()))
+                    else:
+                        self._discard(order.id)
+
+    def _next_batch(self, regions, cursor):
+        """Возвращает следующие BATCH_SIZE заказов из данных районов
+        с ключом (вес, id) больше cursor."""
+        with self._lock:
+            batch = []
+            for region in regions:
+                bucket = self._buckets.get(region)
+                if bucket:
+                    i = bisect_right(bucket, cursor)
+                    batch.extend(bucket[i:i + self.BATCH_SIZE])
+            batch.sort()
+            return [(key, self._orders[key[1]][2])
+                    for key in batch[:self.BATCH_SIZE]]
+
+    def candidates(self, regions, intervals, max_weight):
+        """Возвращает ID свободных заказов из данных районов весом
+        не больше max_weight, время доставки которых пересекается
+        с данными интервалами, в порядке возрастания веса."""
+        cursor = (float('-inf'), 0)
+        while True:
+            batch = self._next_batch(regions, cursor)
+            if not batch:
+                return
+            for key, windows in batch:
+                if key[0] > max_weight:
+                    return
+                if intersects(windows, intervals):
+                    yield key[1]
+            cursor = batch[-1][0]
+
+    def available_orders(self, courier):
+        """Возвращает заказы, доступные для выдачи данному курьеру,
+        в порядке возрастания веса, или None, если пул нельзя использовать
+        или в нем нет заказов для курьера."""
+        if not self._ensure_fresh():
+            return None
+        orders = self._available_orders(courier)
+        first = next(orders, None)
+        if first is None:
+            return None
+        return chain([first], orders)
+
+    def _available_orders(self, courier):
+        """Заказы загружаются из базы данных порциями по мере обхода,
+        устаревшие записи пула удаляются."""
+        intervals = [(wh.start_time, wh.end_time)
+                     for wh in courier.working_hours]
+        max_weight = courier.capacity - (courier.current_weight or 0)
+        ids = self.candidates(courier.get_regions, intervals, max_weight)
+        while True:
+            chunk = [order_id for _, order_id in zip(range(self.BATCH_SIZE), ids)]
+            if not chunk:
+                return
+            orders = {order.id: order for order in
+                      Order.query.filter(Order.id.in_(chunk)).all()}
+            stale = []
+            for order_id in chunk:
+                order = orders.get(order_id)
+                if order is None or order.status != "free":
+                    stale.append(order_id)
+                else:
+                    yield order
+            self.discard(stale)
@@ -0,0 +1,282 @@
+"""
+Модуль содержит необязательные заранее вычисленные списки заказов-кандидатов
+для каждого курьера.
+
+Обработчики после фиксации транзакции сообщают о событиях: добавлены или
+освобождены заказы, изменились данные курьера, заказы выданы. События
+ставятся в ограниченную очередь, их обрабатывают фоновые потоки процесса:
+новый заказ добавляется в списки курьеров, у которых он подходит по району,
+времени доставки и грузоподъемности, список курьера пересчитывается
+запросом к базе данных. POST /orders/assign берет заказы из списка курьера,
+заново проверяя их в базе данных, поэтому устаревший список не приводит
+к выдаче неподходящего заказа.
+
+Список хранит не больше DISPATCH_PRECOMPUTE_LIMIT самых легких заказов.
+Список не используется, и назначение выполняется обычным запросом, если
+он еще не вычислен, старше DISPATCH_PRECOMPUTE_TTL секунд, мог потерять
+заказы (при переполнении очереди списки сбрасываются) или неполон, а курьер
+может взять все заказы списка или стратегия рассматривает больше заказов
+(ASSIGN_MAX_CANDIDATES). Списки хранятся
+в памяти процесса: при нескольких процессах заказы, добавленные в другом
+процессе, попадают в список только при пересчете, поэтому
+DISPATCH_PRECOMPUTE_TTL стоит задать. База данных SQLite в памяти
+не подходит: фоновые потоки работают со своими соединениями.
+"""
+import os
+from heapq import nsmallest
+from queue import Full, Queue
+from threading import Lock, Thread
+from time import time
+
+from flask import current_app
+
+from manager.api.pool import intersects
+from manager.api.strategies import current_strategy
+from manager.db.schema import (db, Courier, Order, DeliveryHours,
+                               chunks, parse_interval)
+
+
+def current_candidates():
+    """Возвращает списки кандидатов приложения или None, если они отключены."""
+    return current_app.extensions.get('candidate_index')
+
+
+class Entry:
+    """Список кандидатов курьера: не больше limit самых легких заказов,
+    подходящих по району, времени доставки и грузоподъемности."""
+
+    def __init__(self, regions, intervals, capacity, limit):
+        self.regions = regions
+        self.intervals = intervals
+        self.capacity = capacity
+        self.limit = limit
+        self.weights = {}  # ID заказа -> вес
+        # В списке нет части подходящих заказов: самых тяжелых,
+        # тяжелее bound (вес и ID самого тяжелого заказа после отсечения)
+        self.truncated = False
+        self.bound = None
+        self.ready = False
+        self.computed_at = None
+
+    def matches(self, weight, region, windows):
+        return (region in self.regions and weight <= self.capacity
+                and intersects(windows, self.intervals))
+
+    def add(self, order_id, weight):
+        if self.truncated and (weight, order_id) > self.bound:
+            # Более легкие заказы, не попавшие в список, могут быть свободны
+            return
+        self.weights[order_id] = weight
+        # Лишние заказы удаляются пачкой, когда их становится limit
+        if len(self.weights) >= 2 * self.limit:
+            self.trim()
+
+    def trim(self):
+        if len(self.weights) > self.limit:
+            self.weights = dict(nsmallest(self.limit, self.weights.items(),
+                                          key=lambda item: (item[1], item[0])))
+            self.truncated = True
+            self.bound = max((weight, order_id)
+                             for order_id, weight in self.weights.items())
+
+    def ids(self):
+        """ID не больше limit самых легких заказов списка."""
+        self.trim()
+        return list(self.weights)
+
+
+class CandidateIndex:
+    def __init__(self, app, workers=2, queue_size=1000, limit=1000, ttl=None):
+        self.app = app
+        self.workers = workers
+        self.queue_size = queue_size
+        self.limit = limit
+        self.ttl = ttl
+        self._lock = Lock()
+        self._entries = {}  # ID курьера -> Entry
+        self._regions = {}  # район -> множество ID курьеров
+        self._queue = None
+        self._pid = None
+
+    # События обработчиков
+
+    def orders_added(self, orders_data):
+        """Новые заказы из запроса на добавление заказов."""
+        self._put(('orders', [(data["order_id"], data["weight"], data["region"],
+                               [parse_interval(i) for i in data["delivery_hours"]])
+                              for data in orders_data]))
+
+    def orders_released(self, order_ids):
+        """Заказы, снова ставшие свободными."""
+        self._put(('released', list(order_ids)))
+
+    def orders_claimed(self, orders):
+        """Выданные курьерам заказы: пары (ID заказа, район), собранные
+        до фиксации транзакции (после нее заказы перечитываются из базы)."""
+        self._put(('claimed', list(orders)))
+
+    def couriers_changed(self, courier_ids):
+        """Добавлены курьеры или изменились их данные или загрузка:
+        их списки сразу перестают использоваться и пересчитываются."""
+        with self._lock:
+            for courier_id in courier_ids:
+                self._remove(courier_id)
+        self._put(('couriers', list(courier_ids)))
+
+    # Назначение
+
+    def available_orders(self, courier):
+        """Возвращает заказы из списка курьера, доступные для выдачи ему,
+        в порядке возрастания веса, или None, если список нельзя
+        использовать."""
+        with self._lock:
+            entry = self._entries.get(courier.id)
+            if entry is not None and not entry.ready:
+                # Список вычисляется
+                return None
+            expired = entry is None or (self.ttl is not None
+                                        and time() - entry.computed_at > self.ttl)
+            ids = None if expired else entry.ids()
+        if expired:
+            self.couriers_changed([courier.id])
+            return None
+
+        orders = []
+        for chunk in chunks(ids):
+            orders += Order.query\
+                .filter(Order.id.in_(chunk), Order.available(courier.get_regions),
+                        Order.deliverable_by(courier.id)).all()
+        orders.sort(key=lambda order: (order.weight, order.id))
+        valid = {order.id for order in orders}
+        with self._lock:
+            for order_id in ids:
+                if order_id not in valid:
+                    entry.weights.pop(order_id, None)
+            truncated = entry.truncated
+
+        # Неполный список не используется, если из него выдаются все
+        # заказы (возможно, курьер может взять и заказы не из списка)
+        # или в нем меньше заказов, чем рассматривает стратегия назначения
+        capacity = courier.capacity - (courier.current_weight or 0)
+        if truncated and (sum(order.weight for order in orders) <= capacity or len(orders)
+                          < getattr(current_strategy(), 'max_candidates', 0)):
+            return None
+        return orders
+
+    # Очередь и фоновые потоки
+
+    def _put(self, task):
+        self._start()
+        try:
+            self._queue.put_nowait(task)
+        except Full:
+            if task[0] in ('orders', 'released'):
+                # Заказы не попадут в списки: все списки сбрасываются
+                with self._lock:
+                    self._entries, self._regions = {}, {}
+
+    def _start(self):
+        """Запускает фоновые потоки. Потоки не переживают fork,
+        поэтому в каждом процессе они запускаются заново."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = Queue(self.queue_size)
+            self._entries, self._regions = {}, {}
+            for _ in range(self.workers):
+                Thread(target=self._work, args=(self._queue,), daemon=True).start()
+            self._pid = os.getpid()
+
+    def wait(self):
+        """Ждет обработки всех поставленных в очередь событий."""
+        if self._queue is not None:
+            self._queue.join()
+
+    def _work(self, queue):
+        handlers = {'orders': self._add_orders, 'released': self._reload,
+                    'claimed': self._discard, 'couriers': self._compute_all}
+        while True:
+            kind, data = queue.get()
+            try:
+                with self.app.app_context():
+                    handlers[kind](data)
+            except Exception:
+                self.app.logger.exception("Candidate precomputation failed")
+            finally:
+                queue.task_done()
+
+    # Изменение списков
+
+    def _remove(self, courier_id):
+        entry = self._entries.pop(courier_id, None)
+        if entry is not None:
+            for region in entry.regions:
+                self._regions[region].discard(courier_id)
+
+    def _add_orders(self, orders):
+        with self._lock:
+            for order_id, weight, region, windows in orders:
+                for courier_id in self._regions.get(region, ()):
+                    entry = self._entries[courier_id]
+                    if entry.matches(weight, region, windows):
+                        entry.add(order_id, weight)
+
+    def _reload(self, order_ids):
+        orders = []
+        for chunk in chunks(order_ids):
+            windows = {}
+            rows = db.session.query(DeliveryHours.order_id, DeliveryHours.start_time,
+                                    DeliveryHours.end_time)\
+                .filter(DeliveryHours.order_id.in_(chunk)).all()
+            for order_id, start, end in rows:
+                windows.setdefault(order_id, []).append((start, end))
+            rows = db.session.query(Order.id, Order.weight, Order.region)\
+                .filter(Order.id.in_(chunk), Order.status == "free").all()
+            orders += [(order_id, weight, region, windows.get(order_id, ()))
+                       for order_id, weight, region in rows]
+        self._add_orders(orders)
+
+    def _discard(self, orders):
+        with self._lock:
+            for order_id, region in orders:
+                for courier_id in self._regions.get(region, ()):
+                    self._entries[courier_id].weights.pop(order_id, None)
+
+    def _compute_all(self, courier_ids):
+        for courier_id in courier_ids:
+            self._compute(courier_id)
+
+    def _compute(self, courier_id):
+        courier = Courier.get_profile(courier_id)
+        if courier is None:
+            return
+        entry = Entry(set(courier.get_regions),
+                      [(wh.start_time, wh.end_time) for wh in courier.working_hours],
+                      courier.capacity, self.limit)
+        # Список регистрируется до запроса: заказы, добавленные
+        # во время запроса, попадут в него через события
+        with self._lock:
+            self._remove(courier_id)
+            self._entries[courier_id] = entry
+            for region in entry.regions:
+                self._regions.setdefault(region, set()).add(courier_id)
+
+        rows = db.session.query(Order.id, Order.weight)\
+            .filter(Order.available(courier.get_regions),
+                    Order.deliverable_by(courier_id),
+                    Order.weight <= courier.capacity)\
+            .order_by(Order.weight, Order.id).limit(self.limit + 1).all()
+        with self._lock:
+            if self._entries.get(courier_id) is not entry:
+                # Курьер изменился во время пересчета
+                return
+            for order_id, weight in rows[:self.limit]:
+                entry.weights[order_id] = weight
+            entry.trim()
+            if len(rows) > self.limit and not entry.truncated:
+                entry.truncated = True
+                entry.bound = max((weight, order_id) for order_id, weight in rows[:self.limit])
+            entry.ready = True
+            entry.computed_at = time()
@@ -5,13 +5,17 @@
 клиентами.
 """
 from marshmallow import Schema, ValidationError, validates, validates_schema, pre_load
-from marshmallow.fields import Nested, Int, Str, List, Float
-from marshmallow.validate import Range
-from flask import request, jsonify
+from marshmallow.fields import Nested, Int, Str, List, Float, Bool
+from marshmallow.validate import OneOf, Range
+from flask import current_app, g, request
 from re import fullmatch
 from datetime import datetime
 
-from manager.db.schema import Courier, Order
+from manager.db.schema import Courier, Order, ArchivedOrder
+from manager.db.shards import existing_order_ids, find_order
+from manager.api.validation import order_errors, validate_couriers, validate_orders
+from manager.api.serialization import current_json
+from manager.api.metrics import count_validation_failure
 
 
 INTERVAL_PATTERN = '\d\d:\d\d-\d\d:\d\d'
@@ -19,13 +23,26 @@ DATETIME_PATTERN = '\d\d\d\d-\d\d-\d\dT\d\d:\d\d:\d\d\.\d\d\d'
 DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
 
 
+def remember(entity):
+    """Сохраняет загруженный при валидации объект до конца запроса.
+    Сессия хранит объекты по слабым ссылкам: без этого обработчик
+    загрузил бы тот же объект из базы данных повторно."""
+    if entity is not None:
+        g.setdefault('loaded_entities', []).append(entity)
+    return entity
+
+
 def validate_interval(interval):
     if not fullmatch(INTERVAL_PATTERN, interval):
         raise ValidationError("Not a valid time format.")
 
     start_time, end_time = interval.split('-')
-    start_time = datetime.strptime(start_time, '%H:%M')
-    end_time = datetime.strptime(end_time, '%H:%M')
+    try:
+        start_time = datetime.strptime(start_time, '%H:%M')
+        end_time = datetime.strptime(end_time, '%H:%M')
+    except ValueError:
+        # Например, "25:00": формат верный, но такого времени нет
+        raise ValidationError("Not a valid time format.")
     if start_time >= end_time:
         raise ValidationError("Start-time must be less than end-time.")
 
@@ -49,7 +66,7 @@ class PatchCourierSchema(Schema):
 
     @validates('courier_id')
     def validate_courier_id(self, courier_id: int):
-        if not Courier.get(courier_id):
+        if not remember(Courier.get(courier_id)):
             raise ValidationError("Courier with given id doesn't exist!")
 
 
@@ -61,7 +78,8 @@ class CourierSchema(PatchCourierSchema):
 
     @validates('courier_id')
     def validate_courier_id(self, courier_id: int):
-        if Courier.get(courier_id):
+        # Множество существующих ID заранее собирает CouriersSchema
+        if courier_id in self.context["existing_ids"]:
             raise ValidationError("Courier with given id already exists!")
 
 
@@ -89,6 +107,9 @@ class CouriersSchema(Schema):
         if len(courier_ids) != len(set(courier_ids)):
             raise ValidationError("Some of given couriers have same id!")
 
+        # Проверка существования всех ID одним запросом
+        self.context["existing_ids"] = Courier.existing_ids(courier_ids)
+
         return input_data
 
     def handle_error(self, exc, data, **kwargs):
@@ -120,7 +141,8 @@ class OrderSchema(Schema):
 
     @validates('order_id')
     def validate_order_id(self, order_id: int):
-        if Order.get(order_id):
+        # Множество существующих ID заранее собирает OrdersSchema
+        if order_id in self.context["existing_ids"]:
             raise ValidationError("Order with given id already exists!")
 
 
@@ -148,6 +170,9 @@ class OrdersSchema(Schema):
         if len(order_ids) != len(set(order_ids)):
             raise ValidationError("Some of given orders have same id!")
 
+        # Проверка существования всех ID одним запросом
+        self.context["existing_ids"] = existing_order_ids(order_ids)
+
         return input_data
 
     def handle_error(self, exc, data, **kwargs):
@@ -170,15 +195,93 @@ class OrdersSchema(Schema):
         raise ValidationError(error_message)
 
 
+def validate_orders_chunk(orders):
+    """Проверяет часть потока заказов по схеме OrderSchema.
+    Возвращает корректные заказы и описания ошибок для остальных
+    в формате элементов validation_error["orders"]."""
+    schema = OrderSchema()
+    order_ids = [order["order_id"] for order in orders]
+    existing = existing_order_ids(order_ids)
+    schema.context["existing_ids"] = existing
+
+    compiled = current_app.config['REQUEST_VALIDATOR'] == 'compiled'
+    valid, errors = [], []
+    for order in orders:
+        if compiled:
+            messages = order_errors(order, existing)
+        else:
+            messages = schema.validate(order)
+        if not messages:
+            # Повтор ID внутри потока считается уже существующим заказом
+            existing.add(order["order_id"])
+            valid.append(order)
+            continue
+        messages.update({"id": order["order_id"]})
+        errors.append(messages)
+    return valid, errors
+
+
 class CourierIdSchema(Schema):
     courier_id = Int(validate=Range(min=1), strict=True, required=True)
 
     @validates('courier_id')
     def validate_courier_id(self, courier_id: int):
-        if not Courier.get(courier_id):
+        # Курьер загружается сразу с районами и графиком: обработчики
+        # получат его из сессии через Courier.get без новых запросов
+        if not remember(Courier.get_profile(courier_id)):
             raise ValidationError("Courier with given id doesn't exist!")
 
 
+class AssignBatchSchema(Schema):
+    """Схема для валидации запроса на назначение заказов группе курьеров:
+    либо список courier_ids, либо all_idle для всех курьеров без заказов."""
+    courier_ids = List(Int(validate=Range(min=1), strict=True))
+    all_idle = Bool()
+
+    @validates('courier_ids')
+    def validate_courier_ids(self, courier_ids: list):
+        if len(courier_ids) != len(set(courier_ids)):
+            raise ValidationError("Not all couriers are unique!")
+        missing = set(courier_ids) - Courier.existing_ids(courier_ids)
+        if missing:
+            raise ValidationError("Couriers with given ids don't exist: %s"
+                                  % ", ".join(map(str, sorted(missing))))
+
+    @validates_schema
+    def validate_schema(self, data, **kwargs):
+        if ("courier_ids" in data) == bool(data.get("all_idle")):
+            raise ValidationError("Either courier_ids or all_idle must be given!")
+
+
+class ListQuerySchema(Schema):
+    """Схема для валидации параметров постраничного вывода: after - ID,
+    после которого начинается страница, limit - размер страницы."""
+    after = Int(validate=Range(min=0))
+    limit = Int(validate=Range(min=1, max=1000), missing=100)
+
+
+class OrdersQuerySchema(ListQuerySchema):
+    status = Str(validate=OneOf(("free", "assigned", "completed")))
+    region = Int(validate=Range(min=1))
+    courier_id = Int(validate=Range(min=1))
+
+
+class CouriersQuerySchema(ListQuerySchema):
+    type = Str(validate=OneOf(("foot", "car", "bike")))
+    region = Int(validate=Range(min=1))
+
+
+class WaitQuerySchema(Schema):
+    """Схема для валидации параметров ожидания заказов: timeout - время
+    ожидания в секундах."""
+    timeout = Int(validate=Range(min=0, max=300), missing=30)
+
+
+# Ошибка выполнения заказа, который не назначен курьеру (в том числе
+# повторного выполнения)
+NOT_ASSIGNED_ORDER = "No assigned order with given input data!"
+
+
 class CompleteSchema(Schema):
     order_id = Int(validate=Range(min=1), strict=True, required=True)
     courier_id = Int(validate=Range(min=1), strict=True, required=True)
@@ -186,17 +289,19 @@ class CompleteSchema(Schema):
 
     @validates_schema
     def validate_schema(self, data, **kwargs):
-        courier = Courier.get(data["courier_id"])
+        courier = remember(Courier.get(data["courier_id"]))
         if not courier:
             raise ValidationError("Courier with given id doesn't exist!")
 
-        if not Order.get(data["order_id"]):
+        order = remember(find_order(Order, data["order_id"]))
+        if not order:
+            # Перенесенный в архив заказ выполнен, но существует
+            if find_order(ArchivedOrder, data["order_id"]) is not None:
+                raise ValidationError(NOT_ASSIGNED_ORDER)
             raise ValidationError("Order with given id doesn't exist!")
 
-        order = Order.query.filter(Order.assigned_to(data["courier_id"]),
-                                   Order.id == data["order_id"]).first()
-        if not order:
-            raise ValidationError("No assigned order with given input data!")
+        if order.status != "assigned" or order.courier_id != data["courier_id"]:
+            raise ValidationError(NOT_ASSIGNED_ORDER)
 
         if not fullmatch(DATETIME_PATTERN, data["complete_time"]):
             raise ValidationError("Time is not in the correct format!")
@@ -206,6 +311,17 @@ class CompleteSchema(Schema):
             raise ValidationError("Order end-time can't be less than start-time!")
 
 
+def json_response(data):
+    """Аналог flask.jsonify: тело ответа сразу сериализуется в байты
+    провайдером JSON приложения (см. manager.api.serialization)."""
+    return body_response(current_json().dumps(data))
+
+
+def body_response(body):
+    """Возвращает ответ с готовым телом JSON в байтах."""
+    return current_app.response_class(body, mimetype=current_app.config['JSONIFY_MIMETYPE'])
+
+
 def patch_response_schema(courier):
     return {"courier_id": courier.id,
             "courier_type": courier.type,
@@ -229,10 +345,56 @@ def assign_response_schema(assign_time, orders):
     return result
 
 
+def assign_batch_response_schema(results):
+    """Принимает пары (курьер, назначенные заказы)."""
+    return {"couriers": [dict(courier_id=courier.id,
+                              **assign_response_schema(courier.assign_time, orders))
+                         for courier, orders in results]}
+
+
+def orders_stream_response_schema(chunks, errors):
+    result = {"chunks": chunks}
+    if errors:
+        result["validation_error"] = {"orders": errors}
+    return result
+
+
 def complete_response_schema(data):
     return {"order_id": data["order_id"]}
 
 
+def wait_response_schema(available):
+    return {"orders_available": available}
+
+
+def page_response_schema(key, items, limit):
+    """Страница списка: после полной страницы указывается ID,
+    с которого запрашивается следующая."""
+    result = {key: items}
+    if len(items) == limit:
+        result["next_after"] = items[-1][key[:-1] + "_id"]
+    return result
+
+
+def order_list_item(order_id, weight, region, status, courier_id, delivery_hours):
+    result = {"order_id": order_id,
+              "weight": weight,
+              "region": region,
+              "delivery_hours": delivery_hours,
+              "status": status}
+    if courier_id is not None:
+        result["courier_id"] = courier_id
+    return result
+
+
+def courier_list_item(courier):
+    return {"courier_id": courier.id,
+            "courier_type": courier.type,
+            "regions": courier.get_regions,
+            "working_hours": courier.get_working_hours,
+            "earnings": courier.earnings}
+
+
 def info_response_schema(courier, rating):
     result = {"courier_id": courier.id,
               "courier_type": courier.type,
@@ -245,20 +407,53 @@ def info_response_schema(courier, rating):
     return result
 
 
+# Скомпилированные аналоги схем (см. manager.api.validation)
+COMPILED_VALIDATORS = {
+    CouriersSchema: validate_couriers,
+    OrdersSchema: validate_orders,
+}
+
+
 def validate_request(request_schema):
-    """Декоратор для валидации входных данных по заданной схеме."""
+    """Декоратор для валидации входных данных по заданной схеме.
+    Для схем из COMPILED_VALIDATORS в режиме REQUEST_VALIDATOR='compiled'
+    используется скомпилированный валидатор."""
+    compiled = COMPILED_VALIDATORS.get(request_schema)
+
     def decorator(original):
         def wrapper(*args, **kwargs):
             data = request.json if request.json else dict()
             if isinstance(data, dict):
                 data.update(kwargs)
             try:
-                request_schema().load(data)
+                if compiled and current_app.config['REQUEST_VALIDATOR'] == 'compiled':
+                    compiled(data)
+                else:
+                    request_schema().load(data)
             except ValidationError as err:
-                return jsonify(err.messages), 400
+                count_validation_failure()
+                return json_response(err.messages), 400
 
             return original(*args, **kwargs)
 
         return wrapper
 
     return decorator
+
+
+def validate_query(query_schema):
+    """Декоратор для валидации параметров строки запроса по заданной схеме.
+    Разобранные параметры передаются обработчику аргументом query."""
+    def decorator(original):
+        def wrapper(*args, **kwargs):
+            try:
+                query = query_schema().load(request.args.to_dict())
+            except ValidationError as err:
+                count_validation_failure()
+                return json_response(err.messages), 400
+
+            return original(*args, query=query, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,122 @@
+"""
+Модуль содержит провайдеры JSON для разбора запросов и сериализации ответов.
+
+Провайдер выбирается настройкой JSON_PROVIDER:
+    'auto'   - orjson, если он установлен, иначе стандартный модуль json;
+    'orjson' - orjson;
+    'json'   - стандартный модуль json (так же, как flask.jsonify).
+Ответы любого провайдера побайтно совпадают с ответами flask.jsonify, а
+разобранные запросы - с request.json. Если результат orjson может
+отличаться (не-ASCII символы, NaN, запись чисел с плавающей точкой, ключи
+не строки, целые больше 64 бит), используется стандартный модуль json.
+"""
+import json
+import re
+
+from flask import Request, current_app, json as flask_json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Экспоненциальная запись чисел в выводе orjson: 1e16, 1e-5
+EXPONENT = re.compile(rb'e-?[0-9]')
+
+
+def current_json():
+    """Возвращает провайдер JSON приложения."""
+    return current_app.extensions['json_provider']
+
+
+class JSONProvider:
+    """Стандартный модуль json с настройками flask.jsonify."""
+    name = "json"
+
+    def dumps(self, obj):
+        """Возвращает тело ответа в байтах."""
+        if current_app.config['JSONIFY_PRETTYPRINT_REGULAR'] or current_app.debug:
+            text = flask_json.dumps(obj, indent=2, separators=(", ", ": "))
+        else:
+            text = flask_json.dumps(obj, separators=(",", ":"))
+        return (text + "\n").encode()
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+class OrjsonProvider(JSONProvider):
+    """orjson с переходом на стандартный модуль там, где результаты
+    могут различаться."""
+    name = "orjson"
+
+    OPTIONS = (orjson.OPT_SORT_KEYS | orjson.OPT_APPEND_NEWLINE
+               | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+               | orjson.OPT_PASSTHROUGH_SUBCLASS) if orjson else 0
+
+    # Целые вне 64 бит orjson превращает в float: это числа из 20 и более
+    # цифр и 19-значные отрицательные меньше -2 ** 63. Запросы с
+    # последовательностями из 19 и более цифр разбирает json
+    DIGITS = bytes.maketrans(b'123456789', b'000000000')
+    LONG_NUMBER = b'0' * 19
+
+    def dumps(self, obj):
+        if current_app.config['JSONIFY_PRETTYPRINT_REGULAR'] or current_app.debug:
+            return super().dumps(obj)
+        try:
+            body = orjson.dumps(obj, option=self.OPTIONS)
+        except TypeError:
+            # Ключи не строки, целые больше 64 бит, типы, которые
+            # сериализует кодировщик Flask
+            return super().dumps(obj)
+        if self.unsafe_output(body):
+            return super().dumps(obj)
+        return body
+
+    @staticmethod
+    def unsafe_output(body):
+        """Возвращает, может ли ответ json отличаться от ответа orjson:
+        NaN и бесконечность (orjson пишет null), экспоненциальная запись
+        и числа меньше 1e-4, символы вне ASCII и DEL (json экранирует их).
+        Совпадения внутри строк только отправляют ответ в json."""
+        return (b'null' in body or b'0.0000' in body or b'\x7f' in body
+                or not body.isascii() or EXPONENT.search(body) is not None)
+
+    def loads(self, data):
+        raw = data.encode('utf-8', 'surrogatepass') if isinstance(data, str) else data
+        if self.LONG_NUMBER not in raw.translate(self.DIGITS):
+            try:
+                return orjson.loads(raw)
+            except orjson.JSONDecodeError:
+                # Например, NaN или не UTF-8: результат или ошибку дает json
+                pass
+        return json.loads(data)
+
+
+class ProviderJSONModule:
+    """Модуль JSON для Request.json_module: request.json разбирается
+    провайдером JSON приложения."""
+
+    @staticmethod
+    def loads(data, **kwargs):
+        return current_json().loads(data)
+
+
+class ProviderRequest(Request):
+    """Запрос, тело JSON которого разбирает провайдер JSON приложения."""
+    json_module = ProviderJSONModule
+
+
+def create_json_provider(config):
+    """Создает провайдер JSON по настройкам приложения."""
+    name = config['JSON_PROVIDER']
+    if name == 'auto':
+        name = OrjsonProvider.name if orjson is not None else JSONProvider.name
+    if name == OrjsonProvider.name:
+        if orjson is None:
+            raise RuntimeError("JSON_PROVIDER is 'orjson', but orjson is not installed")
+        # Без сортировки ключей или с не-ASCII символами результаты
+        # orjson и json не сравнивались: используется json
+        if config['JSON_SORT_KEYS'] and config['JSON_AS_ASCII']:
+            return OrjsonProvider()
+    return JSONProvider()
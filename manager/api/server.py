@@ -0,0 +1,67 @@
+"""
+Модуль содержит запуск приложения на сервере gunicorn: несколько
+процессов-обработчиков с пулом потоков в каждом. Приложение и движок
+базы данных создаются один раз в главном процессе до создания
+обработчиков, миграции также применяются один раз.
+
+В режиме ASGI процессы-обработчики uvicorn (requirements-asgi.txt)
+обслуживают соединения циклом событий asyncio (см. manager.api.asgi).
+"""
+from importlib.util import find_spec
+
+from gunicorn.app.base import BaseApplication
+
+from manager.db.schema import db
+from manager.db.shards import current_shards
+
+
+class Server(BaseApplication):
+
+    def __init__(self, app, options, application=None):
+        """application - приложение для обработчиков, если это
+        не само приложение Flask app (например, ASGI)."""
+        self.app = app
+        self.application = application or app
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+        self.cfg.set('preload_app', True)
+        self.cfg.set('post_fork', self.post_fork)
+
+    def load(self):
+        return self.application
+
+    def post_fork(self, server, worker):
+        """Соединения главного процесса не должны использоваться
+        процессами-обработчиками: каждый открывает свои."""
+        with self.app.app_context():
+            db.engine.dispose()
+            shards = current_shards()
+            if shards is not None:
+                for engine in shards.engines:
+                    engine.dispose()
+
+
+def serve(app, host, port, workers, threads, backlog, graceful_timeout, asgi=False):
+    """Запускает приложение и блокируется до его остановки.
+    По SIGTERM обработчики завершают текущие запросы
+    в течение graceful_timeout секунд. Если asgi, запросы каждого
+    процесса выполняются в пуле из threads потоков."""
+    application, worker_class = app, 'gthread'
+    if asgi:
+        if find_spec('uvicorn') is None:
+            raise RuntimeError("ASGI mode requires uvicorn, install requirements-asgi.txt")
+        from manager.api.asgi import AsgiApp
+        application = AsgiApp(app, threads)
+        worker_class = 'uvicorn.workers.UvicornWorker'
+    Server(app, {
+        'bind': '%s:%s' % (host, port),
+        'workers': workers,
+        'threads': threads,
+        'worker_class': worker_class,
+        'backlog': backlog,
+        'graceful_timeout': graceful_timeout,
+    }, application).run()
@@ -0,0 +1,112 @@
+"""
+Модуль содержит стратегии выбора заказов для назначения курьеру.
+
+Стратегия получает заказы, доступные курьеру, в порядке возрастания веса
+и свободную грузоподъемность курьера, и возвращает заказы для назначения.
+Стратегия выбирается настройкой ASSIGN_STRATEGY.
+"""
+from itertools import islice
+from time import perf_counter
+
+from flask import current_app
+
+
+def current_strategy():
+    """Возвращает стратегию назначения заказов приложения."""
+    return current_app.extensions['assign_strategy']
+
+
+class AssignStrategy:
+    """Базовый класс стратегии назначения заказов."""
+    name = ""
+
+    def select(self, available_orders, capacity):
+        """Возвращает заказы из available_orders суммарным весом
+        не больше capacity, отсортированные по возрастанию веса."""
+        raise NotImplementedError
+
+
+class GreedyStrategy(AssignStrategy):
+    """Берет заказы по возрастанию веса, пока они помещаются.
+    Дает максимальное количество заказов."""
+    name = "greedy"
+
+    def select(self, available_orders, capacity):
+        orders, weight = [], 0
+        for order in available_orders:
+            if weight + order.weight > capacity:
+                break
+            weight += order.weight
+            orders.append(order)
+        return orders
+
+
+class BranchAndBoundStrategy(AssignStrategy):
+    """Метод ветвей и границ для задачи о рюкзаке: максимизирует
+    суммарный вес назначенных заказов. Рассматривает не больше
+    max_candidates самых легких заказов и останавливается по истечении
+    time_budget секунд, возвращая лучшее найденное решение.
+    """
+    name = "knapsack"
+
+    # Как часто (в узлах перебора) проверяется ограничение по времени
+    CHECK_EVERY = 1024
+
+    def __init__(self, time_budget=0.05, max_candidates=200):
+        self.time_budget = time_budget
+        self.max_candidates = max_candidates
+
+    def select(self, available_orders, capacity):
+        candidates = [order for order in islice(available_orders, self.max_candidates)
+                      if order.weight <= capacity]
+        # Тяжелые заказы первыми: быстрее находится хорошее решение
+        candidates.sort(key=lambda order: -order.weight)
+        weights = [order.weight for order in candidates]
+
+        # Остаточные суммы весов для верхней оценки
+        suffix = [0] * (len(weights) + 1)
+        for i in range(len(weights) - 1, -1, -1):
+            suffix[i] = suffix[i + 1] + weights[i]
+
+        # Начальное решение: первый подходящий в порядке убывания веса
+        best, best_weight = [], 0
+        for i, w in enumerate(weights):
+            if best_weight + w <= capacity:
+                best.append(i)
+                best_weight += w
+
+        deadline = perf_counter() + self.time_budget
+        nodes = 0
+        stack = [(0, 0, ())]
+        while stack and best_weight < capacity:
+            i, weight, taken = stack.pop()
+            nodes += 1
+            if nodes % self.CHECK_EVERY == 0 and perf_counter() > deadline:
+                break
+            if weight > best_weight:
+                best, best_weight = list(taken), weight
+            if i == len(weights) or weight + suffix[i] <= best_weight:
+                continue
+            # Сначала рассматривается ветка с заказом i, поэтому она кладется последней
+            stack.append((i + 1, weight, taken))
+            if weight + weights[i] <= capacity:
+                stack.append((i + 1, weight + weights[i], taken + (i,)))
+
+        orders = [candidates[i] for i in best]
+        orders.sort(key=lambda order: (order.weight, order.id))
+        return orders
+
+
+STRATEGIES = {
+    GreedyStrategy.name: GreedyStrategy,
+    BranchAndBoundStrategy.name: BranchAndBoundStrategy,
+}
+
+
+def create_strategy(config):
+    """Создает стратегию назначения заказов по настройкам приложения."""
+    name = config['ASSIGN_STRATEGY']
+    if name == BranchAndBoundStrategy.name:
+        return BranchAndBoundStrategy(config['ASSIGN_TIME_BUDGET'],
+                                      config['ASSIGN_MAX_CANDIDATES'])
+    return STRATEGIES[name]()
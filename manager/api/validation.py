@@ -0,0 +1,218 @@
+"""
+Модуль содержит скомпилированные валидаторы запросов на добавление
+курьеров и заказов.
+
+Валидаторы дают те же результаты, что и схемы CouriersSchema и OrdersSchema
+(тексты ошибок, формат ответа handle_error), но проверяют поля напрямую,
+без вложенных схем marshmallow, а интервалы времени разбирают заранее
+скомпилированным регулярным выражением вместо datetime.strptime.
+Схемы остаются эталонной реализацией: режим выбирается настройкой
+REQUEST_VALIDATOR ('compiled' или 'schema').
+"""
+import math
+import re
+from numbers import Integral
+
+from marshmallow import ValidationError
+
+from manager.db.schema import Courier
+from manager.db.shards import existing_order_ids
+
+
+# Допустимое время - от 00:00 до 23:59: то же, что принимает
+# проверка по INTERVAL_PATTERN вместе с datetime.strptime('%H:%M')
+INTERVAL_RE = re.compile(r'([01]\d|2[0-3]):([0-5]\d)-([01]\d|2[0-3]):([0-5]\d)')
+
+COURIER_TYPES = ("foot", "car", "bike")
+COURIER_FIELDS = frozenset(("courier_id", "courier_type", "regions", "working_hours"))
+ORDER_FIELDS = frozenset(("order_id", "weight", "region", "delivery_hours"))
+
+_missing = object()
+
+
+def positive_int(value):
+    """Int(strict=True, validate=Range(min=1))."""
+    if value is None:
+        return ["Field may not be null."]
+    if value is True or value is False or not isinstance(value, Integral):
+        return ["Not a valid integer."]
+    if value < 1:
+        return ["Must be greater than or equal to 1."]
+    return None
+
+
+def weight(value):
+    """Float(validate=Range(min=0.01, max=50))."""
+    if value is None:
+        return ["Field may not be null."]
+    if value is True or value is False:
+        return ["Not a valid number."]
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return ["Not a valid number."]
+    except OverflowError:
+        return ["Number too large."]
+    if math.isnan(value) or math.isinf(value):
+        return ["Special numeric values (nan or infinity) are not permitted."]
+    if value < 0.01 or value > 50:
+        return ["Must be greater than or equal to 0.01 "
+                "and less than or equal to 50."]
+    return None
+
+
+def string(value):
+    """Str()."""
+    if value is None:
+        return ["Field may not be null."]
+    if not isinstance(value, str):
+        return ["Not a valid string."]
+    return None
+
+
+def interval(value):
+    """Str(validate=validate_interval)."""
+    if value is None:
+        return ["Field may not be null."]
+    if not isinstance(value, str):
+        return ["Not a valid string."]
+    match = INTERVAL_RE.fullmatch(value)
+    if match is None:
+        return ["Not a valid time format."]
+    start_h, start_m, end_h, end_m = match.groups()
+    if int(start_h) * 60 + int(start_m) >= int(end_h) * 60 + int(end_m):
+        return ["Start-time must be less than end-time."]
+    return None
+
+
+def list_of(check):
+    """List(поле): ошибки элементов собираются по индексам."""
+    def check_list(value):
+        if value is None:
+            return ["Field may not be null."]
+        if not isinstance(value, list):
+            return ["Not a valid list."]
+        errors = {}
+        for index, item in enumerate(value):
+            messages = check(item)
+            if messages:
+                errors[index] = messages
+        return errors or None
+
+    return check_list
+
+
+regions = list_of(positive_int)
+intervals = list_of(interval)
+
+
+def check_field(errors, item, name, check):
+    """Проверяет обязательное поле. Возвращает True, если оно корректно:
+    только тогда схема запускает для него методы @validates."""
+    value = item.get(name, _missing)
+    if value is _missing:
+        errors[name] = ["Missing data for required field."]
+        return False
+    messages = check(value)
+    if messages:
+        errors[name] = messages
+        return False
+    return True
+
+
+def courier_errors(courier, existing_ids):
+    """Возвращает ошибки данных курьера так же, как CourierSchema."""
+    errors = {}
+    if check_field(errors, courier, "courier_id", positive_int) \
+            and courier["courier_id"] in existing_ids:
+        errors["courier_id"] = ["Courier with given id already exists!"]
+    if check_field(errors, courier, "courier_type", string) \
+            and courier["courier_type"] not in COURIER_TYPES:
+        errors["courier_type"] = ["Courier type is incorrect!"]
+    if check_field(errors, courier, "regions", regions):
+        if len(courier["regions"]) != len(set(courier["regions"])):
+            errors["regions"] = ["Not all regions are unique!"]
+    elif isinstance(errors["regions"], dict):
+        # Схема проверяет уникальность и для корректных элементов
+        # списка с ошибками, добавляя ошибку под ключом _schema
+        valid = [region for index, region in enumerate(courier["regions"])
+                 if index not in errors["regions"]]
+        if len(valid) != len(set(valid)):
+            errors["regions"]["_schema"] = ["Not all regions are unique!"]
+    check_field(errors, courier, "working_hours", intervals)
+    for name in courier.keys() - COURIER_FIELDS:
+        errors[name] = ["Unknown field."]
+    return errors
+
+
+def order_errors(order, existing_ids):
+    """Возвращает ошибки данных заказа так же, как OrderSchema."""
+    errors = {}
+    if check_field(errors, order, "order_id", positive_int) \
+            and order["order_id"] in existing_ids:
+        errors["order_id"] = ["Order with given id already exists!"]
+    check_field(errors, order, "weight", weight)
+    check_field(errors, order, "region", positive_int)
+    check_field(errors, order, "delivery_hours", intervals)
+    for name in order.keys() - ORDER_FIELDS:
+        errors[name] = ["Unknown field."]
+    return errors
+
+
+def check_input(input_data, id_field, title, name):
+    """Проверяет гарантии на входные данные так же, как pre_load схем.
+    Возвращает ID из запроса."""
+    if "data" not in input_data:
+        raise ValidationError({"_schema": ["Input data must have a 'data' key."]})
+
+    if not isinstance(input_data["data"], list):
+        raise ValidationError({"_schema": ["Value of the 'data' key must be a list."]})
+
+    if any(not isinstance(item, dict) or id_field not in item
+           for item in input_data["data"]):
+        raise ValidationError({"_schema": ["%s input data is invalid." % title]})
+
+    ids = [item[id_field] for item in input_data["data"]]
+    if len(ids) != len(set(ids)):
+        raise ValidationError({"_schema": ["Some of given %s have same id!" % name]})
+    return ids
+
+
+def validate_bulk(input_data, find_existing, item_errors, id_field, title, name):
+    """Проверяет запрос на добавление курьеров или заказов и при ошибках
+    выбрасывает ValidationError с тем же описанием, что и handle_error схем.
+    find_existing возвращает множество уже занятых ID из данных."""
+    ids = check_input(input_data, id_field, title, name)
+    existing_ids = find_existing(ids)
+
+    messages = {}
+    items = {}
+    for index, item in enumerate(input_data["data"]):
+        errors = item_errors(item, existing_ids)
+        if errors:
+            items[index] = errors
+    if items:
+        messages["data"] = items
+    for key in input_data.keys() - {"data"}:
+        messages[key] = ["Unknown field."]
+    if not messages:
+        return
+
+    error_message = {"validation_error": {name: []}}
+    for index in messages["data"]:
+        errors = messages["data"][index]
+        errors.update({"id": input_data["data"][index][id_field]})
+        error_message["validation_error"][name].append(errors)
+    raise ValidationError(error_message)
+
+
+def validate_couriers(input_data):
+    """Скомпилированный аналог CouriersSchema().load(input_data)."""
+    validate_bulk(input_data, Courier.existing_ids, courier_errors,
+                  "courier_id", "Couriers", "couriers")
+
+
+def validate_orders(input_data):
+    """Скомпилированный аналог OrdersSchema().load(input_data)."""
+    validate_bulk(input_data, existing_order_ids, order_errors,
+                  "order_id", "Orders", "orders")
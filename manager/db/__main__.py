@@ -0,0 +1,58 @@
+"""
+Обслуживание базы данных:
+
+    python -m manager.db upgrade          # применить миграции схемы
+    python -m manager.db backfill-stats   # пересчитать статистику доставки
+    python -m manager.db check-stats      # проверить статистику доставки
+    python -m manager.db archive          # перенести выполненные заказы в архив
+    python -m manager.db archive --every 3600   # переносить раз в час
+"""
+import argparse
+from time import sleep
+
+from manager.api.app import create_app
+from manager.db import archive, stats
+from manager.db.schema import BULK_CHUNK_SIZE
+from definitions import DATABASE_PATH
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Обслуживание базы данных.")
+    parser.add_argument('command', choices=('upgrade', 'backfill-stats', 'check-stats',
+                                            'archive'))
+    parser.add_argument('--database', default=DATABASE_PATH,
+                        help="путь к файлу базы данных")
+    parser.add_argument('--order-shards', default=None,
+                        help="файлы SQLite или URL шардов заказов через запятую")
+    parser.add_argument('--every', type=float, default=None,
+                        help="повторять архивацию с данным интервалом, с")
+    parser.add_argument('--batch-size', type=int, default=BULK_CHUNK_SIZE,
+                        help="заказов в одной транзакции архивации")
+    args = parser.parse_args()
+
+    # Миграции применяются при создании приложения
+    app = create_app(args.database, config={
+        'ORDER_SHARDS': args.order_shards and args.order_shards.split(','),
+    })
+    with app.app_context():
+        if args.command == 'backfill-stats':
+            print("Statistics rows written: %d" % stats.backfill())
+        elif args.command == 'check-stats':
+            mismatches = stats.check()
+            for courier_id, region, expected, stored in mismatches:
+                print("courier %s, region %s: expected %s, stored %s"
+                      % (courier_id, region, expected, stored))
+            print("Mismatches: %d" % len(mismatches))
+            if mismatches:
+                raise SystemExit(1)
+        elif args.command == 'archive':
+            while True:
+                moved = archive.archive(args.batch_size)
+                print("Orders archived: %d, %s" % (moved, archive.counts()))
+                if args.every is None:
+                    break
+                sleep(args.every)
+
+
+if __name__ == "__main__":
+    main()
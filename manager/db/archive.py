@@ -0,0 +1,58 @@
+"""
+Модуль содержит перенос выполненных заказов в архив.
+
+Выполненные заказы и их время доставки переносятся из orders
+и deliveryhours в archivedorders и archiveddeliveryhours частями,
+каждая часть - в своей транзакции. Обработчики работают только
+с текущими заказами, поэтому рабочие таблицы и их индексы растут
+с количеством невыполненных заказов, а не со всей историей.
+Рейтинг курьеров считается по LeadTimeStats и от архивации не зависит.
+"""
+from sqlalchemy import select
+
+from manager.db.schema import (db, Order, DeliveryHours, ArchivedOrder,
+                               ArchivedDeliveryHours, BULK_CHUNK_SIZE)
+from manager.db.shards import each_shard
+
+
+def archive_chunk(order_ids):
+    """Переносит выполненные заказы с данными ID в архив в текущей транзакции."""
+    completed = (Order.id.in_(order_ids), Order.status == "completed")
+    db.session.execute(ArchivedOrder.__table__.insert().from_select(
+        ["id", "courier_id", "weight", "region", "lead_time"],
+        select(Order.id, Order.courier_id, Order.weight, Order.region,
+               Order.lead_time).where(*completed)))
+    db.session.execute(ArchivedDeliveryHours.__table__.insert().from_select(
+        ["id", "order_id", "start_time", "end_time"],
+        select(DeliveryHours.id, DeliveryHours.order_id, DeliveryHours.start_time,
+               DeliveryHours.end_time).where(DeliveryHours.order_id.in_(order_ids))))
+    db.session.query(DeliveryHours).filter(DeliveryHours.order_id.in_(order_ids))\
+        .delete(synchronize_session=False)
+    db.session.query(Order).filter(*completed).delete(synchronize_session=False)
+
+
+def archive(batch_size=BULK_CHUNK_SIZE):
+    """Переносит все выполненные заказы в архив.
+    Возвращает количество перенесенных заказов."""
+    total = 0
+    # Архив каждого шарда находится в нем же
+    for _ in each_shard():
+        while True:
+            order_ids = [row[0] for row in db.session.query(Order.id)
+                         .filter(Order.status == "completed")
+                         .order_by(Order.id).limit(batch_size)]
+            if not order_ids:
+                break
+            archive_chunk(order_ids)
+            db.session.commit()
+            total += len(order_ids)
+    return total
+
+
+def counts():
+    """Возвращает количество текущих и перенесенных в архив заказов."""
+    result = {"orders": 0, "archived": 0}
+    for _ in each_shard():
+        result["orders"] += Order.query.count()
+        result["archived"] += ArchivedOrder.query.count()
+    return result
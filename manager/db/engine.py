@@ -0,0 +1,33 @@
+"""
+Модуль содержит параметры движка SQLAlchemy для разных СУБД.
+"""
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
+
+
+def engine_options(url, pool_size=None, max_overflow=None,
+                   pool_pre_ping=False, query_cache_size=None):
+    """Возвращает параметры create_engine для базы данных с данным URL.
+
+    pool_size и max_overflow задают размер пула соединений, pool_pre_ping
+    включает проверку соединения перед выдачей из пула, query_cache_size -
+    размер кэша скомпилированных запросов. Для SQLite в памяти пул
+    не используется: все сессии работают с одним соединением.
+    """
+    url = make_url(url)
+    options = {"pool_pre_ping": pool_pre_ping}
+    if query_cache_size is not None:
+        options["query_cache_size"] = query_cache_size
+
+    if url.get_backend_name() == 'sqlite':
+        if url.database in (None, '', ':memory:') or not pool_size:
+            return options
+        # По умолчанию для файла SQLite пул не используется
+        options["poolclass"] = QueuePool
+        options["connect_args"] = {"check_same_thread": False}
+
+    if pool_size is not None:
+        options["pool_size"] = pool_size
+    if max_overflow is not None:
+        options["max_overflow"] = max_overflow
+    return options
@@ -0,0 +1,174 @@
+"""
+Модуль содержит миграции схемы базы данных.
+
+Версия схемы хранится в таблице schema_version. Миграции применяются
+по порядку при создании приложения, новая база создается сразу
+в актуальной схеме.
+"""
+from sqlalchemy import inspect, text
+
+from manager.db.schema import db
+
+
+def _intervals_to_minutes(connection):
+    """Переводит интервалы работы и доставки из строк "HH:MM"
+    в целые минуты от начала суток и добавляет индексы для поиска
+    пересечений интервалов."""
+    for table, owner, ref in (('workinghours', 'courier_id', 'couriers'),
+                              ('deliveryhours', 'order_id', 'orders')):
+        connection.execute(text(
+            'ALTER TABLE %s RENAME TO %s_old' % (table, table)))
+        connection.execute(text(
+            'CREATE TABLE %s ('
+            'id INTEGER NOT NULL, '
+            '%s INTEGER, '
+            'start_time INTEGER, '
+            'end_time INTEGER, '
+            'PRIMARY KEY (id), '
+            'FOREIGN KEY(%s) REFERENCES %s (id))' % (table, owner, owner, ref)))
+        connection.execute(text(
+            'INSERT INTO {t} (id, {o}, start_time, end_time) '
+            'SELECT id, {o}, '
+            'CAST(substr(start_time, 1, 2) AS INTEGER) * 60 '
+            '+ CAST(substr(start_time, 4, 2) AS INTEGER), '
+            'CAST(substr(end_time, 1, 2) AS INTEGER) * 60 '
+            '+ CAST(substr(end_time, 4, 2) AS INTEGER) '
+            'FROM {t}_old'.format(t=table, o=owner)))
+        connection.execute(text('DROP TABLE %s_old' % table))
+
+    connection.execute(text(
+        'CREATE INDEX ix_workinghours_courier_interval '
+        'ON workinghours (courier_id, start_time, end_time)'))
+    connection.execute(text(
+        'CREATE INDEX ix_deliveryhours_order_interval '
+        'ON deliveryhours (order_id, start_time, end_time)'))
+    connection.execute(text(
+        'CREATE INDEX ix_orders_status_region_weight '
+        'ON orders (status, region, weight)'))
+
+
+def _lead_time_stats(connection):
+    """Добавляет статистику времени доставки по курьерам и районам
+    и заполняет ее по уже выполненным заказам."""
+    connection.execute(text(
+        'CREATE TABLE leadtimestats ('
+        'courier_id INTEGER NOT NULL, '
+        'region INTEGER NOT NULL, '
+        'lead_time_sum FLOAT NOT NULL, '
+        'completed_count INTEGER NOT NULL, '
+        'PRIMARY KEY (courier_id, region), '
+        'FOREIGN KEY(courier_id) REFERENCES couriers (id))'))
+    connection.execute(text(
+        "INSERT INTO leadtimestats "
+        "SELECT courier_id, region, SUM(lead_time), COUNT(*) FROM orders "
+        "WHERE status = 'completed' GROUP BY courier_id, region"))
+
+
+def _archive_tables(connection):
+    """Добавляет таблицы архива выполненных заказов."""
+    connection.execute(text(
+        'CREATE TABLE archivedorders ('
+        'id INTEGER NOT NULL, '
+        'courier_id INTEGER, '
+        'weight FLOAT, '
+        'region INTEGER, '
+        'lead_time FLOAT, '
+        'PRIMARY KEY (id), '
+        'FOREIGN KEY(courier_id) REFERENCES couriers (id))'))
+    connection.execute(text(
+        'CREATE TABLE archiveddeliveryhours ('
+        'id INTEGER NOT NULL, '
+        'order_id INTEGER, '
+        'start_time INTEGER, '
+        'end_time INTEGER, '
+        'PRIMARY KEY (id), '
+        'FOREIGN KEY(order_id) REFERENCES archivedorders (id))'))
+    connection.execute(text(
+        'CREATE INDEX ix_archiveddeliveryhours_order_id '
+        'ON archiveddeliveryhours (order_id)'))
+
+
+def _listing_indexes(connection):
+    """Добавляет индексы для постраничного вывода заказов и курьеров
+    с фильтрами: (поле фильтра, id), и индекс районов по курьеру
+    для загрузки районов вместе с курьерами."""
+    for name, table, columns in (
+            ('ix_orders_status_id', 'orders', 'status, id'),
+            ('ix_orders_region_id', 'orders', 'region, id'),
+            ('ix_orders_courier_id_id', 'orders', 'courier_id, id'),
+            ('ix_archivedorders_region_id', 'archivedorders', 'region, id'),
+            ('ix_archivedorders_courier_id_id', 'archivedorders', 'courier_id, id'),
+            ('ix_couriers_type_id', 'couriers', 'type, id'),
+            ('ix_regions_region_courier_id', 'regions', 'region, courier_id'),
+            ('ix_regions_courier_id', 'regions', 'courier_id')):
+        connection.execute(text(
+            'CREATE INDEX %s ON %s (%s)' % (name, table, columns)))
+
+
+def _idempotency_keys(connection):
+    """Добавляет таблицу ответов на запросы с ключом идемпотентности."""
+    connection.execute(text(
+        'CREATE TABLE idempotencykeys ('
+        'key VARCHAR NOT NULL, '
+        'endpoint VARCHAR NOT NULL, '
+        'fingerprint BLOB NOT NULL, '
+        'status INTEGER NOT NULL, '
+        'mimetype VARCHAR NOT NULL, '
+        'body BLOB NOT NULL, '
+        'expires FLOAT NOT NULL, '
+        'PRIMARY KEY (key))'))
+    connection.execute(text(
+        'CREATE INDEX ix_idempotencykeys_expires ON idempotencykeys (expires)'))
+
+
+def _order_ids(connection):
+    """Добавляет таблицу ID заказов, занятых при разбиении заказов
+    по шардам. Таблица заполняется при первом запуске с шардами
+    (см. manager.db.shards.OrderShards.setup)."""
+    connection.execute(text(
+        'CREATE TABLE orderids ('
+        'id INTEGER NOT NULL, '
+        'PRIMARY KEY (id))'))
+
+
+# Миграции в порядке применения, версия схемы - номер миграции + 1
+MIGRATIONS = (
+    _intervals_to_minutes,
+    _lead_time_stats,
+    _archive_tables,
+    _listing_indexes,
+    _idempotency_keys,
+    _order_ids,
+)
+
+
+def current_version(connection):
+    """Возвращает текущую версию схемы базы данных."""
+    return connection.execute(
+        text('SELECT version FROM schema_version')).scalar()
+
+
+def upgrade(engine=None):
+    """Приводит схему базы данных к актуальной версии."""
+    engine = engine or db.engine
+    with engine.begin() as connection:
+        tables = inspect(connection).get_table_names()
+        if 'couriers' not in tables:
+            # Новая база создается сразу в актуальной схеме
+            db.metadata.create_all(connection)
+            version = len(MIGRATIONS)
+        elif 'schema_version' not in tables:
+            version = 0
+        else:
+            version = current_version(connection)
+
+        if 'schema_version' not in tables:
+            connection.execute(text(
+                'CREATE TABLE schema_version (version INTEGER NOT NULL)'))
+            connection.execute(text(
+                'INSERT INTO schema_version (version) VALUES (:v)'), {"v": version})
+
+        for migration in MIGRATIONS[version:]:
+            migration(connection)
+        connection.execute(text('UPDATE schema_version SET version = :v'),
+                           {"v": len(MIGRATIONS)})
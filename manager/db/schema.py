@@ -1,21 +1,99 @@
 from sqlalchemy.ext.hybrid import hybrid_method, hybrid_property
-from sqlalchemy import or_, and_
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import joinedload, sessionmaker
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy import and_, exists, false, or_
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
 
-db = SQLAlchemy()
+
+class RoutingSession(SignallingSession):
+    """Сессия, которая выполняет запросы к таблицам заказов в текущем
+    шарде, если заказы разбиты по шардам (см. manager.db.shards)."""
+
+    def __init__(self, db, **options):
+        SignallingSession.__init__(self, db, **options)
+        self.order_shards = self.app.extensions.get('order_shards')
+
+    def get_bind(self, mapper=None, clause=None, shard=None, **kwargs):
+        if self.order_shards is not None:
+            engine = self.order_shards.get_bind(self, mapper, clause, shard)
+            if engine is not None:
+                return engine
+        return SignallingSession.get_bind(self, mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+db = RoutingSQLAlchemy()
+
+# Максимальное количество параметров в одном запросе вида "IN (...)"
+BULK_CHUNK_SIZE = 500
+
+
+def chunks(items, size=BULK_CHUNK_SIZE):
+    """Разбивает список на части размером не более size."""
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def time_to_minutes(time):
+    """Переводит время вида "HH:MM" в количество минут от начала суток."""
+    hours, minutes = time.split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+def minutes_to_time(minutes):
+    """Переводит количество минут от начала суток во время вида "HH:MM"."""
+    return '%02d:%02d' % divmod(minutes, 60)
+
+
+def parse_interval(interval):
+    """Переводит интервал вида "HH:MM-HH:MM" в пару (начало, конец) в минутах."""
+    start, end = interval.split('-')
+    return time_to_minutes(start), time_to_minutes(end)
+
+
+def format_interval(start, end):
+    """Переводит интервал в минутах в строку вида "HH:MM-HH:MM"."""
+    return '-'.join((minutes_to_time(start), minutes_to_time(end)))
+
+
+def existing_ids(model, ids, *archives):
+    """Возвращает множество тех ID из данных, которые уже есть в таблице
+    или в одной из таблиц archives. Все таблицы проверяются одним запросом."""
+    # Нецелые ID и ID вне диапазона INTEGER SQLite в любом случае
+    # не пройдут валидацию, в базу их не отправляем
+    ids = [i for i in ids if isinstance(i, int) and 1 <= i < 2 ** 63]
+    result = set()
+    for chunk in chunks(ids, BULK_CHUNK_SIZE // (1 + len(archives))):
+        query = db.session.query(model.id).filter(model.id.in_(chunk))
+        for archive in archives:
+            query = query.union_all(
+                db.session.query(archive.id).filter(archive.id.in_(chunk)))
+        result.update(row[0] for row in query.all())
+    return result
 
 
 class Courier(db.Model):
     __tablename__ = 'couriers'
     id = db.Column(db.Integer, primary_key=True)
     type = db.Column(db.String, nullable=False)
-    current_weight = db.Column(db.Integer, default=0)
+    current_weight = db.Column(db.Float, default=0)
     earnings = db.Column(db.Integer, default=0)
     salary = db.Column(db.Integer, default=0)
-    assign_time = db.Column(db.Integer, nullable=True)
-    start_time = db.Column(db.Integer, nullable=True)
-    regions = db.relationship("Region", backref='couriers')
-    working_hours = db.relationship("WorkingHours", backref='couriers')
+    assign_time = db.Column(db.Float, nullable=True)
+    start_time = db.Column(db.Float, nullable=True)
+    regions = db.relationship("Region", backref='couriers',
+                              order_by="Region.id")
+    working_hours = db.relationship("WorkingHours", backref='couriers',
+                                    order_by="WorkingHours.id")
+
+    # Индексы для постраничного вывода с фильтрами (GET /couriers)
+    __table_args__ = (
+        db.Index('ix_couriers_type_id', 'type', 'id'),
+    )
 
     def __init__(self, id, type):
         self.id = id
@@ -23,20 +101,51 @@ class Courier(db.Model):
 
     @classmethod
     def get(cls, courier_id):
-        return cls.query.filter_by(id=courier_id).first()
+        """Возвращает курьера. Если курьер уже загружен в текущем запросе
+        (например, при валидации), он берется из сессии без обращения к базе."""
+        return cls.query.get(courier_id)
+
+    @classmethod
+    def get_profile(cls, courier_id):
+        """Возвращает курьера вместе с районами и графиком работы,
+        загруженными одним запросом."""
+        return cls.query\
+            .options(joinedload(cls.regions), joinedload(cls.working_hours))\
+            .filter_by(id=courier_id).first()
+
+    @classmethod
+    def existing_ids(cls, courier_ids):
+        return existing_ids(cls, courier_ids)
+
+    @classmethod
+    def bulk_create(cls, couriers_data):
+        """Добавляет курьеров, их районы и графики работы
+        многострочными вставками в текущей транзакции."""
+        couriers, regions, working_hours = [], [], []
+        for data in couriers_data:
+            courier_id = data["courier_id"]
+            couriers.append({"id": courier_id, "type": data["courier_type"]})
+            regions.extend({"courier_id": courier_id, "region": r}
+                           for r in data["regions"])
+            for interval in data["working_hours"]:
+                start, end = parse_interval(interval)
+                working_hours.append({"courier_id": courier_id,
+                                      "start_time": start, "end_time": end})
+
+        db.session.bulk_insert_mappings(cls, couriers)
+        db.session.bulk_insert_mappings(Region, regions)
+        db.session.bulk_insert_mappings(WorkingHours, working_hours)
 
     @hybrid_property
     def get_regions(self):
         """"Возвращает список районов работы курьера."""
-        regions = db.session.query(Region).filter_by(courier_id=self.id).all()
-        return [r.region for r in regions]
+        return [r.region for r in self.regions]
 
     @hybrid_property
     def get_working_hours(self):
         """"Возвращает список интервалов работы(график) курьера."""
-        working_hours = db.session.query(WorkingHours)\
-            .filter_by(courier_id=self.id).all()
-        return ['-'.join((i.start_time, i.end_time)) for i in working_hours]
+        return [format_interval(i.start_time, i.end_time)
+                for i in self.working_hours]
 
     @hybrid_property
     def salary_coeff(self):
@@ -68,9 +177,17 @@ class Order(db.Model):
     weight = db.Column(db.Float)
     region = db.Column(db.Integer)
     status = db.Column(db.String, default="free")
-    lead_time = db.Column(db.Integer, nullable=True)
+    lead_time = db.Column(db.Float, nullable=True)
     delivery_hours = db.relationship("DeliveryHours")
 
+    __table_args__ = (
+        db.Index('ix_orders_status_region_weight', 'status', 'region', 'weight'),
+        # Индексы для постраничного вывода с фильтрами (GET /orders)
+        db.Index('ix_orders_status_id', 'status', 'id'),
+        db.Index('ix_orders_region_id', 'region', 'id'),
+        db.Index('ix_orders_courier_id_id', 'courier_id', 'id'),
+    )
+
     def __init__(self, id, weight, region):
         self.id = id
         self.weight = weight
@@ -78,7 +195,31 @@ class Order(db.Model):
 
     @classmethod
     def get(cls, order_id):
-        return cls.query.filter_by(id=order_id).first()
+        """Возвращает заказ. Если заказ уже загружен в текущем запросе
+        (например, при валидации), он берется из сессии без обращения к базе."""
+        return cls.query.get(order_id)
+
+    @classmethod
+    def existing_ids(cls, order_ids):
+        # ID перенесенных в архив заказов тоже заняты
+        return existing_ids(cls, order_ids, ArchivedOrder)
+
+    @classmethod
+    def bulk_create(cls, orders_data):
+        """Добавляет заказы и их время доставки
+        многострочными вставками в текущей транзакции."""
+        orders, delivery_hours = [], []
+        for data in orders_data:
+            order_id = data["order_id"]
+            orders.append({"id": order_id, "weight": data["weight"],
+                           "region": data["region"]})
+            for interval in data["delivery_hours"]:
+                start, end = parse_interval(interval)
+                delivery_hours.append({"order_id": order_id,
+                                       "start_time": start, "end_time": end})
+
+        db.session.bulk_insert_mappings(cls, orders)
+        db.session.bulk_insert_mappings(DeliveryHours, delivery_hours)
 
     @hybrid_method
     def assigned_to(self, courier_id):
@@ -94,7 +235,25 @@ class Order(db.Model):
     def available(self, regions):
         """Возвращает, доступен ли заказ для выдачи
         курьеру с данными районами работы"""
-        return and_(self.status == "free", or_(*[self.region == r for r in regions]))
+        return and_(self.status == "free", self.region.in_(regions))
+
+    @hybrid_method
+    def deliverable_by(self, courier_id):
+        """Возвращает, пересекается ли время доставки заказа
+        с графиком работы данного курьера."""
+        return exists().where(and_(DeliveryHours.order_id == self.id,
+                                   DeliveryHours.intersects(courier_id)))
+
+    @hybrid_method
+    def deliverable_within(self, intervals):
+        """Возвращает, пересекается ли время доставки заказа с одним
+        из интервалов (начало, конец) в минутах. В отличие от deliverable_by
+        не обращается к графику работы курьера в базе данных, поэтому
+        выполняется и в шарде заказов."""
+        return exists().where(and_(
+            DeliveryHours.order_id == self.id,
+            or_(false(), *[DeliveryHours.intersects_interval(start, end)
+                           for start, end in intervals])))
 
     @hybrid_property
     def free(self):
@@ -108,11 +267,62 @@ class Order(db.Model):
         self.status = "assigned"
         self.courier_id = courier_id
 
+    @classmethod
+    def claim(cls, orders, courier_id):
+        """Назначает данному курьеру те из заказов, которые все еще свободны.
+        Проверка и назначение выполняются одним условным UPDATE, поэтому
+        параллельные запросы не могут выдать заказ двум курьерам.
+        Возвращает список назначенных заказов."""
+        ids = [order.id for order in orders]
+        if not ids:
+            return []
+        updated = db.session.query(cls)\
+            .filter(cls.id.in_(ids), cls.status == "free")\
+            .update({"status": "assigned", "courier_id": courier_id},
+                    synchronize_session=False)
+        if updated == len(ids):
+            won = orders
+        else:
+            # Часть заказов уже забрал другой запрос
+            claimed = {row[0] for row in db.session.query(cls.id).filter(
+                cls.id.in_(ids), cls.assigned_to(courier_id))}
+            won = [order for order in orders if order.id in claimed]
+            for order in orders:
+                if order.id not in claimed:
+                    db.session.expire(order)
+        for order in won:
+            set_committed_value(order, 'status', "assigned")
+            set_committed_value(order, 'courier_id', courier_id)
+        return won
+
+    @classmethod
+    def release(cls, *criteria):
+        """Делает свободными заказы, удовлетворяющие условиям, одним UPDATE.
+        Загруженные в сессию объекты снятых заказов не обновляются.
+        Возвращает список пар (ID, вес) снятых заказов."""
+        released = db.session.query(cls.id, cls.weight).filter(*criteria).all()
+        if released:
+            db.session.query(cls).filter(*criteria)\
+                .update({"status": "free", "courier_id": None},
+                        synchronize_session=False)
+        return released
+
     @hybrid_method
-    def complete(self, start_time, end_time):
-        """Обновляет данные заказа после его выполнения."""
-        self.status = "completed"
-        self.lead_time = end_time - start_time
+    def complete(self, courier_id, start_time, end_time):
+        """Отмечает заказ, назначенный данному курьеру, выполненным.
+        Проверка и обновление выполняются одним условным UPDATE, поэтому
+        из параллельных запросов заказ выполняет только один.
+        Возвращает, выполнил ли заказ этот запрос."""
+        lead_time = end_time - start_time
+        updated = db.session.query(Order)\
+            .filter(Order.id == self.id, Order.assigned_to(courier_id))\
+            .update({"status": "completed", "lead_time": lead_time},
+                    synchronize_session=False)
+        if updated != 1:
+            return False
+        set_committed_value(self, 'status', "completed")
+        set_committed_value(self, 'lead_time', lead_time)
+        return True
 
     @hybrid_method
     def outside_courier_regions(self, courier_id, regions):
@@ -123,12 +333,114 @@ class Order(db.Model):
                     *[self.region != r for r in regions])
 
 
+class ArchivedOrder(db.Model):
+    """Выполненный заказ, перенесенный из orders (см. manager.db.archive)."""
+    __tablename__ = 'archivedorders'
+    id = db.Column(db.Integer, primary_key=True)
+    courier_id = db.Column(db.Integer, db.ForeignKey('couriers.id'))
+    weight = db.Column(db.Float)
+    region = db.Column(db.Integer)
+    lead_time = db.Column(db.Float)
+
+    __table_args__ = (
+        db.Index('ix_archivedorders_region_id', 'region', 'id'),
+        db.Index('ix_archivedorders_courier_id_id', 'courier_id', 'id'),
+    )
+
+    @classmethod
+    def get(cls, order_id):
+        return cls.query.get(order_id)
+
+
+class ArchivedDeliveryHours(db.Model):
+    """Время доставки заказа, перенесенного в архив."""
+    __tablename__ = 'archiveddeliveryhours'
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('archivedorders.id'))
+    start_time = db.Column(db.Integer)
+    end_time = db.Column(db.Integer)
+
+    __table_args__ = (
+        db.Index('ix_archiveddeliveryhours_order_id', 'order_id'),
+    )
+
+
+class OrderId(db.Model):
+    """ID заказа, занятый при разбиении заказов по шардам
+    (см. manager.db.shards). Таблица хранится в основной базе данных,
+    поэтому ID заказов уникальны во всех шардах."""
+    __tablename__ = 'orderids'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+
+    @classmethod
+    def existing_ids(cls, order_ids):
+        return existing_ids(cls, order_ids)
+
+    @classmethod
+    def reserve(cls, order_ids):
+        """Занимает ID в текущей транзакции. Если ID уже занят,
+        вызывает IntegrityError."""
+        db.session.bulk_insert_mappings(cls, [{"id": i} for i in order_ids])
+
+
+class IdempotencyKey(db.Model):
+    """Ответ на запрос с заголовком Idempotency-Key (см. manager.api.idempotency)."""
+    __tablename__ = 'idempotencykeys'
+    key = db.Column(db.String, primary_key=True)
+    endpoint = db.Column(db.String, nullable=False)
+    # Хэш тела запроса
+    fingerprint = db.Column(db.LargeBinary, nullable=False)
+    status = db.Column(db.Integer, nullable=False)
+    mimetype = db.Column(db.String, nullable=False)
+    # Тело ответа, сжатое zlib
+    body = db.Column(db.LargeBinary, nullable=False)
+    expires = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_idempotencykeys_expires', 'expires'),
+    )
+
+
+class LeadTimeStats(db.Model):
+    """Суммарное время и количество выполненных заказов курьера по району."""
+    __tablename__ = 'leadtimestats'
+    courier_id = db.Column(db.Integer, db.ForeignKey('couriers.id'), primary_key=True)
+    region = db.Column(db.Integer, primary_key=True)
+    lead_time_sum = db.Column(db.Float, nullable=False, default=0)
+    completed_count = db.Column(db.Integer, nullable=False, default=0)
+
+    @classmethod
+    def add(cls, courier_id, region, lead_time):
+        """Учитывает выполненный заказ в статистике курьера."""
+        updated = db.session.query(cls)\
+            .filter_by(courier_id=courier_id, region=region)\
+            .update({"lead_time_sum": cls.lead_time_sum + lead_time,
+                     "completed_count": cls.completed_count + 1},
+                    synchronize_session=False)
+        if not updated:
+            db.session.execute(cls.__table__.insert().values(
+                courier_id=courier_id, region=region,
+                lead_time_sum=lead_time, completed_count=1))
+
+    @classmethod
+    def average_lead_times(cls, courier_id):
+        """Возвращает среднее время доставки курьера по каждому району."""
+        rows = db.session.query(cls.lead_time_sum, cls.completed_count)\
+            .filter_by(courier_id=courier_id).all()
+        return [total / count for total, count in rows if count]
+
+
 class Region(db.Model):
     __tablename__ = 'regions'
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     courier_id = db.Column(db.Integer, db.ForeignKey('couriers.id'))
     region = db.Column(db.Integer)
 
+    __table_args__ = (
+        db.Index('ix_regions_region_courier_id', 'region', 'courier_id'),
+        db.Index('ix_regions_courier_id', 'courier_id'),
+    )
+
     def __init__(self, courier_id, region):
         self.courier_id = courier_id
         self.region = region
@@ -138,8 +450,14 @@ class WorkingHours(db.Model):
     __tablename__ = 'workinghours'
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     courier_id = db.Column(db.Integer, db.ForeignKey('couriers.id'))
-    start_time = db.Column(db.String)
-    end_time = db.Column(db.String)
+    # Время хранится в минутах от начала суток
+    start_time = db.Column(db.Integer)
+    end_time = db.Column(db.Integer)
+
+    __table_args__ = (
+        db.Index('ix_workinghours_courier_interval',
+                 'courier_id', 'start_time', 'end_time'),
+    )
 
     def __init__(self, courier_id, start_time, end_time):
         self.courier_id = courier_id
@@ -155,8 +473,14 @@ class DeliveryHours(db.Model):
     __tablename__ = 'deliveryhours'
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     order_id = db.Column(db.Integer, db.ForeignKey('orders.id'))
-    start_time = db.Column(db.String)
-    end_time = db.Column(db.String)
+    # Время хранится в минутах от начала суток
+    start_time = db.Column(db.Integer)
+    end_time = db.Column(db.Integer)
+
+    __table_args__ = (
+        db.Index('ix_deliveryhours_order_interval',
+                 'order_id', 'start_time', 'end_time'),
+    )
 
     def __init__(self, order_id, start_time, end_time):
         self.order_id = order_id
@@ -167,15 +491,13 @@ class DeliveryHours(db.Model):
     def intersects_interval(self, start, end):
         """Возвращает, пересекается ли время для приема
         заказа с данным интервалом."""
-        return or_(and_(self.start_time <= start, start < self.end_time),
-                   and_(self.start_time < end, end <= self.end_time),
-                   and_(self.start_time >= start, end >= self.end_time))
+        return and_(self.start_time < end, start < self.end_time)
 
     @hybrid_method
-    def intersects(self, working_hours):
+    def intersects(self, courier_id):
         """Возвращает, пересекается ли время для приема
         заказа с графиком работы курьера."""
-        if not working_hours:
-            return False
-        return or_(*[self.intersects_interval(wh.start_time, wh.start_time)
-                     for wh in working_hours])
+        return exists().where(and_(
+            WorkingHours.courier_id == courier_id,
+            self.intersects_interval(WorkingHours.start_time,
+                                     WorkingHours.end_time)))
@@ -0,0 +1,261 @@
+"""
+Модуль содержит разбиение заказов по районам между несколькими базами
+данных (шардами).
+
+Заказы, их время доставки и архив заказов (SHARD_TABLES) хранятся
+в шарде, номер которого - район заказа по модулю количества шардов:
+районы с соседними номерами попадают в разные шарды. Курьеры, их
+районы и графики работы, статистика времени доставки и ключи
+идемпотентности остаются в основной базе данных.
+Запросы сессии к таблицам заказов выполняются в текущем шарде
+(OrderShards.use), поэтому модели не меняются: обработчики выполняют
+те же запросы в каждом шарде, покрывающем районы курьера, и объединяют
+результаты. Объекты заказов помнят свой шард (опция OrderShard, с
+которой они загружены): загрузка их атрибутов после фиксации транзакции
+и их связей выполняется в нем же.
+
+ID заказов уникальны во всех шардах: добавление заказов сначала
+занимает их ID в таблице orderids основной базы данных (OrderId)
+в той же транзакции, и ID, занятый другим запросом, вызывает
+IntegrityError до записи в шарды.
+
+Запросы по одному району обращаются только к его шарду, и нагрузка
+на разные районы распределяется между базами данных. Транзакция
+фиксируется в основной базе и в каждом затронутом шарде по очереди,
+а не атомарно. Количество шардов нельзя менять без переноса заказов.
+Пул свободных заказов, заранее вычисленные списки кандидатов
+и PATCH_REOFFER с шардами не поддерживаются.
+
+    ORDER_SHARDS = ['orders-0.db', 'orders-1.db', 'orders-2.db']
+"""
+from contextlib import contextmanager
+
+from flask import current_app
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm.interfaces import UserDefinedOption
+from sqlalchemy.schema import CreateIndex, CreateTable
+from sqlalchemy.sql.traversals import InternalTraversal
+from sqlalchemy.sql.util import find_tables
+
+from manager.db.schema import db, RoutingSession, Order, OrderId, ArchivedOrder
+from manager.db.sqlite import apply_pragmas
+
+
+SHARD_TABLES = ('orders', 'deliveryhours', 'archivedorders', 'archiveddeliveryhours')
+
+# Ключ номера текущего шарда в session.info
+SHARD_KEY = 'order_shard'
+
+
+def shard_binds(shards):
+    """Возвращает SQLALCHEMY_BINDS для шардов: пути к файлам SQLite
+    или URL баз данных."""
+    return {'orders-%d' % number: shard if '://' in shard else 'sqlite:///%s' % shard
+            for number, shard in enumerate(shards)}
+
+
+def current_shards():
+    """Возвращает шарды заказов приложения или None, если заказы
+    хранятся в основной базе данных."""
+    return current_app.extensions.get('order_shards')
+
+
+class OrderShard(UserDefinedOption):
+    """Опция запроса с номером шарда (payload). Объекты, загруженные
+    с ней, передают ее запросам загрузки своих атрибутов и связей."""
+    propagate_to_loaders = True
+    # Номер шарда входит в ключ кэша скомпилированных запросов
+    _cache_key_traversal = [("payload", InternalTraversal.dp_plain_obj)]
+
+
+def execute_in_shard(orm_context):
+    """Загрузка атрибутов и связей объекта выполняется в шарде, из
+    которого он загружен. Остальные запросы к таблицам заказов
+    выполняются в текущем шарде с опцией OrderShard."""
+    shards = orm_context.session.order_shards
+    if shards is None or not orm_context.is_select \
+            or 'shard' in orm_context.bind_arguments:
+        return None
+    if orm_context.is_column_load or orm_context.is_relationship_load:
+        for option in orm_context.user_defined_options:
+            if isinstance(option, OrderShard):
+                return orm_context.invoke_statement(bind_arguments=dict(
+                    orm_context.bind_arguments, shard=option.payload))
+        return None
+    shard = orm_context.session.info.get(SHARD_KEY)
+    if shard is None or not any(mapper.persist_selectable in shards.tables
+                                for mapper in orm_context.all_mappers):
+        return None
+    return orm_context.invoke_statement(
+        statement=orm_context.statement.options(OrderShard(shard)),
+        bind_arguments=dict(orm_context.bind_arguments, shard=shard))
+
+
+class OrderShards:
+    def __init__(self, app):
+        self.engine = db.get_engine(app)
+        self.engines = [db.get_engine(app, bind=bind)
+                        for bind in shard_binds(app.config['ORDER_SHARDS'])]
+        self.tables = frozenset(db.metadata.tables[name] for name in SHARD_TABLES)
+        # Обработчик событий нужен только при разбиении по шардам
+        if not event.contains(RoutingSession, 'do_orm_execute', execute_in_shard):
+            event.listen(RoutingSession, 'do_orm_execute', execute_in_shard)
+
+    def setup(self, pragmas):
+        """Настраивает соединения шардов и создает в них таблицы заказов,
+        если их еще нет. Внешние ключи на таблицы основной базы данных
+        в шардах не создаются."""
+        for engine in self.engines:
+            apply_pragmas(engine, pragmas)
+            with engine.begin() as connection:
+                existing = set(inspect(connection).get_table_names())
+                for table in db.metadata.sorted_tables:
+                    if table.name not in SHARD_TABLES or table.name in existing:
+                        continue
+                    connection.execute(CreateTable(table, include_foreign_key_constraints=[
+                        fk for fk in table.foreign_key_constraints
+                        if fk.referred_table.name in SHARD_TABLES]))
+                    for index in table.indexes:
+                        connection.execute(CreateIndex(index))
+        self.reserve_existing_ids()
+
+    def reserve_existing_ids(self):
+        """Заполняет таблицу orderids ID заказов из шардов, если она
+        пуста (первый запуск с шардами)."""
+        with self.engine.begin() as connection:
+            if connection.execute(select(OrderId.id).limit(1)).first() is not None:
+                return
+            for engine in self.engines:
+                with engine.connect() as shard:
+                    for model in (Order, ArchivedOrder):
+                        ids = [{"id": row[0]} for row in shard.execute(select(model.id))]
+                        if ids:
+                            connection.execute(OrderId.__table__.insert(), ids)
+
+    def get_bind(self, session, mapper, clause, shard):
+        """Возвращает движок шарда для запроса к таблицам заказов
+        или None для запроса к таблицам основной базы данных."""
+        if mapper is not None:
+            if mapper.persist_selectable not in self.tables:
+                return None
+        elif clause is None or self.tables.isdisjoint(find_tables(
+                clause, include_aliases=True, include_joins=True,
+                include_selects=True, include_crud=True)):
+            return None
+        if shard is None:
+            shard = session.info.get(SHARD_KEY)
+        if shard is None:
+            raise RuntimeError("Orders are sharded, but no shard is selected")
+        return self.engines[shard]
+
+    def shard_of(self, region):
+        """Возвращает номер шарда района."""
+        return region % len(self.engines)
+
+    def group(self, regions):
+        """Раскладывает районы по шардам: словарь номер шарда -> районы."""
+        groups = {}
+        for region in regions:
+            groups.setdefault(self.shard_of(region), []).append(region)
+        return groups
+
+    @contextmanager
+    def use(self, shard):
+        """Делает шард текущим для запросов сессии к таблицам заказов."""
+        info = db.session.info
+        previous = info.get(SHARD_KEY)
+        info[SHARD_KEY] = shard
+        try:
+            yield
+        finally:
+            info[SHARD_KEY] = previous
+
+    def each(self, regions=None):
+        """Делает текущим по очереди каждый шард, покрывающий районы
+        regions (по умолчанию все шарды), и возвращает районы шарда."""
+        if regions is None:
+            groups = dict.fromkeys(range(len(self.engines)))
+        else:
+            groups = self.group(regions)
+        for shard in sorted(groups):
+            with self.use(shard):
+                yield groups[shard]
+
+
+def each_shard(regions=None):
+    """OrderShards.each для текущего приложения. Если заказы хранятся
+    в основной базе данных, возвращает regions один раз."""
+    shards = current_shards()
+    if shards is None:
+        yield regions
+    else:
+        yield from shards.each(regions)
+
+
+@contextmanager
+def region_shard(region):
+    """Делает текущим шард района, если заказы разбиты по шардам."""
+    shards = current_shards()
+    if shards is None:
+        yield
+    else:
+        with shards.use(shards.shard_of(region)):
+            yield
+
+
+def find_order(model, order_id):
+    """Возвращает model.get(order_id), при разбиении по шардам -
+    из шарда, в котором есть заказ."""
+    for _ in each_shard():
+        order = model.get(order_id)
+        if order is not None:
+            return order
+    return None
+
+
+def existing_order_ids(order_ids):
+    """Order.existing_ids, при разбиении по шардам - ID, занятые
+    в основной базе данных."""
+    if current_shards() is None:
+        return Order.existing_ids(order_ids)
+    return OrderId.existing_ids(order_ids)
+
+
+def create_orders(orders_data):
+    """Order.bulk_create: заказы добавляются в шарды своих районов,
+    их ID занимаются в основной базе данных."""
+    shards = current_shards()
+    if shards is None:
+        Order.bulk_create(orders_data)
+        return
+    # ID занимаются до записи в шарды; конфликт - IntegrityError
+    OrderId.reserve([data["order_id"] for data in orders_data])
+    groups = {}
+    for data in orders_data:
+        groups.setdefault(shards.shard_of(data["region"]), []).append(data)
+    for shard in sorted(groups):
+        with shards.use(shard):
+            Order.bulk_create(groups[shard])
+
+
+def claim_orders(orders, courier_id):
+    """Order.claim: заказы назначаются в шардах своих районов."""
+    shards = current_shards()
+    if shards is None:
+        return Order.claim(orders, courier_id)
+    groups = {}
+    for order in orders:
+        groups.setdefault(shards.shard_of(order.region), []).append(order)
+    claimed = []
+    for shard in sorted(groups):
+        with shards.use(shard):
+            claimed += Order.claim(groups[shard], courier_id)
+    return claimed
+
+
+def release_orders(*criteria):
+    """Order.release во всех шардах."""
+    released = []
+    for _ in each_shard():
+        released += Order.release(*criteria)
+    return released
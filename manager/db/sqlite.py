@@ -0,0 +1,29 @@
+"""
+Модуль содержит настройку соединений SQLite.
+"""
+from sqlalchemy import event
+
+
+# Настройки по умолчанию: журнал WAL не блокирует читателей пишущим процессом,
+# busy_timeout заставляет ждать освобождения блокировки вместо ошибки
+# "database is locked", mmap_size ускоряет чтение.
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+}
+
+
+def apply_pragmas(engine, pragmas):
+    """Выполняет PRAGMA для каждого нового соединения движка SQLite.
+    Соединения открываются в каждом процессе-обработчике отдельно,
+    поэтому настройки действуют во всех процессах."""
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute('PRAGMA %s = %s' % (name, value))
+        cursor.close()
@@ -0,0 +1,53 @@
+"""
+Модуль содержит обслуживание статистики времени доставки (LeadTimeStats):
+пересчет по выполненным заказам и проверку согласованности.
+"""
+from sqlalchemy import func
+
+from manager.db.schema import db, Order, ArchivedOrder, LeadTimeStats
+from manager.db.shards import each_shard
+
+
+def collect_lead_times():
+    """Вычисляет статистику по выполненным заказам, включая перенесенные
+    в архив: словарь (ID курьера, район) -> (суммарное время, количество заказов)."""
+    stats = {}
+    for _ in each_shard():
+        for model, criteria in ((Order, (Order.status == "completed",)),
+                                (ArchivedOrder, ())):
+            rows = db.session.query(model.courier_id, model.region,
+                                    func.sum(model.lead_time), func.count(model.id))\
+                .filter(*criteria)\
+                .group_by(model.courier_id, model.region).all()
+            for courier_id, region, total, count in rows:
+                old_total, old_count = stats.get((courier_id, region), (0, 0))
+                stats[courier_id, region] = (old_total + total, old_count + count)
+    return stats
+
+
+def backfill():
+    """Пересчитывает статистику заново по выполненным заказам.
+    Возвращает количество записей статистики."""
+    stats = collect_lead_times()
+    db.session.query(LeadTimeStats).delete()
+    db.session.bulk_insert_mappings(LeadTimeStats, [
+        {"courier_id": courier_id, "region": region,
+         "lead_time_sum": total, "completed_count": count}
+        for (courier_id, region), (total, count) in stats.items()])
+    db.session.commit()
+    return len(stats)
+
+
+def check(tolerance=1e-6):
+    """Сравнивает статистику с выполненными заказами. Возвращает список
+    расхождений (ID курьера, район, ожидаемое, сохраненное)."""
+    expected = collect_lead_times()
+    stored = {(s.courier_id, s.region): (s.lead_time_sum, s.completed_count)
+              for s in LeadTimeStats.query.all()}
+    mismatches = []
+    for key in sorted(set(expected) | set(stored)):
+        exp, got = expected.get(key), stored.get(key)
+        if exp is None or got is None or exp[1] != got[1] \
+                or abs(exp[0] - got[0]) > tolerance:
+            mismatches.append(key + (exp, got))
+    return mismatches
@@ -0,0 +1,168 @@
+"""
+Проверка асинхронного режима (manager.api.asgi) без сервера: запросы
+передаются приложению ASGI напрямую.
+"""
+import asyncio
+import json
+from threading import Thread
+from time import perf_counter, sleep
+
+from flask import Flask
+
+from manager.api.app import create_app
+from manager.api.asgi import AsgiApp, SEND_WINDOW
+from tests.test_backends import scenario
+
+
+COURIER = {"courier_id": 1, "courier_type": "foot", "regions": [1],
+           "working_hours": ["09:00-18:00"]}
+ORDER = {"order_id": 1, "weight": 1, "region": 1, "delivery_hours": ["10:00-11:00"]}
+
+
+class Response:
+    def __init__(self, messages):
+        start = messages[0]
+        self.status_code = start['status']
+        self.headers = {name.decode(): value.decode() for name, value in start['headers']}
+        self.data = b''.join(m.get('body', b'') for m in messages[1:])
+
+    def get_data(self, as_text=False):
+        return self.data.decode() if as_text else self.data
+
+    def get_json(self):
+        try:
+            return json.loads(self.data)
+        except ValueError:
+            return None
+
+
+async def request(asgi, method, url, data=None, headers=(), send_delay=0,
+                  disconnect_after=None, messages=None):
+    """Выполняет запрос и возвращает ответ. Клиент принимает каждую часть
+    ответа за send_delay секунд и отключается через disconnect_after секунд.
+    Отправленные сообщения добавляются в messages."""
+    path, _, query = url.partition('?')
+    body = b'' if data is None else json.dumps(data).encode()
+    scope = {'type': 'http', 'method': method.upper(), 'path': path,
+             'query_string': query.encode(), 'root_path': '', 'scheme': 'http',
+             'http_version': '1.1', 'server': ('127.0.0.1', 8080),
+             'client': ('127.0.0.1', 5555),
+             'headers': list(headers)}
+    if body:
+        scope['headers'].append((b'content-type', b'application/json'))
+    received = False
+    messages = [] if messages is None else messages
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        await asyncio.sleep(3600 if disconnect_after is None else disconnect_after)
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        messages.append(message)
+        await asyncio.sleep(send_delay)
+
+    await asgi(scope, receive, send)
+    return Response(messages)
+
+
+class Client:
+    """Синхронный клиент приложения ASGI с тем же интерфейсом, что у
+    тестового клиента Flask."""
+
+    def __init__(self, asgi):
+        self.asgi = asgi
+
+    def __getattr__(self, method):
+        def call(url, json=None):
+            return asyncio.run(request(self.asgi, method, url, json))
+        return call
+
+
+def test_same_responses_as_wsgi(tmp_path):
+    wsgi = create_app(str(tmp_path / 'wsgi.db')).test_client()
+    asgi = Client(AsgiApp(create_app(str(tmp_path / 'asgi.db')), threads=2))
+    assert scenario(asgi) == scenario(wsgi)
+
+
+def test_waits_do_not_hold_pool_threads(tmp_path):
+    app = create_app(str(tmp_path / 'data.db'))
+    app.test_client().post('/couriers', json={"data": [COURIER]})
+    asgi = AsgiApp(app, threads=1)
+    notifier = app.extensions['orders_notifier']
+
+    async def run():
+        waits = [asyncio.ensure_future(request(asgi, 'get', '/couriers/1/orders/wait?timeout=5'))
+                 for _ in range(8)]
+        events = asyncio.ensure_future(request(
+            asgi, 'get', '/couriers/1/orders/wait?timeout=5',
+            headers=[(b'accept', b'text/event-stream')]))
+        while notifier.waiting() < 9:
+            await asyncio.sleep(0.01)
+
+        # Ожидающие не занимают единственный поток пула
+        start = perf_counter()
+        info = await request(asgi, 'get', '/couriers/1')
+        elapsed = perf_counter() - start
+        added = await request(asgi, 'post', '/orders', {"data": [ORDER]})
+        return info, elapsed, added, await asyncio.gather(*waits), await events
+
+    info, elapsed, added, waits, events = asyncio.run(run())
+    assert info.status_code == 200 and elapsed < 1
+    assert added.status_code == 201
+    body = app.test_client().get('/couriers/1/orders/wait?timeout=0').get_data()
+    assert [(wait.status_code, wait.data) for wait in waits] == [(200, body)] * 8
+    assert events.headers['content-type'].startswith('text/event-stream')
+    assert 'event: orders\n' in events.get_data(as_text=True)
+    assert notifier.waiting() == 0
+
+
+def test_disconnect_stops_waiting(tmp_path):
+    app = create_app(str(tmp_path / 'data.db'))
+    app.test_client().post('/couriers', json={"data": [COURIER]})
+    asgi = AsgiApp(app, threads=1)
+
+    start = perf_counter()
+    asyncio.run(request(asgi, 'get', '/couriers/1/orders/wait?timeout=30',
+                        headers=[(b'accept', b'text/event-stream')],
+                        disconnect_after=0.2))
+    assert perf_counter() - start < 5
+    assert app.extensions['orders_notifier'].waiting() == 0
+
+
+def test_send_queue_is_bounded():
+    app = Flask(__name__)
+    chunks = SEND_WINDOW * 4
+    produced, messages, ahead = [], [], []
+
+    @app.route('/stream')
+    def stream():
+        def body():
+            for _ in range(chunks):
+                # Сколько частей поток пула сформировал сверх отправленных
+                ahead.append(len(produced) - (len(messages) - 1))
+                produced.append(1)
+                yield b'x'
+        return app.response_class(body())
+
+    response = asyncio.run(request(AsgiApp(app, threads=1), 'get', '/stream',
+                                   send_delay=0.005, messages=messages))
+    assert response.data == b'x' * chunks
+    assert max(ahead) <= SEND_WINDOW + 1
+
+
+def test_wsgi_wait_still_works(tmp_path):
+    app = create_app(str(tmp_path / 'data.db'))
+    client = app.test_client()
+    client.post('/couriers', json={"data": [COURIER]})
+
+    def add_order():
+        sleep(0.2)
+        app.test_client().post('/orders', json={"data": [ORDER]})
+
+    Thread(target=add_order).start()
+    assert client.get('/couriers/1/orders/wait?timeout=5').get_json() == \
+        {"orders_available": True}
@@ -0,0 +1,26 @@
+"""
+Проверка ответов назначения заказов (POST /orders/assign).
+"""
+import pytest
+
+from manager.api.app import create_app
+
+
+@pytest.mark.parametrize('shards', [0, 3])
+def test_repeat_assign_returns_same_order(tmp_path, shards):
+    config = {'ORDER_SHARDS': [str(tmp_path / ('orders-%d.db' % number))
+                               for number in range(shards)]}
+    client = create_app(str(tmp_path / 'data.db'), config=config).test_client()
+    client.post('/couriers', json={"data": [
+        {"courier_id": 1, "courier_type": "car", "regions": [1, 2, 3],
+         "working_hours": ["09:00-18:00"]}]})
+    # Порядок по весу отличается от порядка по ID
+    client.post('/orders', json={"data": [
+        {"order_id": order_id, "weight": weight, "region": order_id % 3 + 1,
+         "delivery_hours": ["10:00-11:00"]}
+        for order_id, weight in ((1, 5), (2, 7), (3, 50), (4, 1))]})
+
+    first = client.post('/orders/assign', json={"courier_id": 1}).get_json()
+    repeat = client.post('/orders/assign', json={"courier_id": 1}).get_json()
+    assert [order["id"] for order in first["orders"]] == [1, 2, 4]
+    assert first == repeat
@@ -0,0 +1,103 @@
+"""
+Прогон одного и того же сценария запросов на разных базах данных
+и сравнение ответов с ответами SQLite в файле. Базы данных - SQLite
+в памяти и SQLite в файле (с пулом соединений и без, с заказами
+в шардах); URL серверных баз (пустых) можно добавить через запятую
+в переменной окружения MANAGER_TEST_DATABASE_URLS.
+"""
+import os
+import random
+
+import pytest
+
+from manager.api.app import create_app
+
+
+# Название -> функция, возвращающая URL базы данных и настройки
+# приложения по временному каталогу
+BACKENDS = {
+    "sqlite memory": lambda directory: ('sqlite://', {}),
+    "sqlite file pooled": lambda directory: (
+        'sqlite:///%s' % (directory / 'pooled.db'),
+        {'DATABASE_POOL_SIZE': 5, 'DATABASE_MAX_OVERFLOW': 5}),
+    "sqlite file 3 shards": lambda directory: (
+        'sqlite:///%s' % (directory / 'main.db'),
+        {'ORDER_SHARDS': [str(directory / ('orders-%d.db' % number))
+                          for number in range(3)]}),
+}
+for url in filter(None, os.environ.get('MANAGER_TEST_DATABASE_URLS', '').split(',')):
+    BACKENDS[url] = lambda directory, url=url: (url, {'DATABASE_POOL_PRE_PING': True})
+
+
+def normalize(result):
+    """Убирает из ответа время назначения, зависящее от момента запуска."""
+    if isinstance(result, dict):
+        return {k: normalize(v) for k, v in result.items() if k != "assign_time"}
+    if isinstance(result, list):
+        return [normalize(v) for v in result]
+    return result
+
+
+def scenario(client, seed=0):
+    """Выполняет все обработчики в случайном порядке и возвращает ответы."""
+    rng = random.Random(seed)
+    responses = []
+
+    def call(method, url, data=None):
+        response = getattr(client, method)(url, json=data)
+        responses.append((method, url, response.status_code,
+                          normalize(response.get_json())))
+        return response.get_json()
+
+    call('post', '/couriers', {"data": [
+        {"courier_id": i, "courier_type": rng.choice(("foot", "bike", "car")),
+         "regions": rng.sample(range(1, 6), 2),
+         "working_hours": ["%02d:00-%02d:30" % (h, h + 3)
+                           for h in rng.sample(range(0, 20), 2)]}
+        for i in range(1, 21)]})
+    order_id = 1
+    for _ in range(4):
+        orders = []
+        for _ in range(50):
+            h = rng.randrange(0, 22)
+            orders.append({"order_id": order_id,
+                           "weight": round(rng.uniform(0.01, 20), 2),
+                           "region": rng.randint(1, 5),
+                           "delivery_hours": ["%02d:00-%02d:00" % (h, h + 2)]})
+            order_id += 1
+        call('post', '/orders', {"data": orders})
+        call('post', '/orders', {"data": orders[:2]})
+        for courier_id in rng.sample(range(1, 21), 8):
+            result = call('post', '/orders/assign', {"courier_id": courier_id})
+            if result and result.get("orders"):
+                call('post', '/orders/complete', {
+                    "courier_id": courier_id, "order_id": result["orders"][0]["id"],
+                    "complete_time": "2031-01-10T10:33:01.420"})
+        call('post', '/orders/assign/batch', {"all_idle": True})
+        for courier_id in rng.sample(range(1, 21), 4):
+            call('patch', '/couriers/%d' % courier_id, {
+                "courier_type": rng.choice(("foot", "bike")),
+                "regions": rng.sample(range(1, 6), 2)})
+        for courier_id in rng.sample(range(1, 21), 6):
+            call('get', '/couriers/%d' % courier_id)
+    return responses
+
+
+@pytest.fixture(scope='module')
+def reference(tmp_path_factory):
+    """Ответы SQLite в файле."""
+    path = tmp_path_factory.mktemp('reference') / 'data.db'
+    return scenario(create_app(str(path)).test_client())
+
+
+@pytest.fixture(params=list(BACKENDS))
+def backend(request, tmp_path):
+    """Приложение на базе данных из BACKENDS."""
+    url, config = BACKENDS[request.param](tmp_path)
+    return create_app(config=config, database_url=url)
+
+
+def test_same_responses(backend, reference):
+    responses = scenario(backend.test_client())
+    assert len(responses) == len(reference)
+    assert responses == reference
@@ -0,0 +1,73 @@
+"""
+Проверка кэша ответов GET /couriers/<id>: ответ, прочитанный до изменения
+курьера, не попадает в кэш после удаления записи.
+"""
+from threading import Thread
+
+import pytest
+
+from manager.api.app import create_app
+from manager.api.cache import MemoryCache, SqliteCache
+from manager.api.handlers import courier_info
+from manager.api.schema import info_response_schema
+
+
+COURIER = {"courier_id": 1, "courier_type": "foot", "regions": [1],
+           "working_hours": ["09:00-18:00"]}
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def cache(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryCache(ttl=60, maxsize=100)
+    return SqliteCache(ttl=60, maxsize=100, path=str(tmp_path / 'cache.db'))
+
+
+def test_set_after_invalidate_is_dropped(cache):
+    generation = cache.generation(1)
+    cache.invalidate(1)
+    cache.set(1, b'old', generation)
+    assert cache.get(1) is None
+
+    cache.set(1, b'new', cache.generation(1))
+    assert cache.get(1) == b'new'
+
+
+def test_counters_are_consistent_across_threads(cache):
+    cache.set(1, b'value', cache.generation(1))
+
+    def read():
+        for _ in range(200):
+            cache.get(1)
+            cache.get(2)
+
+    threads = [Thread(target=read) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.stats()["hits"] == cache.stats()["misses"] == 800
+
+
+@pytest.mark.parametrize('backend', ['memory', 'sqlite'])
+def test_response_read_before_patch_is_not_cached(tmp_path, monkeypatch, backend):
+    app = create_app(str(tmp_path / 'data.db'), config={
+        'COURIER_CACHE': backend, 'COURIER_CACHE_PATH': str(tmp_path / 'cache.db')})
+    client = app.test_client()
+    client.post('/couriers', json={"data": [COURIER]})
+
+    # PATCH фиксируется в другом потоке после того, как GET прочитал курьера
+    def read_then_patch(courier, rating):
+        result = info_response_schema(courier, rating)
+        patch = Thread(target=app.test_client().patch, args=('/couriers/1',),
+                       kwargs={"json": {"courier_type": "car"}})
+        patch.start()
+        patch.join()
+        return result
+
+    monkeypatch.setattr(courier_info, 'info_response_schema', read_then_patch)
+    assert client.get('/couriers/1').get_json()["courier_type"] == "foot"
+    monkeypatch.undo()
+
+    assert app.extensions['courier_cache'].get(1) is None
+    assert client.get('/couriers/1').get_json()["courier_type"] == "car"
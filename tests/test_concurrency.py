@@ -0,0 +1,149 @@
+"""
+Стресс-тест параллельного назначения заказов: несколько процессов
+одновременно вызывают POST /orders/assign для разных курьеров с общими
+районами и проверяется, что ни один заказ не выдан дважды. Кроме того,
+проверяются ответы назначения при заблокированной базе данных
+и одновременное выполнение одного заказа.
+"""
+import random
+import sqlite3
+from collections import Counter
+from multiprocessing import Pool
+from threading import Thread
+
+import pytest
+
+from manager.api.app import create_app
+from manager.api.handlers import complete
+from manager.db.schema import db, Order, LeadTimeStats
+from manager.db.sqlite import DEFAULT_PRAGMAS
+
+
+WORKERS = 4
+COURIERS = 80
+ORDERS = 800
+REGIONS = 3
+
+
+def prepare(path, couriers, orders, regions, seed=0):
+    """Создает базу данных с курьерами и свободными заказами."""
+    rng = random.Random(seed)
+    client = create_app(path).test_client()
+    client.post('/couriers', json={"data": [
+        {"courier_id": i, "courier_type": rng.choice(("foot", "bike", "car")),
+         "regions": rng.sample(range(1, regions + 1), min(2, regions)),
+         "working_hours": ["08:00-20:00"]}
+        for i in range(1, couriers + 1)]})
+    client.post('/orders', json={"data": [
+        {"order_id": i, "weight": round(rng.uniform(0.01, 10), 2),
+         "region": rng.randint(1, regions), "delivery_hours": ["09:00-18:00"]}
+        for i in range(1, orders + 1)]})
+
+
+def worker(args):
+    """Вызывает назначение заказов для данных курьеров,
+    возвращает пары (ID курьера, ID заказов) и коды ошибок."""
+    path, courier_ids = args
+    client = create_app(path).test_client()
+    assigned, errors = [], []
+    for courier_id in courier_ids:
+        response = client.post('/orders/assign', json={"courier_id": courier_id})
+        if response.status_code != 200:
+            errors.append(response.status_code)
+            continue
+        assigned.append((courier_id, [o["id"] for o in response.get_json()["orders"]]))
+    return assigned, errors
+
+
+def test_parallel_assign_gives_each_order_once(tmp_path):
+    path = str(tmp_path / 'data.db')
+    prepare(path, COURIERS, ORDERS, REGIONS)
+    courier_ids = list(range(1, COURIERS + 1))
+    random.Random(0).shuffle(courier_ids)
+    tasks = [(path, courier_ids[i::WORKERS]) for i in range(WORKERS)]
+    with Pool(WORKERS) as pool:
+        results = pool.map(worker, tasks)
+
+    responses = [item for assigned, _ in results for item in assigned]
+    errors = [status for _, errors in results for status in errors]
+    counts = Counter(order_id for _, orders in responses for order_id in orders)
+    duplicates = sorted(order_id for order_id, n in counts.items() if n > 1)
+
+    # Владелец каждого выданного заказа в базе совпадает с ответом
+    app = create_app(path)
+    with app.app_context():
+        owners = dict(db.session.query(Order.id, Order.courier_id)
+                      .filter(Order.status == "assigned").all())
+    mismatched = [order_id for courier_id, orders in responses
+                  for order_id in orders if owners.get(order_id) != courier_id]
+
+    assert errors == []
+    assert duplicates == []
+    assert mismatched == []
+    assert len(counts) == len(owners) > 0
+
+
+@pytest.fixture
+def locked_client(tmp_path):
+    """Клиент приложения с коротким busy_timeout и курьером со свободным
+    заказом в базе данных, которую можно заблокировать lock()."""
+    path = str(tmp_path / 'data.db')
+    prepare(path, 1, 1, 1)
+    client = create_app(path, config={
+        'SQLITE_PRAGMAS': dict(DEFAULT_PRAGMAS, busy_timeout=50)}).test_client()
+    connection = sqlite3.connect(path, isolation_level=None)
+    client.lock = lambda: connection.execute('BEGIN IMMEDIATE')
+    client.path = path
+    yield client
+    connection.close()
+
+
+@pytest.mark.parametrize('url, data', [
+    ('/orders/assign', {"courier_id": 1}),
+    ('/orders/assign/batch', {"all_idle": True}),
+])
+def test_locked_database_returns_503(locked_client, url, data):
+    locked_client.lock()
+    assert locked_client.post(url, json=data).status_code == 503
+
+
+@pytest.mark.parametrize('url, data', [
+    ('/orders/assign', {"courier_id": 1}),
+    ('/orders/assign/batch', {"all_idle": True}),
+])
+def test_other_database_errors_are_not_retried(locked_client, url, data):
+    # Ошибка схемы не исправляется повтором и не маскируется ответом 503
+    with sqlite3.connect(locked_client.path) as connection:
+        connection.execute('DROP TABLE deliveryhours')
+    assert locked_client.post(url, json=data).status_code == 500
+
+
+def test_parallel_complete_counts_order_once(tmp_path, monkeypatch):
+    path = str(tmp_path / 'data.db')
+    prepare(path, 1, 1, 1)
+    app = create_app(path)
+    client = app.test_client()
+    client.post('/orders/assign', json={"courier_id": 1})
+    data = {"courier_id": 1, "order_id": 1, "complete_time": "2031-01-10T10:33:01.420"}
+    responses = []
+    find_order = complete.find_order
+
+    def complete_concurrently(*args):
+        # Второй запрос выполняет заказ, когда первый уже прошел валидацию
+        if not responses:
+            responses.append(None)
+            thread = Thread(target=lambda: responses.append(
+                create_app(path).test_client().post('/orders/complete', json=data)))
+            thread.start()
+            thread.join()
+        return find_order(*args)
+
+    monkeypatch.setattr(complete, 'find_order', complete_concurrently)
+    first = client.post('/orders/complete', json=data)
+    repeat = client.post('/orders/complete', json=data)
+
+    assert responses[1].status_code == 200
+    assert (first.status_code, first.get_data()) == (repeat.status_code, repeat.get_data())
+    assert first.status_code == 400
+    with app.app_context():
+        assert [(s.completed_count, s.courier_id) for s in LeadTimeStats.query.all()] == [(1, 1)]
@@ -0,0 +1,57 @@
+"""
+Проверка заголовка Idempotency-Key (manager.api.idempotency).
+"""
+from sqlalchemy import exc
+
+from manager.api.app import create_app
+from manager.api.handlers.assign import Assign
+from manager.api.idempotency import IdempotencyStore
+
+
+COURIER = {"courier_id": 1, "courier_type": "foot", "regions": [1],
+           "working_hours": ["09:00-18:00"]}
+ORDERS = {"data": [{"order_id": 1, "weight": 1, "region": 1,
+                    "delivery_hours": ["10:00-11:00"]}]}
+KEY = {'Idempotency-Key': 'key-1'}
+
+
+def client(tmp_path):
+    client = create_app(str(tmp_path / 'data.db')).test_client()
+    client.post('/couriers', json={"data": [COURIER]})
+    return client
+
+
+def test_repeat_gets_stored_response(tmp_path):
+    client_ = client(tmp_path)
+    first = client_.post('/orders', json=ORDERS, headers=KEY)
+    repeat = client_.post('/orders', json=ORDERS, headers=KEY)
+    assert first.status_code == repeat.status_code == 201
+    assert first.get_data() == repeat.get_data()
+    assert client_.post('/orders', json={"data": []}, headers=KEY).status_code == 422
+
+
+def test_key_stays_reserved_if_response_is_not_saved(tmp_path, monkeypatch):
+    # Транзакция обработчика зафиксирована, а ответ сохранить не удалось
+    # (например, база заблокирована): повтор не создает заказы еще раз
+    def fail(self, key, response):
+        raise exc.OperationalError('UPDATE', {}, Exception('database is locked'))
+
+    client_ = client(tmp_path)
+    monkeypatch.setattr(IdempotencyStore, 'set', fail)
+    assert client_.post('/orders', json=ORDERS, headers=KEY).status_code == 201
+    monkeypatch.undo()
+    assert client_.post('/orders', json=ORDERS, headers=KEY).status_code == 409
+
+
+def test_failed_request_releases_key(tmp_path, monkeypatch):
+    def fail(courier_id):
+        raise RuntimeError("Assignment failed")
+
+    client_ = client(tmp_path)
+    client_.post('/orders', json=ORDERS)
+    monkeypatch.setattr(Assign, 'transaction', staticmethod(fail))
+    assert client_.post('/orders/assign', json={"courier_id": 1}, headers=KEY).status_code == 500
+    monkeypatch.undo()
+    response = client_.post('/orders/assign', json={"courier_id": 1}, headers=KEY)
+    assert response.status_code == 200
+    assert [order["id"] for order in response.get_json()["orders"]] == [1]
@@ -0,0 +1,31 @@
+"""
+Проверка загрузки заказов потоком NDJSON: сводка каждой части учитывает
+все прочитанные в ней строки.
+"""
+import json
+
+from manager.api.app import create_app
+
+
+def order(order_id, weight=1):
+    return json.dumps({"order_id": order_id, "weight": weight, "region": 1,
+                       "delivery_hours": ["10:00-12:00"]})
+
+
+def test_chunk_summaries_cover_every_line(tmp_path):
+    app = create_app(str(tmp_path / 'data.db'), config={'ORDERS_STREAM_CHUNK_SIZE': 2})
+    lines = [order(1), 'not json', order(2),   # часть 0
+             order(3, weight=100), '[]',       # часть 1
+             order(4), '{"id": 5}', '']        # часть 1, затем часть 2
+    response = app.test_client().post('/orders/stream', data='\n'.join(lines))
+    result = response.get_json()
+
+    assert response.status_code == 400
+    assert result["chunks"] == [
+        {"chunk": 0, "received": 3, "inserted": 2, "rejected": 0, "invalid": 1},
+        {"chunk": 1, "received": 3, "inserted": 1, "rejected": 1, "invalid": 1},
+        {"chunk": 2, "received": 1, "inserted": 0, "rejected": 0, "invalid": 1},
+    ]
+    received = sum(chunk["received"] for chunk in result["chunks"])
+    assert received == len([line for line in lines if line])
+    assert len(result["validation_error"]["orders"]) == 4
@@ -0,0 +1,30 @@
+"""
+Проверка ожидания заказов: событие server-sent events содержит то же
+тело, что и ответ на долгий опрос.
+"""
+import pytest
+
+from manager.api.app import create_app
+
+
+@pytest.mark.parametrize('config', [
+    {'JSON_PROVIDER': 'json'},
+    {'JSON_PROVIDER': 'auto'},
+    {'JSON_PROVIDER': 'json', 'JSONIFY_PRETTYPRINT_REGULAR': True},
+])
+def test_event_data_matches_long_poll_body(tmp_path, config):
+    app = create_app(str(tmp_path / 'data.db'), config=config)
+    client = app.test_client()
+    client.post('/couriers', json={"data": [
+        {"courier_id": 1, "courier_type": "foot", "regions": [1],
+         "working_hours": ["09:00-18:00"]}]})
+    client.post('/orders', json={"data": [
+        {"order_id": 1, "weight": 1, "region": 1, "delivery_hours": ["10:00-11:00"]}]})
+
+    body = client.get('/couriers/1/orders/wait?timeout=0').get_data()
+    stream = client.get('/couriers/1/orders/wait?timeout=0',
+                        headers={'Accept': 'text/event-stream'}).get_data(as_text=True)
+    event = stream.split('\n\n')[0].split('\n')
+    assert event[0] == 'event: orders'
+    data = '\n'.join(line[len('data: '):] for line in event[1:])
+    assert (data + '\n').encode() == body
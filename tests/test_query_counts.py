@@ -0,0 +1,29 @@
+"""
+Проверка количества SQL-запросов на каждый обработчик: количество
+запросов не должно незаметно вырасти.
+"""
+from benchmarks.queries import count_statements
+
+
+# Запрос -> максимальное количество SQL-запросов
+BUDGETS = {
+    "POST /couriers": 4,
+    "POST /orders": 3,
+    "POST /orders/assign": 5,
+    "POST /orders/assign (assigned)": 2,
+    "POST /orders/assign/batch": 8,
+    "POST /orders/complete": 7,
+    "PATCH /couriers/1": 15,
+    "GET /couriers/1": 1,
+    "GET /orders": 4,
+    "GET /couriers": 1,
+}
+
+
+def test_statement_budgets(tmp_path):
+    results = count_statements(str(tmp_path / 'data.db'))
+    assert [name for name, _, _ in results] == list(BUDGETS)
+    for name, status, statements in results:
+        assert status < 400, name
+        assert statements <= BUDGETS[name], \
+            "%s: %d statements, budget %d" % (name, statements, BUDGETS[name])
@@ -0,0 +1,43 @@
+"""
+Проверка провайдеров JSON (manager.api.serialization).
+"""
+import pytest
+
+from manager.api.app import create_app
+from manager.api.serialization import OrjsonProvider, orjson
+
+
+needs_orjson = pytest.mark.skipif(orjson is None, reason="orjson is not installed")
+PROVIDERS = ['json', pytest.param('orjson', marks=needs_orjson)]
+
+
+@pytest.mark.parametrize('provider', PROVIDERS)
+def test_request_bodies_are_parsed_by_provider(tmp_path, provider, monkeypatch):
+    app = create_app(str(tmp_path / 'data.db'), config={'JSON_PROVIDER': provider})
+    json_provider = app.extensions['json_provider']
+    assert json_provider.name == provider
+    calls = []
+    loads = json_provider.loads
+
+    def spy(data):
+        calls.append(data)
+        return loads(data)
+
+    monkeypatch.setattr(json_provider, 'loads', spy)
+    client = app.test_client()
+    client.post('/couriers', json={"data": [
+        {"courier_id": 1, "courier_type": "foot", "regions": [1],
+         "working_hours": ["09:00-18:00"]}]})
+    calls.clear()
+    response = client.post('/orders/assign', json={"courier_id": 1})
+    assert response.status_code == 200
+    assert calls == [b'{"courier_id": 1}']
+
+
+@needs_orjson
+@pytest.mark.parametrize('value', [2 ** 63 - 1, -2 ** 63, -2 ** 63 - 1,
+                                   -10 ** 19 + 1, 2 ** 64])
+def test_integers_outside_64_bits_stay_integers(value):
+    data = b'{"a": %d}' % value
+    assert OrjsonProvider().loads(data) == {"a": value}
+    assert type(OrjsonProvider().loads(data)["a"]) is int
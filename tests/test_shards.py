@@ -0,0 +1,59 @@
+"""
+Проверка разбиения заказов по шардам (manager.db.shards).
+"""
+import pytest
+from sqlalchemy import exc
+
+from manager.api.app import create_app
+from manager.db.schema import db, Order, OrderId
+from manager.db.shards import create_orders, current_shards, find_order
+
+
+def order(order_id, region, weight=1):
+    return {"order_id": order_id, "weight": weight, "region": region,
+            "delivery_hours": ["10:00-11:00"]}
+
+
+def sharded_app(directory):
+    return create_app(str(directory / 'main.db'), {
+        'ORDER_SHARDS': [str(directory / ('orders-%d.db' % number))
+                         for number in range(3)]})
+
+
+def test_order_ids_are_unique_across_shards(tmp_path):
+    app = sharded_app(tmp_path)
+    with app.app_context():
+        # Проверка при валидации пропущена, как при одновременных запросах:
+        # районы 1 и 2 в разных шардах
+        create_orders([order(1, 1)])
+        db.session.commit()
+        with pytest.raises(exc.IntegrityError):
+            create_orders([order(1, 2)])
+        db.session.rollback()
+        assert [o.region for _ in current_shards().each()
+                for o in Order.query.all()] == [1]
+
+
+def test_existing_ids_are_reserved_on_first_start(tmp_path):
+    app = sharded_app(tmp_path)
+    client = app.test_client()
+    assert client.post('/orders', json={"data": [order(1, 1), order(2, 2)]}).status_code == 201
+    with app.app_context():
+        OrderId.query.delete()
+        db.session.commit()
+
+    client = sharded_app(tmp_path).test_client()
+    response = client.post('/orders', json={"data": [order(2, 3)]})
+    assert response.status_code == 400
+    assert [error["id"] for error in response.get_json()["validation_error"]["orders"]] == [2]
+
+
+def test_expired_attributes_load_from_instance_shard(tmp_path):
+    app = sharded_app(tmp_path)
+    app.test_client().post('/orders', json={"data": [order(1, 1, 2), order(2, 2, 3)]})
+    with app.app_context():
+        orders = [find_order(Order, 1), find_order(Order, 2)]
+        # Фиксация транзакции сбрасывает атрибуты, текущий шард не выбран
+        db.session.commit()
+        assert [(o.weight, o.region) for o in orders] == [(2, 1), (3, 2)]
+        assert [len(o.delivery_hours) for o in orders] == [1, 1]
@@ -0,0 +1,50 @@
+"""
+Дифференциальная проверка скомпилированных валидаторов
+(manager.api.validation): на тех же случайных запросах, что и в
+benchmarks.validation, ошибки совпадают с ошибками схем marshmallow.
+"""
+import pytest
+
+from benchmarks.validation import create_existing, differential
+from manager.api.app import create_app
+from tests.test_serialization import PROVIDERS
+
+
+@pytest.fixture(scope='module')
+def app(tmp_path_factory):
+    app = create_app(str(tmp_path_factory.mktemp('validation') / 'data.db'))
+    with app.app_context():
+        create_existing()
+    return app
+
+
+def test_compiled_validators_match_schemas(app):
+    # Тот же корпус, что у benchmarks.validation по умолчанию
+    with app.app_context():
+        mismatches, summary = differential(cases=3000, seed=0)
+    assert mismatches == []
+    # Корпус содержит и корректные, и некорректные запросы
+    for kinds in summary.values():
+        assert kinds.get("ok") and kinds.get("error")
+
+
+
+@pytest.mark.parametrize('provider', PROVIDERS)
+def test_ids_out_of_integer_range(tmp_path, provider):
+    # ID вне диапазона INTEGER SQLite не попадают в запрос к базе,
+    # ошибку возвращают валидаторы; провайдеры разбирают ID одинаково
+    client = create_app(str(tmp_path / 'data.db'),
+                        config={'JSON_PROVIDER': provider}).test_client()
+    value = -2 ** 63 - 1
+    response = client.post('/couriers', json={"data": [
+        {"courier_id": value, "courier_type": "foot", "regions": [1],
+         "working_hours": ["09:00-18:00"]}]})
+    assert response.status_code == 400
+    assert response.get_json()["validation_error"]["couriers"] == [
+        {"id": value, "courier_id": ["Must be greater than or equal to 1."]}]
+
+    response = client.post('/orders/stream', data='{"order_id": %d, "weight": 1, '
+                           '"region": 1, "delivery_hours": ["10:00-12:00"]}' % value)
+    assert response.status_code == 400
+    assert response.get_json()["validation_error"]["orders"] == [
+        {"id": value, "order_id": ["Must be greater than or equal to 1."]}]